@@ -1,38 +1,51 @@
 import os
 import sys
+import uuid
 import logging
-from flask import Flask, render_template, jsonify, request, redirect, url_for, session, make_response
+from flask import Flask, render_template, jsonify, request, redirect, url_for, session, make_response, send_file, \
+    stream_with_context, g, has_request_context
 import json
-import cv2
-import numpy as np
 from datetime import datetime, timedelta
 from werkzeug.utils import secure_filename
-from werkzeug.security import generate_password_hash, check_password_hash
-from PIL import Image
-import pickle
-from ultralytics import YOLO
-import torch
+from werkzeug.security import safe_join
 import re
-from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
-from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
-from sqlalchemy import or_, and_, desc, func
+from flask_login import LoginManager, login_user, logout_user, login_required, current_user, user_logged_in, \
+    user_logged_out
+from sqlalchemy import or_, and_, desc, func, select, literal, insert, update
 from flask_dance.contrib.google import make_google_blueprint, google
 from flask_dance.consumer import oauth_authorized
-from sqlalchemy.orm import relationship
 import secrets
 import string
-import requests
 from dotenv import load_dotenv
 from functools import wraps
 import time
-
-# Настройка логирования
-logging.basicConfig(level=logging.INFO)
+import mimetypes
+from image_pipeline import generate_derivatives, remove_derivatives, recipe_image_url
+from static_assets import file_fingerprint, find_precompressed
+from compression import compress_response
+from model_registry import ModelRegistry
+import metrics
+from user_cache import UserCache, UserSnapshot
+from telegram_dispatcher import TelegramDispatcher, TELEGRAM_API_URL
+from profiling import start_request_profile, ProfiledStream
+from logging_config import setup_logging, request_id_var
+from models import db, User, Recipe, Like, Ingredient, Instruction, Favorite, UserIngredient, TelegramChat, \
+    TelegramAuthCode, RecipeImage, insert_ignore
+
+# Тяжелые ML-библиотеки (torch, ultralytics, cv2, numpy, PIL) импортируются лениво
+# внутри функций инференса, чтобы веб-приложение и скрипты миграций стартовали быстро
+from class_metadata import DEMO_CLASS_NAMES, PRODUCT_SYNONYMS, translate_classes_to_russian, \
+    load_class_metadata, class_labels, synonym_index
 
 # Загружаем переменные окружения
 load_dotenv()
 
+# Настройка логирования: JSON-строки через очередь, запись в stdout в отдельном потоке
+# (LOG_LEVEL, LOG_FORMAT=json|text, LOG_LEVELS=werkzeug=WARNING,... - в том числе из .env)
+setup_logging()
+logger = logging.getLogger(__name__)
+
 app = Flask(__name__)
 
 # Секретный ключ из переменных окружения
@@ -66,7 +79,7 @@ app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
     'pool_pre_ping': True
 }
 
-db = SQLAlchemy(app)
+db.init_app(app)
 migrate = Migrate(app, db)
 
 # Инициализация Flask-Login
@@ -83,29 +96,89 @@ app.config['GOOGLE_OAUTH_CLIENT_SECRET'] = os.environ.get('GOOGLE_OAUTH_CLIENT_S
 # Конфигурация Telegram Bot
 TELEGRAM_BOT_TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN')
 TELEGRAM_BOT_USERNAME = os.environ.get('TELEGRAM_BOT_USERNAME', 'CooklyBot')
+# Адрес Bot API (для локальной заглушки: python telegram_dispatcher.py 8081)
+app.config['TELEGRAM_API_URL'] = os.environ.get('TELEGRAM_API_URL', TELEGRAM_API_URL)
+# Минимальный интервал между сообщениями в один чат (с) и число повторов при ошибках
+app.config['TELEGRAM_CHAT_INTERVAL'] = float(os.environ.get('TELEGRAM_CHAT_INTERVAL', 1.0))
+app.config['TELEGRAM_MAX_RETRIES'] = int(os.environ.get('TELEGRAM_MAX_RETRIES', 4))
+# Коды входа: срок жизни (с), число неверных попыток на чат за окно блокировки,
+# длительность этого окна (с), минимальный интервал между запросами кода в чат (с)
+# и период очистки истекших кодов (с)
+app.config['TELEGRAM_CODE_TTL'] = int(os.environ.get('TELEGRAM_CODE_TTL', 300))
+app.config['TELEGRAM_CODE_MAX_ATTEMPTS'] = int(os.environ.get('TELEGRAM_CODE_MAX_ATTEMPTS', 5))
+app.config['TELEGRAM_CODE_LOCKOUT'] = int(os.environ.get('TELEGRAM_CODE_LOCKOUT', 3600))
+app.config['TELEGRAM_CODE_RESEND_INTERVAL'] = int(os.environ.get('TELEGRAM_CODE_RESEND_INTERVAL', 60))
+app.config['TELEGRAM_CODE_PURGE_INTERVAL'] = int(os.environ.get('TELEGRAM_CODE_PURGE_INTERVAL', 600))
 
 # Конфигурация загрузки файлов - используем абсолютные пути
 UPLOAD_FOLDER = os.path.join(basedir, 'uploads')
+RECIPE_IMAGES_FOLDER = os.path.join(basedir, 'static', 'uploads', 'recipes')
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 MAX_CONTENT_LENGTH = 16 * 1024 * 1024
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
 
+# Сжатие ответов API (gzip/brotli)
+app.config['COMPRESS_ENABLED'] = os.environ.get('COMPRESS_ENABLED', 'true').lower() == 'true'
+app.config['COMPRESS_MIN_SIZE'] = int(os.environ.get('COMPRESS_MIN_SIZE', 500))
+app.config['COMPRESS_LEVEL'] = int(os.environ.get('COMPRESS_LEVEL', 6))
+app.config['COMPRESS_BR_LEVEL'] = int(os.environ.get('COMPRESS_BR_LEVEL', 4))
+
+# Потоковая отдача больших списков рецептов (можно отключить параметром ?stream=0)
+app.config['STREAM_JSON_LISTINGS'] = os.environ.get('STREAM_JSON_LISTINGS', 'true').lower() == 'true'
+app.config['STREAM_BATCH_SIZE'] = int(os.environ.get('STREAM_BATCH_SIZE', 500))
+# Размер первой страницы рецептов в /api/bootstrap (остальное фронтенд догружает через /api/all-recipes)
+app.config['BOOTSTRAP_PAGE_SIZE'] = int(os.environ.get('BOOTSTRAP_PAGE_SIZE', 24))
+
 # Файлы для хранения данных - используем абсолютные пути
 DATA_FOLDER = os.path.join(basedir, 'data')
 USER_INGREDIENTS_FILE = os.path.join(DATA_FOLDER, 'user_ingredients.json')
+app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR', os.path.join(DATA_FOLDER, 'profiles'))
 
 # Пути к модели детекции - используем абсолютные пути
 MODEL_FOLDER = os.path.join(basedir, 'model')
-MODEL_PATH = os.path.join(MODEL_FOLDER, 'vegetable_detector.pt')
-CLASS_NAMES_PATH = os.path.join(MODEL_FOLDER, 'class_names.pkl')
-
-# Создаем необходимые папки
-os.makedirs(DATA_FOLDER, exist_ok=True)
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-os.makedirs(MODEL_FOLDER, exist_ok=True)
-os.makedirs('templates', exist_ok=True)
+# Версии модели детекции: файлы в корне model/ (версия 'default') или model/<версия>/,
+# активная версия и доля трафика кандидата хранятся в model/active.json
+
+# Классификатор для уточнения неуверенных детекций (второй этап)
+CLASSIFIER_PATH = os.path.join(MODEL_FOLDER, 'classifier.pth')
+CLASSIFIER_CLASSES_PATH = os.path.join(MODEL_FOLDER, 'classifier_classes.json')
+app.config['REFINE_ENABLED'] = os.environ.get('REFINE_ENABLED', 'true').lower() == 'true'
+# Боксы с уверенностью детектора ниже порога отправляются в классификатор
+app.config['REFINE_BELOW_CONFIDENCE'] = float(os.environ.get('REFINE_BELOW_CONFIDENCE', 0.5))
+# Метку меняем, только если классификатор уверен не меньше этого значения
+app.config['REFINE_MIN_CLASSIFIER_CONFIDENCE'] = float(os.environ.get('REFINE_MIN_CLASSIFIER_CONFIDENCE', 0.6))
+
+# Метрики в формате Prometheus на /metrics. С METRICS_TOKEN доступ только с заголовком
+# Authorization: Bearer <токен>; без токена - только напрямую с localhost (не через прокси)
+app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+# Папка для сбора метрик со всех воркеров (gunicorn.conf.py задает ее сам); без нее
+# /metrics показывает только процесс, ответивший на запрос
+app.config['METRICS_MULTIPROC_DIR'] = os.environ.get('METRICS_MULTIPROC_DIR')
+app.config['METRICS_SYNC_INTERVAL'] = float(os.environ.get('METRICS_SYNC_INTERVAL', 1.0))
+if app.config['METRICS_MULTIPROC_DIR']:
+    metrics.enable_multiprocess(app.config['METRICS_MULTIPROC_DIR'], app.config['METRICS_SYNC_INTERVAL'])
+
+# Профилирование медленных запросов (cProfile): доля случайных запросов и/или порог в мс,
+# дампы пишутся в PROFILE_DIR, сводка - python profiling.py [эндпоинт]
+app.config['PROFILE_ENABLED'] = os.environ.get('PROFILE_ENABLED', 'false').lower() == 'true'
+app.config['PROFILE_SAMPLE_RATE'] = float(os.environ.get('PROFILE_SAMPLE_RATE', 0.01))
+app.config['PROFILE_SLOW_MS'] = float(os.environ['PROFILE_SLOW_MS']) if os.environ.get('PROFILE_SLOW_MS') else None
+app.config['PROFILE_ENDPOINTS'] = {name.strip() for name in os.environ.get('PROFILE_ENDPOINTS', '').split(',')
+                                   if name.strip()}
+
+# Кеш пользователей для current_user (секунды; 0 - отключить). Удаление или отключение
+# пользователя (is_active=False) другие воркеры увидят на GET-запросах не позже чем через
+# TTL; запросы, которые что-то меняют, всегда перечитывают пользователя из базы
+app.config['USER_CACHE_TTL'] = float(os.environ.get('USER_CACHE_TTL', 30))
+app.config['USER_CACHE_MAX_SIZE'] = int(os.environ.get('USER_CACHE_MAX_SIZE', 10000))
+# Кеш статистики профиля (секунды; 0 - отключить)
+app.config['PROFILE_STATS_CACHE_TTL'] = float(os.environ.get('PROFILE_STATS_CACHE_TTL', 60))
+
+# Предзагрузка моделей в create_app (для gunicorn с preload_app - общие веса у воркеров)
+app.config['PRELOAD_MODELS'] = os.environ.get('PRELOAD_MODELS', 'false').lower() == 'true'
 
 
 # ========== ДЕКОРАТОР ДЛЯ JSON ОТВЕТОВ ==========
@@ -115,11 +188,16 @@ def json_response(f):
         try:
             if request.path.startswith('/api/') and not request.accept_mimetypes.accept_json:
                 return jsonify({'error': 'Endpoint requires JSON response'}), 406
-            return f(*args, **kwargs)
+
+            profile = start_view_profile(f.__name__)
+            try:
+                return f(*args, **kwargs)
+            finally:
+                if profile is not None:
+                    profile.disable()
         except Exception as e:
-            print(f"❌ Ошибка в {f.__name__}: {e}")
-            import traceback
-            traceback.print_exc()
+            metrics.REQUEST_EXCEPTIONS.inc(endpoint=request.endpoint)
+            logger.exception('Ошибка в %s: %s', f.__name__, e)
             return jsonify({
                 'success': False,
                 'error': str(e)
@@ -128,6 +206,63 @@ def json_response(f):
     return decorated_function
 
 
+def start_view_profile(endpoint):
+    """Включает cProfile для запроса, если профилирование включено и запрос попал в выборку"""
+    if not app.config['PROFILE_ENABLED']:
+        return None
+    if app.config['PROFILE_ENDPOINTS'] and endpoint not in app.config['PROFILE_ENDPOINTS']:
+        return None
+
+    profile = start_request_profile(endpoint, app.config['PROFILE_SAMPLE_RATE'], app.config['PROFILE_SLOW_MS'])
+    if profile is not None:
+        g.request_profile = profile
+    return profile
+
+
+def finish_view_profile(response=None):
+    """Сохраняет профиль запроса; у потокового ответа - после отдачи последней части"""
+    profile = g.pop('request_profile', None)
+    if profile is None:
+        return response
+
+    def finish():
+        path = profile.finish(app.config['PROFILE_DIR'], app.config['PROFILE_SLOW_MS'])
+        if path:
+            logger.info('Профиль запроса сохранен: %s', path, extra={'profile_path': path})
+
+    if response is not None and response.is_streamed and not response.direct_passthrough:
+        response.response = ProfiledStream(response.response, profile, finish)
+    else:
+        finish()
+    return response
+
+
+def wants_stream():
+    default = '1' if app.config['STREAM_JSON_LISTINGS'] else '0'
+    return request.args.get('stream', default) not in ('0', 'false')
+
+
+def stream_json_array(query, serialize, batch_size=None):
+    """Отдает результаты запроса как JSON-массив по частям, не собирая весь список в памяти"""
+    batch_size = batch_size or app.config['STREAM_BATCH_SIZE']
+
+    def generate():
+        yield '['
+        first = True
+        chunk = []
+        for item in query.yield_per(batch_size):
+            chunk.append(app.json.dumps(serialize(item), separators=(',', ':')))
+            if len(chunk) >= batch_size:
+                yield ('' if first else ',') + ','.join(chunk)
+                first = False
+                chunk = []
+        if chunk:
+            yield ('' if first else ',') + ','.join(chunk)
+        yield ']'
+
+    return app.response_class(stream_with_context(generate()), mimetype='application/json')
+
+
 # ========== СОЗДАЕМ БАЗОВЫЕ ШАБЛОНЫ ==========
 def create_error_templates():
     """Создает базовые шаблоны для ошибок, если они отсутствуют"""
@@ -332,342 +467,276 @@ def create_error_templates():
 </body>
 </html>''')
 
-    print("✅ Базовые шаблоны ошибок созданы")
-
+    logger.info('Базовые шаблоны ошибок созданы')
 
-# Создаем шаблоны при запуске
-create_error_templates()
 
+# ========== ЗАГРУЗЧИК ПОЛЬЗОВАТЕЛЯ ==========
 
-# ========== МОДЕЛИ БАЗЫ ДАННЫХ ==========
-class User(UserMixin, db.Model):
-    """Модель пользователя"""
-    __tablename__ = 'users'
-
-    id = db.Column(db.Integer, primary_key=True)
-    email = db.Column(db.String(120), unique=True, nullable=True)
-    username = db.Column(db.String(80), unique=True, nullable=False)
-    password_hash = db.Column(db.String(200), nullable=True)
-    avatar = db.Column(db.String(500), nullable=True)
+user_cache = UserCache(app.config['USER_CACHE_TTL'], app.config['USER_CACHE_MAX_SIZE'])
+# Статистика профиля; сбрасывается эндпоинтами, меняющими счетчики
+profile_stats_cache = UserCache(app.config['PROFILE_STATS_CACHE_TTL'], app.config['USER_CACHE_MAX_SIZE'],
+                                name='profile_stats')
 
-    google_id = db.Column(db.String(100), unique=True, nullable=True)
-    telegram_id = db.Column(db.String(100), unique=True, nullable=True)
 
-    is_active = db.Column(db.Boolean, default=True)
-    is_admin = db.Column(db.Boolean, default=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    last_login = db.Column(db.DateTime, nullable=True)
+def _load_user_snapshot(user_id):
+    user = db.session.get(User, user_id)
+    return UserSnapshot(user) if user else None
 
-    # Отношения
-    recipes = db.relationship('Recipe', backref='author', lazy=True, foreign_keys='Recipe.user_id')
-    favorites = db.relationship('Favorite', backref='user', cascade='all, delete-orphan', lazy=True)
-    user_ingredients = db.relationship('UserIngredient', backref='user', cascade='all, delete-orphan', lazy=True)
-    telegram_chats = db.relationship('TelegramChat', backref='user', lazy=True)
 
-    # Изменяем имя backref для likes, чтобы избежать конфликта
-    given_likes = db.relationship('Like', backref='liking_user', cascade='all, delete-orphan', lazy=True,
-                                  foreign_keys='Like.user_id')
+@login_manager.user_loader
+def load_user(user_id):
+    """current_user - снимок из кеша; для изменений загружайте User из базы
 
-    def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+    Отключенный пользователь (is_active=False) считается анонимным. Для запросов,
+    которые что-то меняют, снимок перечитывается из базы: удаленный или отключенный
+    в другом воркере пользователь не сможет ничего изменить, пока не истек TTL кеша.
+    """
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
 
-    def check_password(self, password):
-        if self.password_hash:
-            return check_password_hash(self.password_hash, password)
-        return False
+    if request.method not in ('GET', 'HEAD', 'OPTIONS'):
+        user_cache.invalidate(user_id)
+    snapshot = user_cache.get(user_id, _load_user_snapshot)
+    return snapshot if snapshot is not None and snapshot.is_active else None
 
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'email': self.email,
-            'username': self.username,
-            'avatar': self.avatar,
-            'is_admin': self.is_admin,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'last_login': self.last_login.isoformat() if self.last_login else None,
-            'google_id': self.google_id,
-            'telegram_id': self.telegram_id
-        }
 
+@user_logged_in.connect_via(app)
+def _invalidate_logged_in_user(sender, user, **extra):
+    user_cache.invalidate(user.id)
 
-class Recipe(db.Model):
-    """Модель рецепта"""
-    __tablename__ = 'recipes'
 
-    id = db.Column(db.Integer, primary_key=True)
-    title = db.Column(db.String(200), nullable=False)
-    image = db.Column(db.String(500), nullable=True)
-    time = db.Column(db.String(50), nullable=False)
-    difficulty = db.Column(db.String(20), nullable=False)
-    calories = db.Column(db.String(50), nullable=False)
-    servings = db.Column(db.String(50), nullable=False)
-    is_user_recipe = db.Column(db.Boolean, default=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+@user_logged_out.connect_via(app)
+def _invalidate_logged_out_user(sender, user, **extra):
+    if user is not None and user.is_authenticated:
+        user_cache.invalidate(user.id)
 
-    # Новые поля
-    author_name = db.Column(db.String(80), default='Cookly')
-    likes_count = db.Column(db.Integer, default=0)
 
-    ingredients = db.relationship('Ingredient', backref='recipe', cascade='all, delete-orphan', lazy=True)
-    instructions = db.relationship('Instruction', backref='recipe', cascade='all, delete-orphan', lazy=True)
+# ========== ФУНКЦИИ ДЛЯ ТЕЛЕГРАМ ==========
 
-    # Изменяем имя backref для likes
-    received_likes = db.relationship('Like', backref='liked_recipe', cascade='all, delete-orphan', lazy=True,
-                                     foreign_keys='Like.recipe_id')
+def generate_auth_code(length=6):
+    return ''.join(secrets.choice(string.digits) for _ in range(length))
 
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'title': self.title,
-            'image': self.image or 'https://images.unsplash.com/photo-1546069901-ba9599a7e63c',
-            'time': self.time,
-            'difficulty': self.difficulty,
-            'calories': self.calories,
-            'servings': self.servings,
-            'isUserRecipe': self.is_user_recipe,
-            'author': self.author.username if self.author else self.author_name,
-            'author_id': self.user_id,
-            'author_name': self.author_name,
-            'likes_count': self.likes_count,
-            'ingredients': [ing.to_dict() for ing in self.ingredients],
-            'instructions': [inst.to_dict() for inst in self.instructions]
-        }
 
+# Сообщения уходят из фонового потока: обработчик запроса не ждет Telegram
+telegram_dispatcher = TelegramDispatcher(
+    TELEGRAM_BOT_TOKEN,
+    api_url=app.config['TELEGRAM_API_URL'],
+    chat_interval=app.config['TELEGRAM_CHAT_INTERVAL'],
+    max_retries=app.config['TELEGRAM_MAX_RETRIES']
+)
 
-class Like(db.Model):
-    """Модель лайка рецепта"""
-    __tablename__ = 'likes'
 
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
-    recipe_id = db.Column(db.Integer, db.ForeignKey('recipes.id', ondelete='CASCADE'), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+def send_telegram_auth_code(chat_id, auth_code):
+    """Ставит код в очередь отправки; False - бот не настроен или очередь переполнена"""
+    minutes = max(1, app.config['TELEGRAM_CODE_TTL'] // 60)
+    message = f"🔐 Ваш код для входа в Cookly: *{auth_code}*\n\nКод действителен {minutes} мин."
+    return telegram_dispatcher.send_message(chat_id, message, parse_mode='Markdown')
 
-    __table_args__ = (db.UniqueConstraint('user_id', 'recipe_id', name='unique_user_recipe_like'),)
 
-    # Явно указываем foreign_keys для избежания конфликтов
-    user = db.relationship('User', foreign_keys=[user_id])
-    recipe = db.relationship('Recipe', foreign_keys=[recipe_id])
+def purge_expired_auth_codes():
+    """Удаляет истекшие коды входа; возвращает число удаленных
 
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'user_id': self.user_id,
-            'recipe_id': self.recipe_id,
-            'created_at': self.created_at.isoformat() if self.created_at else None
-        }
-
-
-class Ingredient(db.Model):
-    """Модель ингредиента"""
-    __tablename__ = 'ingredients'
+    Запись хранит и счетчик неверных попыток чата, поэтому удаляется, только когда
+    код истек раньше, чем окно блокировки TELEGRAM_CODE_LOCKOUT назад.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=app.config['TELEGRAM_CODE_LOCKOUT'])
+    deleted = TelegramAuthCode.query.filter(TelegramAuthCode.expires_at < cutoff) \
+        .delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
 
-    id = db.Column(db.Integer, primary_key=True)
-    recipe_id = db.Column(db.Integer, db.ForeignKey('recipes.id', ondelete='CASCADE'), nullable=False)
-    name = db.Column(db.String(100), nullable=False)
-    amount = db.Column(db.String(50), nullable=False)
 
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'name': self.name,
-            'amount': self.amount
-        }
+_last_auth_code_purge = 0.0
 
 
-class Instruction(db.Model):
-    """Модель шага приготовления"""
-    __tablename__ = 'instructions'
+def maybe_purge_auth_codes():
+    """Очистка не чаще раза в TELEGRAM_CODE_PURGE_INTERVAL секунд на процесс"""
+    global _last_auth_code_purge
+    now = time.monotonic()
+    if now - _last_auth_code_purge < app.config['TELEGRAM_CODE_PURGE_INTERVAL']:
+        return
+    _last_auth_code_purge = now
+    deleted = purge_expired_auth_codes()
+    if deleted:
+        logger.info('Удалены истекшие коды Telegram', extra={'deleted': deleted})
 
-    id = db.Column(db.Integer, primary_key=True)
-    recipe_id = db.Column(db.Integer, db.ForeignKey('recipes.id', ondelete='CASCADE'), nullable=False)
-    step_number = db.Column(db.Integer, nullable=False)
-    description = db.Column(db.Text, nullable=False)
 
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'step_number': self.step_number,
-            'description': self.description
-        }
+# ========== ИНИЦИАЛИЗАЦИЯ МОДЕЛИ ДЕТЕКЦИИ ==========
 
+def load_detector(folder):
+    """Загружает YOLO-модель и классы из папки версии; возвращает запись для реестра"""
+    import torch
+    from ultralytics import YOLO
+    from model import cpu_profile_from_env, configure_cpu_threads
 
-class Favorite(db.Model):
-    """Модель избранного рецепта"""
-    __tablename__ = 'favorites'
+    model_path = os.path.join(folder, 'vegetable_detector.pt')
 
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
-    recipe_id = db.Column(db.Integer, db.ForeignKey('recipes.id', ondelete='CASCADE'), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    try:
+        logger.info('Загрузка модели детекции продуктов из %s', model_path)
+        model = YOLO(model_path)
 
-    __table_args__ = (db.UniqueConstraint('user_id', 'recipe_id', name='unique_user_recipe_favorite'),)
+        model_size = os.path.getsize(model_path)
+        if model_size < 1024:
+            logger.warning('Обнаружена демо-модель. Реальное детектирование не будет работать')
 
+        device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        if device == 'cpu':
+            profile = cpu_profile_from_env()
+            configure_cpu_threads(profile['intra_op_threads'], profile['inter_op_threads'])
+        model.to(device)
 
-class UserIngredient(db.Model):
-    """Модель пользовательского ингредиента"""
-    __tablename__ = 'user_ingredients'
+        try:
+            class_metadata = load_class_metadata(folder)
+        except Exception as e:
+            class_metadata = None
+            logger.warning('Неверный формат классов (%s). Используются демо-классы', e)
 
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
-    name = db.Column(db.String(100), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+        if class_metadata and class_metadata.get('classes'):
+            class_names = class_labels(class_metadata)
+        else:
+            class_names = DEMO_CLASS_NAMES
+            logger.warning('Файл классов не найден. Используются демо-классы')
 
-    __table_args__ = (db.UniqueConstraint('user_id', 'name', name='unique_user_ingredient'),)
+        logger.info('Модель детекции загружена', extra={
+            'model_path': model_path, 'model_size_mb': round(model_size / (1024 * 1024), 2),
+            'class_count': len(class_names), 'device': device
+        })
 
+        return {
+            'model': model,
+            'class_names': class_names,
+            'synonyms': synonym_index(class_metadata),
+            'path': model_path,
+            'size': model_size,
+            'is_demo': model_size < 1024
+        }
 
-class TelegramChat(db.Model):
-    """Модель чата Telegram для авторизации"""
-    __tablename__ = 'telegram_chats'
+    except Exception as e:
+        logger.exception('Ошибка загрузки модели: %s', e)
+        return None
 
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=True)
-    chat_id = db.Column(db.String(100), nullable=False)
-    telegram_username = db.Column(db.String(100), nullable=True)
-    auth_code = db.Column(db.String(50), nullable=True)
-    auth_code_expires = db.Column(db.DateTime, nullable=True)
-    is_active = db.Column(db.Boolean, default=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
-    __table_args__ = (db.UniqueConstraint('user_id', 'chat_id', name='unique_user_chat'),)
+model_registry = ModelRegistry(MODEL_FOLDER, load_detector)
 
 
-class RecipeImage(db.Model):
-    """Модель для хранения изображений рецептов"""
-    __tablename__ = 'recipe_images'
+def get_model_entry():
+    """Версия модели для текущего запроса (с учетом A/B-распределения)"""
+    return model_registry.select()
 
-    id = db.Column(db.Integer, primary_key=True)
-    recipe_id = db.Column(db.Integer, db.ForeignKey('recipes.id', ondelete='CASCADE'), nullable=False)
-    filename = db.Column(db.String(255), nullable=False)
-    filepath = db.Column(db.String(500), nullable=False)
-    is_primary = db.Column(db.Boolean, default=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
-    recipe = db.relationship('Recipe', backref='images')
+def get_model():
+    entry = model_registry.active()
+    if entry is None:
+        return None, []
+    return entry['model'], entry['class_names']
 
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'recipe_id': self.recipe_id,
-            'filename': self.filename,
-            'url': f'/static/uploads/recipes/{self.filename}',
-            'is_primary': self.is_primary
-        }
 
+_classifier = None
+_classifier_classes = None
+# mtime файлов классификатора, загрузка которых не удалась: пока файлы те же, не повторяем
+_classifier_failed_mtimes = None
 
-# ========== ЗАГРУЗЧИК ПОЛЬЗОВАТЕЛЯ ==========
 
-@login_manager.user_loader
-def load_user(user_id):
+def _classifier_mtimes():
     try:
-        return db.session.get(User, int(user_id))
-    except:
+        return os.stat(CLASSIFIER_PATH).st_mtime_ns, os.stat(CLASSIFIER_CLASSES_PATH).st_mtime_ns
+    except OSError:
         return None
 
 
-# ========== ФУНКЦИИ ДЛЯ ТЕЛЕГРАМ ==========
-
-def generate_auth_code(length=6):
-    return ''.join(secrets.choice(string.digits) for _ in range(length))
-
-
-def send_telegram_auth_code(chat_id, auth_code):
-    if not TELEGRAM_BOT_TOKEN:
-        return False
+def get_classifier():
+    """Загружает VegetableClassifier для уточнения детекций (если файлы модели есть)"""
+    global _classifier, _classifier_classes, _classifier_failed_mtimes
 
-    try:
-        message = f"🔐 Ваш код для входа в Cookly: *{auth_code}*\n\nКод действителен 5 минут"
-        url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-        payload = {
-            'chat_id': chat_id,
-            'text': message,
-            'parse_mode': 'Markdown'
-        }
-        response = requests.post(url, json=payload, timeout=10)
-        return response.status_code == 200
-    except Exception as e:
-        print(f"❌ Ошибка отправки Telegram сообщения: {e}")
-        return False
+    if _classifier is not None:
+        return _classifier, _classifier_classes
 
+    mtimes = _classifier_mtimes()
+    if mtimes is not None and mtimes != _classifier_failed_mtimes:
+        try:
+            from model import load_model as load_classifier_model
 
-# ========== ИНИЦИАЛИЗАЦИЯ МОДЕЛИ ДЕТЕКЦИИ ==========
+            with open(CLASSIFIER_CLASSES_PATH, 'r', encoding='utf-8') as f:
+                classes = json.load(f)
 
-_model = None
-_class_names = None
+            _classifier, device = load_classifier_model(CLASSIFIER_PATH, num_classes=len(classes))
+            _classifier_classes = translate_classes_to_russian(classes)
+            logger.info('Классификатор загружен', extra={'class_count': len(_classifier_classes),
+                                                         'device': str(device)})
+        except Exception as e:
+            logger.exception('Ошибка загрузки классификатора: %s', e)
+            _classifier = None
+            _classifier_classes = []
+            _classifier_failed_mtimes = mtimes
 
+    return _classifier, _classifier_classes
 
-def get_model():
-    global _model, _class_names
 
-    if _model is None and os.path.exists(MODEL_PATH):
-        try:
-            print("Загрузка модели детекции продуктов...")
-            _model = YOLO(MODEL_PATH)
+def _crop_box(bbox, width, height):
+    """bbox, обрезанный по границам изображения, или None для вырожденного бокса"""
+    try:
+        x1, y1, x2, y2 = (int(round(float(v))) for v in bbox)
+    except (TypeError, ValueError):
+        return None
+    x1, x2 = max(0, min(x1, width)), max(0, min(x2, width))
+    y1, y2 = max(0, min(y1, height)), max(0, min(y2, height))
+    if x2 <= x1 or y2 <= y1:
+        return None
+    return x1, y1, x2, y2
 
-            model_size = os.path.getsize(MODEL_PATH)
-            print(f"Размер модели: {model_size / (1024 * 1024):.2f} MB")
 
-            if model_size < 1024:
-                print("⚠️  Обнаружена демо-модель. Реальное детектирование не будет работать.")
+def refine_detections(image_path, detections):
+    """Уточняет метки неуверенных детекций классификатором за один батч
 
-            device = 'cuda' if torch.cuda.is_available() else 'cpu'
-            _model.to(device)
+    Все неуверенные боксы вырезаются из одного изображения и классифицируются
+    одним проходом predict_batch. Боксы обрезаются по границам изображения,
+    вырожденные пропускаются. Детекции изменяются на месте.
+    """
+    if not app.config['REFINE_ENABLED']:
+        return detections
 
-            if os.path.exists(CLASS_NAMES_PATH):
-                with open(CLASS_NAMES_PATH, 'rb') as f:
-                    loaded_classes = pickle.load(f)
+    threshold = app.config['REFINE_BELOW_CONFIDENCE']
+    candidates = [d for d in detections if d['confidence'] < threshold]
+    if not candidates:
+        return detections
 
-                if loaded_classes and isinstance(loaded_classes[0], str):
-                    _class_names = translate_classes_to_russian(loaded_classes)
-                    print(f"✅ Модель загружена. Доступно классов: {len(_class_names)}")
-                    print(f"   Устройство: {device}")
-                else:
-                    _class_names = ["морковь", "картофель", "помидор", "огурец", "лук", "перец", "капуста"]
-                    print(f"⚠️  Неверный формат классов. Используются демо-классы")
-            else:
-                _class_names = ["морковь", "картофель", "помидор", "огурец", "лук", "перец", "капуста"]
-                print(f"⚠️  Файл классов не найден. Используются демо-классы")
+    classifier, classifier_classes = get_classifier()
+    if classifier is None:
+        return detections
 
-        except Exception as e:
-            print(f"❌ Ошибка загрузки модели: {e}")
-            _model = None
-            _class_names = []
-
-    return _model, _class_names
-
-
-def translate_classes_to_russian(english_classes):
-    translation_dict = {
-        'carrot': 'морковь', 'carrots': 'морковь',
-        'potato': 'картофель', 'potatoes': 'картофель',
-        'tomato': 'помидор', 'tomatoes': 'помидоры',
-        'cucumber': 'огурец', 'cucumbers': 'огурцы',
-        'onion': 'лук', 'onions': 'лук',
-        'pepper': 'перец', 'peppers': 'перец',
-        'bell pepper': 'болгарский перец',
-        'cabbage': 'капуста', 'broccoli': 'брокколи',
-        'cauliflower': 'цветная капуста', 'garlic': 'чеснок',
-        'ginger': 'имбирь', 'lettuce': 'салат',
-        'spinach': 'шпинат', 'zucchini': 'кабачок',
-        'eggplant': 'баклажан', 'eggplants': 'баклажаны',
-        'pumpkin': 'тыква', 'beet': 'свекла',
-        'apple': 'яблоко', 'apples': 'яблоки',
-        'banana': 'банан', 'bananas': 'бананы',
-        'orange': 'апельсин', 'oranges': 'апельсины',
-        'lemon': 'лимон', 'lemons': 'лимоны'
-    }
+    try:
+        from PIL import Image
+
+        crops = []
+        refinable = []
+        with Image.open(image_path) as image:
+            image = image.convert('RGB')
+            for detection in candidates:
+                box = _crop_box(detection.get('bbox') or (), *image.size)
+                if box is not None:
+                    crops.append(image.crop(box))
+                    refinable.append(detection)
+
+        if not crops:
+            return detections
+        classes, probabilities = classifier.predict_batch(crops, top_k=1)
+    except Exception as e:
+        logger.warning('Ошибка уточнения детекций: %s', e)
+        return detections
 
-    russian_classes = []
-    for cls in english_classes:
-        cls_lower = cls.lower().strip()
-        if cls_lower in translation_dict:
-            russian_classes.append(translation_dict[cls_lower])
-        else:
-            russian_classes.append(cls)
+    min_confidence = app.config['REFINE_MIN_CLASSIFIER_CONFIDENCE']
+    for detection, class_id, probability in zip(refinable, classes[:, 0], probabilities[:, 0]):
+        probability = float(probability)
+        if probability < min_confidence or class_id >= len(classifier_classes):
+            continue
+        detection['detector_product'] = detection['product']
+        detection['product'] = classifier_classes[class_id]
+        detection['classifier_confidence'] = round(probability, 3)
+        detection['refined'] = True
 
-    return russian_classes
+    return detections
 
 
 def load_json_file(filename, default_data=None):
@@ -692,26 +761,60 @@ def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
-def detect_products(image_path, confidence_threshold=0.25):
-    model, class_names = get_model()
+def delete_recipe_image_files(recipe_image):
+    """Удаляет исходный файл изображения рецепта и его производные"""
+    remove_derivatives(recipe_image.get_variants(), RECIPE_IMAGES_FOLDER)
+    try:
+        os.remove(os.path.join(RECIPE_IMAGES_FOLDER, recipe_image.filename))
+    except OSError:
+        pass
+
+
+def process_recipe_image(recipe_image):
+    """Генерирует производные изображения для RecipeImage и записывает их в модель"""
+    source_path = recipe_image.filepath
+    if not os.path.isabs(source_path):
+        source_path = os.path.join(basedir, source_path)
+
+    remove_derivatives(recipe_image.get_variants(), RECIPE_IMAGES_FOLDER)
+    variants = generate_derivatives(source_path, RECIPE_IMAGES_FOLDER)
+    recipe_image.set_variants(variants)
+    return variants
 
-    if model is None:
+
+def detect_products(image_path, confidence_threshold=0.25, model_entry=None):
+    entry = model_entry or get_model_entry()
+
+    if entry is None:
         return {"error": "Модель не загружена"}, []
 
+    model, class_names, model_version = entry['model'], entry['class_names'], entry['version']
+
     try:
-        model_size = os.path.getsize(MODEL_PATH) if os.path.exists(MODEL_PATH) else 0
+        import cv2
+        import torch
 
-        if model_size < 1024:
-            print("⚠️ Обнаружена демо-модель, но пытаемся её использовать")
+        # Декодируем сами, чтобы время чтения файла не смешивалось с препроцессингом
+        with metrics.INFERENCE_STAGE.time(stage='decode', model_version=model_version):
+            image = cv2.imread(image_path)
+        if image is None:
+            return {"error": "Не удалось прочитать изображение"}, []
+
+        with torch.inference_mode():
+            results = model(image, conf=confidence_threshold, imgsz=640, verbose=False)
 
-        results = model(image_path, conf=confidence_threshold, imgsz=640, verbose=False)
+        if results:
+            # Ultralytics сам замеряет этапы (в миллисекундах)
+            for stage, key in (('preprocess', 'preprocess'), ('forward', 'inference'), ('postprocess', 'postprocess')):
+                if key in results[0].speed:
+                    metrics.INFERENCE_STAGE.observe(results[0].speed[key] / 1000, stage=stage,
+                                                    model_version=model_version)
 
         if not results or not results[0].boxes:
             return {"message": "На фото не найдены продукты"}, []
 
         result = results[0]
         detections = []
-        detected_products = []
 
         for box in result.boxes:
             confidence = float(box.conf[0])
@@ -726,13 +829,17 @@ def detect_products(image_path, confidence_threshold=0.25):
                 "product": class_name,
                 "confidence": round(confidence, 3),
                 "bbox": [x1, y1, x2, y2],
-                "area": (x2 - x1) * (y2 - y1)
+                "area": (x2 - x1) * (y2 - y1),
+                "model_version": model_version
             })
-            detected_products.append(class_name)
 
         if not detections:
             return {"message": "На фото не найдены продукты"}, []
 
+        with metrics.INFERENCE_STAGE.time(stage='refine', model_version=model_version):
+            refine_detections(image_path, detections)
+        detected_products = [d["product"] for d in detections]
+
         product_stats = {}
         for product in set(detected_products):
             product_detections = [d for d in detections if d["product"] == product]
@@ -747,49 +854,46 @@ def detect_products(image_path, confidence_threshold=0.25):
         return product_stats, detections
 
     except Exception as e:
-        print(f"❌ Ошибка детекции: {e}")
+        logger.exception('Ошибка детекции: %s', e)
         return {"error": f"Ошибка обработки: {str(e)}"}, []
 
 
-def normalize_product_name(product_name):
+INGREDIENT_STOP_WORDS = ['свежий', 'свежая', 'свежее', 'свежие', 'мелко', 'крупно',
+                         'нарезанный', 'очищенный', 'по', 'вкусу', 'для']
+
+INGREDIENT_SYNONYMS = {
+    'морковка': 'морковь', 'картошка': 'картофель',
+    'помидор': 'помидоры', 'помидорка': 'помидоры',
+    'огурчик': 'огурец', 'огурцы': 'огурец',
+    'лук репчатый': 'лук', 'луковица': 'лук',
+    'перчик': 'перец', 'капустка': 'капуста',
+    'яблоко': 'яблоки', 'бананы': 'банан',
+    'апельсин': 'апельсины', 'лимон': 'лимоны'
+}
+
+_LEADING_NUMBER_RE = re.compile(r'^\d+\s*')
+_AMOUNT_RE = re.compile(r'\s*\d+\s*(гр?|шт|мл|кг|ст\.?\s*л\.?|ч\.?\s*л\.?)\b')
+_PARENTHESES_RE = re.compile(r'\([^)]*\)')
+
+
+def normalize_product_name(product_name, synonyms=None):
     name = product_name.lower().strip()
-    synonyms = {
-        'морковка': 'морковь', 'картошка': 'картофель',
-        'помидорка': 'помидор', 'помидорчик': 'помидор',
-        'огурчик': 'огурец', 'огурцы': 'огурец',
-        'луковица': 'лук', 'перчик': 'перец',
-        'капустка': 'капуста', 'яблочко': 'яблоки',
-        'бананчик': 'банан', 'апельсинчик': 'апельсин',
-        'лимончик': 'лимон'
-    }
-    return synonyms.get(name, name)
+    return (synonyms or PRODUCT_SYNONYMS).get(name, name)
 
 
 def normalize_ingredient_name(ingredient_name):
     name = ingredient_name.lower().strip()
-    name = re.sub(r'^\d+\s*', '', name)
-    name = re.sub(r'\s*\d+\s*(гр?|шт|мл|кг|ст\.?\s*л\.?|ч\.?\s*л\.?)\b', '', name)
-    name = re.sub(r'\([^)]*\)', '', name)
+    name = _LEADING_NUMBER_RE.sub('', name)
+    name = _AMOUNT_RE.sub('', name)
+    name = _PARENTHESES_RE.sub('', name)
 
-    stop_words = ['свежий', 'свежая', 'свежее', 'свежие', 'мелко', 'крупно',
-                  'нарезанный', 'очищенный', 'по', 'вкусу', 'для']
-    for word in stop_words:
+    for word in INGREDIENT_STOP_WORDS:
         name = name.replace(word, '').strip()
 
-    synonyms = {
-        'морковка': 'морковь', 'картошка': 'картофель',
-        'помидор': 'помидоры', 'помидорка': 'помидоры',
-        'огурчик': 'огурец', 'огурцы': 'огурец',
-        'лук репчатый': 'лук', 'луковица': 'лук',
-        'перчик': 'перец', 'капустка': 'капуста',
-        'яблоко': 'яблоки', 'бананы': 'банан',
-        'апельсин': 'апельсины', 'лимон': 'лимоны'
-    }
+    return INGREDIENT_SYNONYMS.get(name, name)
 
-    return synonyms.get(name, name)
 
-
-def find_recipes_by_products(detected_products):
+def find_recipes_by_products(detected_products, synonyms=None):
     if not detected_products:
         return []
 
@@ -801,8 +905,8 @@ def find_recipes_by_products(detected_products):
     if not search_products:
         return []
 
-    normalized_products = [normalize_product_name(p) for p in search_products]
-    all_recipes = Recipe.query.all()
+    normalized_products = [normalize_product_name(p, synonyms) for p in search_products]
+    all_recipes = Recipe.with_relations().all()
     matching_recipes = []
 
     for recipe in all_recipes:
@@ -908,12 +1012,12 @@ def migrate_recipes_from_json():
 
         if recipes_count > 0:
             db.session.commit()
-            print(f"✅ Перенесено {recipes_count} рецептов")
+            logger.info('Перенесено %d рецептов', recipes_count)
         return recipes_count
 
     except Exception as e:
         db.session.rollback()
-        print(f"❌ Ошибка миграции: {e}")
+        logger.exception('Ошибка миграции: %s', e)
         return 0
 
 
@@ -934,15 +1038,162 @@ def internal_error(error):
     return render_template('500.html'), 500
 
 
+# ========== МЕТРИКИ ==========
+
+def _count_request_query(duration):
+    if has_request_context() and 'metrics_start' in g:
+        g.metrics_db_queries += 1
+        g.metrics_db_time += duration
+
+
+metrics.instrument_sqlalchemy(on_query=_count_request_query)
+
+
+_REQUEST_ID_RE = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+
+@app.before_request
+def assign_request_id():
+    # Берем id от балансировщика, если он есть, иначе создаем свой
+    incoming = request.headers.get('X-Request-ID', '')
+    g.request_id = incoming if _REQUEST_ID_RE.match(incoming) else uuid.uuid4().hex
+    g.request_id_token = request_id_var.set(g.request_id)
+
+
+@app.before_request
+def start_request_metrics():
+    if app.config['METRICS_ENABLED']:
+        g.metrics_start = time.perf_counter()
+        g.metrics_db_queries = 0
+        g.metrics_db_time = 0.0
+
+
+@app.teardown_request
+def record_request_metrics(exc):
+    # Профиль запроса, до которого не дошел after_request (необработанное исключение)
+    finish_view_profile()
+
+    # teardown вызывается после отдачи потокового ответа, поэтому время включает весь стрим
+    start = g.pop('metrics_start', None)
+    if start is None:
+        return
+
+    # Шаблон маршрута, а не фактический путь - иначе id в URL раздуют число рядов
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    status = 500 if exc is not None else g.get('metrics_status', 200)
+    metrics.REQUEST_LATENCY.observe(time.perf_counter() - start, method=request.method,
+                                    endpoint=endpoint, status=status)
+    metrics.REQUEST_DB_QUERIES.observe(g.metrics_db_queries, endpoint=endpoint)
+    metrics.REQUEST_DB_TIME.observe(g.metrics_db_time, endpoint=endpoint)
+
+
+@app.teardown_request
+def reset_request_id(exc):
+    token = g.pop('request_id_token', None)
+    if token is not None:
+        try:
+            request_id_var.reset(token)
+        except ValueError:
+            # Потоковый ответ дочитан уже в другом контексте
+            request_id_var.set('-')
+
+
+def _is_direct_local_request():
+    """Запрос с loopback-адреса без заголовков прокси (за nginx на том же хосте адрес тоже 127.0.0.1)"""
+    if request.headers.get('X-Forwarded-For') or request.headers.get('X-Real-IP') or \
+            request.headers.get('Forwarded'):
+        return False
+    return request.remote_addr in ('127.0.0.1', '::1')
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    token = app.config['METRICS_TOKEN']
+    if token:
+        if not secrets.compare_digest(request.headers.get('Authorization', '').encode(),
+                                      f'Bearer {token}'.encode()):
+            return jsonify({'error': 'Unauthorized'}), 401
+    elif not _is_direct_local_request():
+        # Без токена метрики (трафик по эндпоинтам, время БД, версии моделей) наружу не отдаем
+        return jsonify({'error': 'Forbidden: set METRICS_TOKEN to scrape metrics remotely'}), 403
+
+    return app.response_class(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+
 @app.after_request
 def after_request(response):
+    if 'metrics_start' in g:
+        g.metrics_status = response.status_code
+    if 'request_id' in g:
+        response.headers['X-Request-ID'] = g.request_id
+
     response.headers.add('Access-Control-Allow-Origin', '*')
     response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
     response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
-    response.headers.add('Cache-Control', 'no-store, no-cache, must-revalidate, max-age=0')
+
+    if request.endpoint == 'static':
+        if request.args.get('v') and request.args['v'] == _static_fingerprint(request.view_args.get('filename')):
+            # URL содержит хеш текущего содержимого - файл по нему никогда не изменится.
+            # Устаревший или выдуманный v не закрепляем в кешах на год
+            response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        elif request.path.startswith('/static/uploads/'):
+            response.headers['Cache-Control'] = 'public, max-age=604800'
+        else:
+            response.headers['Cache-Control'] = 'no-cache'
+    else:
+        response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
+
+    if app.config['COMPRESS_ENABLED']:
+        response = compress_response(
+            response,
+            request.headers.get('Accept-Encoding'),
+            min_size=app.config['COMPRESS_MIN_SIZE'],
+            level=app.config['COMPRESS_LEVEL'],
+            br_level=app.config['COMPRESS_BR_LEVEL']
+        )
+
+    # Последним шагом - чтобы в профиль потокового ответа попало и его сжатие
+    return finish_view_profile(response)
+
+
+# ========== СТАТИЧЕСКИЕ ФАЙЛЫ ==========
+
+@app.url_defaults
+def add_static_fingerprint(endpoint, values):
+    """url_for('static', ...) добавляет хеш содержимого файла в параметр v"""
+    if endpoint != 'static' or 'filename' not in values or 'v' in values:
+        return
+
+    fingerprint = _static_fingerprint(values['filename'])
+    if fingerprint:
+        values['v'] = fingerprint
+
+
+def _static_fingerprint(filename):
+    path = safe_join(app.static_folder, filename) if filename else None
+    return file_fingerprint(path) if path else None
+
+
+def send_static_precompressed(filename):
+    """Отдает заранее сжатую (.br/.gz) версию файла, если клиент её принимает"""
+    path = safe_join(app.static_folder, filename)
+    encoding, compressed_path = find_precompressed(path, request.headers.get('Accept-Encoding')) \
+        if path else (None, None)
+
+    if not encoding:
+        response = app.send_static_file(filename)
+    else:
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = send_file(compressed_path, mimetype=mimetype, conditional=True)
+        response.headers['Content-Encoding'] = encoding
+
+    response.vary.add('Accept-Encoding')
     return response
 
 
+app.view_functions['static'] = send_static_precompressed
+
+
 # ========== СТРАНИЦЫ ==========
 
 @app.route('/')
@@ -1010,9 +1261,7 @@ def api_register():
     session['authenticated'] = True
     session.permanent = True
 
-    print(f"✅ Пользователь {username} зарегистрирован и вошел в систему")
-    print(f"   Session ID: {session.sid if hasattr(session, 'sid') else 'N/A'}")
-    print(f"   User ID в сессии: {session.get('user_id')}")
+    logger.info('Пользователь зарегистрирован', extra={'user_id': user.id})
 
     return jsonify({'success': True, 'user': user.to_dict()})
 
@@ -1046,9 +1295,7 @@ def api_login():
     session['authenticated'] = True
     session.permanent = True
 
-    print(f"✅ Пользователь {user.username} вошел в систему")
-    print(f"   Session ID: {session.sid if hasattr(session, 'sid') else 'N/A'}")
-    print(f"   User ID в сессии: {session.get('user_id')}")
+    logger.info('Пользователь вошел в систему', extra={'user_id': user.id})
 
     return jsonify({'success': True, 'user': user.to_dict()})
 
@@ -1064,19 +1311,12 @@ def api_logout():
 @app.route('/api/auth/user')
 @json_response
 def api_get_current_user():
-    print(f"🔍 Проверка пользователя. Сессия: {dict(session)}")
-    print(f"   current_user.is_authenticated: {current_user.is_authenticated}")
-    print(f"   current_user: {current_user}")
-
     if current_user.is_authenticated:
-        user_dict = current_user.to_dict()
-        print(f"✅ Пользователь авторизован: {user_dict['username']}")
         return jsonify({
             'authenticated': True,
-            'user': user_dict
+            'user': current_user.to_dict()
         })
 
-    print("❌ Пользователь не авторизован")
     return jsonify({
         'authenticated': False,
         'user': None
@@ -1088,7 +1328,7 @@ def api_get_current_user():
 @app.route('/login/google')
 def google_login():
     if not app.config['GOOGLE_OAUTH_CLIENT_ID'] or not app.config['GOOGLE_OAUTH_CLIENT_SECRET']:
-        print("⚠️ Google OAuth не настроен")
+        logger.warning('Google OAuth не настроен')
         return redirect(url_for('login_page'))
 
     if not google.authorized:
@@ -1135,7 +1375,7 @@ def google_login():
         return redirect(url_for('index'))
 
     except Exception as e:
-        print(f"❌ Ошибка Google авторизации: {e}")
+        logger.exception('Ошибка Google авторизации: %s', e)
         return redirect(url_for('login_page'))
 
 
@@ -1159,31 +1399,53 @@ def api_telegram_request_code():
     if not TELEGRAM_BOT_TOKEN:
         return jsonify({'error': 'Telegram бот не настроен'}), 503
 
-    auth_code = generate_auth_code()
-    expires_at = datetime.utcnow() + timedelta(minutes=5)
-
-    telegram_chat = TelegramChat.query.filter_by(chat_id=str(chat_id)).first()
+    maybe_purge_auth_codes()
 
-    if telegram_chat:
-        telegram_chat.auth_code = auth_code
-        telegram_chat.auth_code_expires = expires_at
-        telegram_chat.is_active = True
-    else:
-        telegram_chat = TelegramChat(
-            user_id=None,
-            chat_id=str(chat_id),
-            auth_code=auth_code,
-            auth_code_expires=expires_at,
-            is_active=True
-        )
-        db.session.add(telegram_chat)
+    auth_code = generate_auth_code()
+    now = datetime.utcnow()
+    ttl = timedelta(seconds=app.config['TELEGRAM_CODE_TTL'])
+    lockout = timedelta(seconds=app.config['TELEGRAM_CODE_LOCKOUT'])
+    expires_at = now + ttl
+
+    # Первый запрос чата - вставка без ошибки при гонке: параллельный запрос, вставивший
+    # строку раньше, превращает этот в обычную замену кода со всеми проверками ниже
+    created = db.session.execute(insert_ignore(TelegramAuthCode).values(
+        chat_id=str(chat_id),
+        code=auth_code,
+        expires_at=expires_at,
+        attempts=0,
+        created_at=now
+    )).rowcount
+
+    if not created:
+        stored = db.session.get(TelegramAuthCode, str(chat_id))
+        # Прошлый код отправлен в expires_at - TTL: не заваливаем чат повторными сообщениями
+        wait = stored.expires_at - ttl + timedelta(seconds=app.config['TELEGRAM_CODE_RESEND_INTERVAL']) - now
+        if wait.total_seconds() > 0:
+            return jsonify({'error': 'Код уже отправлен, повторный запрос возможен позже',
+                            'retry_after': int(wait.total_seconds()) + 1}), 429
+
+        # Неверные попытки считаются на чат, а не на код: новый код счетчик не обнуляет,
+        # пока не закончится окно блокировки, начатое первым кодом (created_at)
+        if stored.created_at is None or now - stored.created_at >= lockout:
+            stored.attempts = 0
+            stored.created_at = now
+        elif stored.attempts >= app.config['TELEGRAM_CODE_MAX_ATTEMPTS']:
+            wait = stored.created_at + lockout - now
+            return jsonify({'error': 'Слишком много попыток, попробуйте позже',
+                            'retry_after': int(wait.total_seconds()) + 1}), 429
+        stored.code = auth_code
+        stored.expires_at = expires_at
+
+    # Сообщение только ставится в очередь, поэтому код сохраняется после постановки:
+    # если очередь его не приняла, откат оставляет прежнее состояние, и неполученный
+    # код не включает интервал повторной отправки
+    if not send_telegram_auth_code(chat_id, auth_code):
+        db.session.rollback()
+        return jsonify({'error': 'Не удалось отправить код, попробуйте позже'}), 503
 
     db.session.commit()
-
-    if send_telegram_auth_code(chat_id, auth_code):
-        return jsonify({'success': True, 'message': 'Код отправлен в Telegram'})
-    else:
-        return jsonify({'error': 'Не удалось отправить код'}), 500
+    return jsonify({'success': True, 'message': 'Код отправлен в Telegram'})
 
 
 @app.route('/api/auth/telegram/verify-code', methods=['POST'])
@@ -1196,19 +1458,44 @@ def api_telegram_verify_code():
     if not chat_id or not auth_code:
         return jsonify({'error': 'Не указан chat_id или код'}), 400
 
-    telegram_chat = TelegramChat.query.filter_by(
-        chat_id=str(chat_id),
-        auth_code=auth_code,
-        is_active=True
-    ).first()
+    # Попытка списывается до сравнения одним атомарным UPDATE: параллельные запросы
+    # на разных воркерах не перезаписывают счетчик друг друга, решение принимается
+    # по значению, которое вернула база
+    claim = update(TelegramAuthCode).where(TelegramAuthCode.chat_id == str(chat_id)) \
+        .values(attempts=TelegramAuthCode.attempts + 1)
+    columns = (TelegramAuthCode.attempts, TelegramAuthCode.code, TelegramAuthCode.expires_at)
+    if db.engine.dialect.update_returning:
+        stored = db.session.execute(claim.returning(*columns)).first()
+    else:
+        # Без RETURNING читаем строку в той же транзакции - она уже заблокирована нашим UPDATE
+        stored = db.session.execute(select(*columns).where(TelegramAuthCode.chat_id == str(chat_id))).first() \
+            if db.session.execute(claim).rowcount else None
 
-    if not telegram_chat:
+    if not stored:
+        db.session.rollback()
         return jsonify({'error': 'Неверный код'}), 401
 
-    if telegram_chat.auth_code_expires < datetime.utcnow():
+    attempts_left = app.config['TELEGRAM_CODE_MAX_ATTEMPTS'] - stored.attempts
+    if attempts_left < 0:
+        db.session.commit()
+        return jsonify({'error': 'Слишком много попыток, попробуйте позже'}), 429
+
+    if stored.expires_at < datetime.utcnow():
+        db.session.commit()
         return jsonify({'error': 'Код истек'}), 401
 
-    if telegram_chat.user_id:
+    if not secrets.compare_digest(stored.code.encode(), auth_code.encode()):
+        db.session.commit()
+        if attempts_left == 0:
+            return jsonify({'error': 'Слишком много попыток, попробуйте позже'}), 429
+        return jsonify({'error': 'Неверный код', 'attempts_left': attempts_left}), 401
+
+    # Код одноразовый - удаляется в той же транзакции, что и вход
+    TelegramAuthCode.query.filter_by(chat_id=str(chat_id)).delete(synchronize_session=False)
+
+    telegram_chat = TelegramChat.query.filter_by(chat_id=str(chat_id)).first()
+
+    if telegram_chat and telegram_chat.is_active and telegram_chat.user_id:
         user = db.session.get(User, telegram_chat.user_id)
         if user:
             login_user(user, remember=True)
@@ -1233,9 +1520,12 @@ def api_telegram_verify_code():
         db.session.add(user)
         db.session.flush()
 
+    if not telegram_chat:
+        telegram_chat = TelegramChat(chat_id=str(chat_id))
+        db.session.add(telegram_chat)
+
     telegram_chat.user_id = user.id
-    telegram_chat.auth_code = None
-    telegram_chat.auth_code_expires = None
+    telegram_chat.is_active = True
 
     db.session.commit()
 
@@ -1251,26 +1541,72 @@ def api_telegram_verify_code():
 @app.route('/api/recipes')
 @json_response
 def get_recipes():
-    recipes = Recipe.query.filter_by(is_user_recipe=False).order_by(desc(Recipe.created_at)).all()
-    return jsonify([recipe.to_dict() for recipe in recipes])
+    query = Recipe.with_relations().filter_by(is_user_recipe=False).order_by(desc(Recipe.created_at))
+    if wants_stream():
+        return stream_json_array(query, Recipe.to_dict)
+    return jsonify([recipe.to_dict() for recipe in query.all()])
 
 
 @app.route('/api/user-recipes')
 @json_response
 def get_user_recipes():
     if current_user.is_authenticated:
-        recipes = Recipe.query.filter_by(
+        recipes = Recipe.with_relations().filter_by(
             is_user_recipe=True,
             user_id=current_user.id
         ).order_by(desc(Recipe.created_at)).all()
     else:
-        recipes = Recipe.query.filter_by(
+        recipes = Recipe.with_relations().filter_by(
             is_user_recipe=True,
             user_id=None
         ).order_by(desc(Recipe.created_at)).all()
     return jsonify([recipe.to_dict() for recipe in recipes])
 
 
+def _sync_rows(model, existing, new_rows):
+    """Приводит строки рецепта к new_rows, сопоставляя их по позиции
+
+    existing - кортежи (id, поля...) в текущем порядке, new_rows - словари с теми
+    же полями. Измененные строки обновляются одним executemany по первичному
+    ключу, лишние удаляются одним DELETE, недостающие вставляются одним executemany.
+    """
+    changed = []
+    for row, values in zip(existing, new_rows):
+        if tuple(row[1:]) != tuple(values[key] for key in values if key != 'recipe_id'):
+            changed.append({'id': row[0], **values})
+    if changed:
+        db.session.execute(update(model), changed)
+
+    stale = [row[0] for row in existing[len(new_rows):]]
+    if stale:
+        model.query.filter(model.id.in_(stale)).delete(synchronize_session=False)
+
+    added = new_rows[len(existing):]
+    if added:
+        db.session.execute(insert(model), added)
+
+
+def _save_recipe_rows(recipe_id, data, existing=False):
+    """Записывает ингредиенты и шаги рецепта; при редактировании трогает только изменения"""
+    ingredients = [{'recipe_id': recipe_id, 'name': ing['name'], 'amount': ing['amount']}
+                   for ing in data['ingredients']]
+    instructions = [{'recipe_id': recipe_id, 'step_number': i, 'description': text}
+                    for i, text in enumerate(data['instructions'], 1)]
+
+    if not existing:
+        db.session.execute(insert(Ingredient), ingredients)
+        db.session.execute(insert(Instruction), instructions)
+        return
+
+    # Поля в том же порядке, что и в словарях (без recipe_id) - для сравнения
+    current_ingredients = db.session.query(Ingredient.id, Ingredient.name, Ingredient.amount) \
+        .filter_by(recipe_id=recipe_id).order_by(Ingredient.id).all()
+    current_instructions = db.session.query(Instruction.id, Instruction.step_number, Instruction.description) \
+        .filter_by(recipe_id=recipe_id).order_by(Instruction.step_number, Instruction.id).all()
+    _sync_rows(Ingredient, current_ingredients, ingredients)
+    _sync_rows(Instruction, current_instructions, instructions)
+
+
 @app.route('/api/user-recipes', methods=['POST'])
 @login_required
 @json_response
@@ -1307,22 +1643,7 @@ def save_user_recipe():
         recipe.servings = data['servings']
         recipe.author_name = current_user.username
 
-        Ingredient.query.filter_by(recipe_id=recipe.id).delete()
-        Instruction.query.filter_by(recipe_id=recipe.id).delete()
-
-        for ing_data in data['ingredients']:
-            db.session.add(Ingredient(
-                recipe_id=recipe.id,
-                name=ing_data['name'],
-                amount=ing_data['amount']
-            ))
-
-        for i, step_text in enumerate(data['instructions'], 1):
-            db.session.add(Instruction(
-                recipe_id=recipe.id,
-                step_number=i,
-                description=step_text
-            ))
+        _save_recipe_rows(recipe.id, data, existing=True)
 
     else:
         recipe = Recipe(
@@ -1340,30 +1661,15 @@ def save_user_recipe():
         db.session.add(recipe)
         db.session.flush()
 
-        for ing_data in data['ingredients']:
-            db.session.add(Ingredient(
-                recipe_id=recipe.id,
-                name=ing_data['name'],
-                amount=ing_data['amount']
-            ))
-
-            if not UserIngredient.query.filter_by(
-                    user_id=current_user.id,
-                    name=ing_data['name']
-            ).first():
-                db.session.add(UserIngredient(
-                    user_id=current_user.id,
-                    name=ing_data['name']
-                ))
-
-        for i, step_text in enumerate(data['instructions'], 1):
-            db.session.add(Instruction(
-                recipe_id=recipe.id,
-                step_number=i,
-                description=step_text
-            ))
+        _save_recipe_rows(recipe.id, data)
+
+        # Ингредиенты рецепта попадают в кладовую пользователя; уже сохраненные пропускаются
+        pantry = dict.fromkeys(ing['name'] for ing in data['ingredients'])
+        db.session.execute(insert_ignore(UserIngredient),
+                           [{'user_id': current_user.id, 'name': name} for name in pantry])
 
     db.session.commit()
+    profile_stats_cache.invalidate(current_user.id)
     return jsonify({'success': True, 'recipe': recipe.to_dict()})
 
 
@@ -1384,15 +1690,78 @@ def delete_user_recipe(recipe_id):
 
     db.session.delete(recipe)
     db.session.commit()
+    # У тех, кто добавил рецепт в избранное, счетчик обновится по истечении TTL
+    profile_stats_cache.invalidate(current_user.id)
 
     return jsonify({'success': True, 'deletedId': recipe_id})
 
 
+@app.route('/api/user-recipes/<int:recipe_id>/image', methods=['POST'])
+@login_required
+@json_response
+def upload_recipe_image(recipe_id):
+    recipe = db.session.get(Recipe, recipe_id)
+
+    if not recipe:
+        return jsonify({'error': 'Recipe not found'}), 404
+
+    if recipe.user_id != current_user.id:
+        return jsonify({'error': 'You can only edit your own recipes'}), 403
+
+    if 'file' not in request.files:
+        return jsonify({'error': 'No file part'}), 400
+
+    file = request.files['file']
+
+    if file.filename == '' or not allowed_file(file.filename):
+        return jsonify({'error': 'File type not allowed'}), 400
+
+    ext = secure_filename(file.filename).rsplit('.', 1)[1].lower()
+    filename = f"recipe_{recipe.id}_{secrets.token_hex(16)}.{ext}"
+    filepath = os.path.join(RECIPE_IMAGES_FOLDER, filename)
+    file.save(filepath)
+
+    recipe_image = RecipeImage(
+        recipe_id=recipe.id,
+        filename=filename,
+        filepath=filepath,
+        is_primary=True
+    )
+
+    try:
+        process_recipe_image(recipe_image)
+    except Exception as e:
+        os.remove(filepath)
+        return jsonify({'error': f'Не удалось обработать изображение: {e}'}), 400
+
+    # Прежнее основное изображение заменяется: запись и файлы удаляются, чтобы
+    # повторные загрузки не копили файлы на диске
+    replaced = RecipeImage.query.filter_by(recipe_id=recipe.id, is_primary=True).all()
+    for old_image in replaced:
+        db.session.delete(old_image)
+    db.session.add(recipe_image)
+    recipe.image = recipe_image_url(filename)
+    try:
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        delete_recipe_image_files(recipe_image)
+        raise
+
+    for old_image in replaced:
+        if old_image.filename != filename:
+            delete_recipe_image_files(old_image)
+
+    return jsonify({'success': True, 'image': recipe_image.to_dict(), 'recipe': recipe.to_dict()})
+
+
 @app.route('/api/all-recipes')
 @json_response
 def get_all_recipes():
-    recipes = Recipe.query.order_by(desc(Recipe.created_at)).all()
-    return jsonify([recipe.to_dict() for recipe in recipes])
+    query = Recipe.with_relations().order_by(desc(Recipe.created_at))
+    if wants_stream():
+        return stream_json_array(query, Recipe.to_dict)
+    return jsonify([recipe.to_dict() for recipe in query.all()])
 
 
 # ========== API ЛАЙКОВ ==========
@@ -1432,6 +1801,9 @@ def like_recipe(recipe_id):
             message = 'Лайк поставлен'
 
         db.session.commit()
+        # Лайки учитываются в статистике автора рецепта
+        if recipe.user_id is not None:
+            profile_stats_cache.invalidate(recipe.user_id)
 
         return jsonify({
             'success': True,
@@ -1442,9 +1814,7 @@ def like_recipe(recipe_id):
 
     except Exception as e:
         db.session.rollback()
-        print(f"❌ Ошибка в like_recipe: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception('Ошибка в like_recipe: %s', e)
         return jsonify({
             'success': False,
             'error': str(e)
@@ -1476,9 +1846,7 @@ def get_recipe_likes_info(recipe_id):
         })
 
     except Exception as e:
-        print(f"❌ Ошибка в get_recipe_likes_info: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception('Ошибка в get_recipe_likes_info: %s', e)
         return jsonify({
             'success': False,
             'error': str(e)
@@ -1534,40 +1902,158 @@ def get_favorites():
     return jsonify([fav.recipe_id for fav in favorites])
 
 
+# Максимум изменений в одном запросе синхронизации избранного
+FAVORITES_SYNC_MAX_CHANGES = 500
+
+
+def add_favorite(user_id, recipe_id):
+    """Добавляет рецепт в избранное одним INSERT ... SELECT
+
+    Возвращает True, если запись добавлена, False - если рецепт уже в избранном,
+    None - если рецепта нет. Транзакцию не фиксирует.
+    """
+    # SELECT из recipes проверяет существование рецепта в том же запросе
+    stmt = insert_ignore(Favorite).from_select(
+        ['user_id', 'recipe_id', 'created_at'],
+        select(literal(user_id), Recipe.id, literal(datetime.utcnow())).where(Recipe.id == recipe_id)
+    )
+    if db.session.execute(stmt).rowcount:
+        return True
+    # Ничего не вставлено: рецепт уже в избранном или его не существует
+    if db.session.query(Recipe.id).filter_by(id=recipe_id).first() is None:
+        return None
+    return False
+
+
+def remove_favorite(user_id, recipe_id):
+    """Убирает рецепт из избранного; True, если запись была. Транзакцию не фиксирует"""
+    return Favorite.query.filter_by(user_id=user_id, recipe_id=recipe_id).delete() > 0
+
+
+@app.route('/api/favorites/<int:recipe_id>', methods=['PUT'])
+@login_required
+@json_response
+def put_favorite(recipe_id):
+    """Идемпотентное добавление в избранное; в ответе только изменение"""
+    changed = add_favorite(current_user.id, recipe_id)
+    if changed is None:
+        db.session.rollback()
+        return jsonify({'error': 'Рецепт не найден'}), 404
+
+    db.session.commit()
+    if changed:
+        profile_stats_cache.invalidate(current_user.id)
+    return jsonify({'success': True, 'recipe_id': recipe_id, 'favorite': True, 'changed': changed})
+
+
+@app.route('/api/favorites/<int:recipe_id>', methods=['DELETE'])
+@login_required
+@json_response
+def delete_favorite(recipe_id):
+    """Идемпотентное удаление из избранного; в ответе только изменение"""
+    changed = remove_favorite(current_user.id, recipe_id)
+    db.session.commit()
+    if changed:
+        profile_stats_cache.invalidate(current_user.id)
+    return jsonify({'success': True, 'recipe_id': recipe_id, 'favorite': False, 'changed': changed})
+
+
 @app.route('/api/favorites', methods=['POST'])
 @login_required
 @json_response
 def toggle_favorite():
-    data = request.json
+    data = request.get_json(silent=True) or {}
     recipe_id = data.get('recipeId')
 
     if not recipe_id:
         return jsonify({'error': 'No recipeId provided'}), 400
+    if not isinstance(recipe_id, int) or isinstance(recipe_id, bool):
+        return jsonify({'error': 'recipeId must be an integer'}), 400
 
-    favorite = Favorite.query.filter_by(
-        user_id=current_user.id,
-        recipe_id=recipe_id
-    ).first()
-
-    if favorite:
-        db.session.delete(favorite)
+    if remove_favorite(current_user.id, recipe_id):
         action = 'removed'
     else:
-        db.session.add(Favorite(
-            user_id=current_user.id,
-            recipe_id=recipe_id
-        ))
+        if add_favorite(current_user.id, recipe_id) is None:
+            db.session.rollback()
+            return jsonify({'error': 'Рецепт не найден'}), 404
         action = 'added'
 
     db.session.commit()
+    profile_stats_cache.invalidate(current_user.id)
 
-    favorites = [fav.recipe_id for fav in Favorite.query.filter_by(user_id=current_user.id).all()]
+    return jsonify({'success': True, 'action': action, 'recipe_id': recipe_id, 'favorite': action == 'added'})
 
-    return jsonify({'success': True, 'action': action, 'favorites': favorites})
+
+@app.route('/api/favorites/sync', methods=['POST'])
+@login_required
+@json_response
+def sync_favorites():
+    """Применяет очередь изменений избранного (например, накопленную офлайн) одной транзакцией
+
+    Тело: {"changes": [{"recipeId": 1, "favorite": true}, ...]}; для рецепта действует
+    последнее изменение в очереди. В ответе - только реально добавленные и удаленные
+    рецепты и рецепты, которых больше нет (такие изменения пропускаются).
+    """
+    changes = (request.get_json(silent=True) or {}).get('changes')
+    if not isinstance(changes, list):
+        return jsonify({'error': 'No changes provided'}), 400
+    if len(changes) > FAVORITES_SYNC_MAX_CHANGES:
+        return jsonify({'error': f'Too many changes (max {FAVORITES_SYNC_MAX_CHANGES})'}), 400
+
+    desired = {}
+    for change in changes:
+        recipe_id = change.get('recipeId') if isinstance(change, dict) else None
+        if not isinstance(recipe_id, int) or isinstance(recipe_id, bool) or \
+                not isinstance(change.get('favorite'), bool):
+            return jsonify({'error': 'Each change needs integer recipeId and boolean favorite'}), 400
+        desired[recipe_id] = change['favorite']
+
+    user_id = current_user.id
+    current = {}
+    if desired:
+        # Существование рецептов и текущее состояние избранного - одним запросом
+        rows = db.session.query(Recipe.id, Favorite.id).outerjoin(
+            Favorite, and_(Favorite.recipe_id == Recipe.id, Favorite.user_id == user_id)
+        ).filter(Recipe.id.in_(desired)).all()
+        current = {recipe_id: favorite_id is not None for recipe_id, favorite_id in rows}
+
+    added = sorted(rid for rid, favorite in desired.items() if favorite and current.get(rid) is False)
+    removed = sorted(rid for rid, favorite in desired.items() if not favorite and current.get(rid))
+    unknown = sorted(rid for rid in desired if rid not in current)
+
+    if added:
+        now = datetime.utcnow()
+        db.session.execute(insert_ignore(Favorite),
+                           [{'user_id': user_id, 'recipe_id': rid, 'created_at': now} for rid in added])
+    if removed:
+        Favorite.query.filter(Favorite.user_id == user_id, Favorite.recipe_id.in_(removed)) \
+            .delete(synchronize_session=False)
+    db.session.commit()
+    if added or removed:
+        profile_stats_cache.invalidate(user_id)
+
+    return jsonify({'success': True, 'added': added, 'removed': removed, 'unknown': unknown})
 
 
 # ========== API ИНГРЕДИЕНТОВ ==========
 
+# Словарь популярных ингредиентов (подсказки в интерфейсе и генератор тестового каталога)
+COMMON_INGREDIENTS = [
+    "Мука", "Сахар", "Соль", "Перец", "Оливковое масло", "Подсолнечное масло",
+    "Яйца", "Молоко", "Сливки", "Сметана", "Масло сливочное", "Сыр",
+    "Пармезан", "Моцарелла", "Чеснок", "Лук репчатый", "Лук зеленый",
+    "Морковь", "Картофель", "Помидоры", "Огурцы", "Перец болгарский",
+    "Капуста белокочанная", "Капуста цветная", "Брокколи", "Шпинат",
+    "Салат листовой", "Петрушка", "Укроп", "Базилик", "Кинза",
+    "Куриное филе", "Говядина", "Свинина", "Бекон", "Ветчина",
+    "Колбаса", "Сосиски", "Рыба белая", "Лосось", "Креветки",
+    "Рис", "Гречка", "Макароны", "Спагетти", "Лапша", "Хлеб",
+    "Мед", "Шоколад", "Какао", "Корица", "Лимон", "Апельсин", "Яблоки",
+    "Бананы", "Клубника", "Малина", "Авокадо", "Тыква", "Кабачки",
+    "Баклажаны", "Грибы", "Фасоль", "Горох", "Чечевица", "Кукуруза"
+]
+
+
 @app.route('/api/user-ingredients')
 @login_required
 @json_response
@@ -1595,6 +2081,7 @@ def save_user_ingredient_api():
             name=ingredient
         ))
         db.session.commit()
+        profile_stats_cache.invalidate(current_user.id)
 
     ingredients = [ing.name for ing in UserIngredient.query.filter_by(user_id=current_user.id).all()]
 
@@ -1604,40 +2091,13 @@ def save_user_ingredient_api():
 @app.route('/api/common-ingredients')
 @json_response
 def get_common_ingredients():
-    common_ingredients = [
-        "Мука", "Сахар", "Соль", "Перец", "Оливковое масло", "Подсолнечное масло",
-        "Яйца", "Молоко", "Сливки", "Сметана", "Масло сливочное", "Сыр",
-        "Пармезан", "Моцарелла", "Чеснок", "Лук репчатый", "Лук зеленый",
-        "Морковь", "Картофель", "Помидоры", "Огурцы", "Перец болгарский",
-        "Капуста белокочанная", "Капуста цветная", "Брокколи", "Шпинат",
-        "Салат листовой", "Петрушка", "Укроп", "Базилик", "Кинза",
-        "Куриное филе", "Говядина", "Свинина", "Бекон", "Ветчина",
-        "Колбаса", "Сосиски", "Рыба белая", "Лосось", "Креветки",
-        "Рис", "Гречка", "Макароны", "Спагетти", "Лапша", "Хлеб",
-        "Мед", "Шоколад", "Какао", "Корица", "Лимон", "Апельсин", "Яблоки",
-        "Бананы", "Клубника", "Малина", "Авокадо", "Тыква", "Кабачки",
-        "Баклажаны", "Грибы", "Фасоль", "Горох", "Чечевица", "Кукуруза"
-    ]
-    return jsonify(common_ingredients)
+    return jsonify(COMMON_INGREDIENTS)
 
 
 @app.route('/api/all-ingredients')
 @json_response
 def get_all_ingredients():
-    common = [
-        "Мука", "Сахар", "Соль", "Перец", "Оливковое масло", "Подсолнечное масло",
-        "Яйца", "Молоко", "Сливки", "Сметана", "Масло сливочное", "Сыр",
-        "Пармезан", "Моцарелла", "Чеснок", "Лук репчатый", "Лук зеленый",
-        "Морковь", "Картофель", "Помидоры", "Огурцы", "Перец болгарский",
-        "Капуста белокочанная", "Капуста цветная", "Брокколи", "Шпинат",
-        "Салат листовой", "Петрушка", "Укроп", "Базилик", "Кинза",
-        "Куриное филе", "Говядина", "Свинина", "Бекон", "Ветчина",
-        "Колбаса", "Сосиски", "Рыба белая", "Лосось", "Креветки",
-        "Рис", "Гречка", "Макароны", "Спагетти", "Лапша", "Хлеб",
-        "Мед", "Шоколад", "Какао", "Корица", "Лимон", "Апельсин", "Яблоки",
-        "Бананы", "Клубника", "Малина", "Авокадо", "Тыква", "Кабачки",
-        "Баклажаны", "Грибы", "Фасоль", "Горох", "Чечевица", "Кукуруза"
-    ]
+    common = list(COMMON_INGREDIENTS)
 
     if current_user.is_authenticated:
         user_ingredients = [ing.name for ing in UserIngredient.query.filter_by(user_id=current_user.id).all()]
@@ -1649,6 +2109,66 @@ def get_all_ingredients():
     return jsonify(all_ingredients)
 
 
+# ========== НАЧАЛЬНАЯ ЗАГРУЗКА СТРАНИЦЫ ==========
+
+@app.route('/api/bootstrap')
+@json_response
+def bootstrap():
+    """Данные для первой отрисовки главной страницы одним ответом
+
+    Заменяет /api/auth/user, /api/all-recipes, /api/favorites, /api/all-ingredients,
+    /api/user-recipes и запрос /api/recipe/<id>/likes на каждую карточку. Число
+    SQL-запросов не зависит ни от размера каталога, ни от количества лайков.
+    """
+    page_size = request.args.get('limit', app.config['BOOTSTRAP_PAGE_SIZE'], type=int)
+    page_size = max(1, min(page_size, 200))
+
+    # На одну запись больше, чтобы понять, есть ли продолжение, без COUNT(*)
+    recipes = Recipe.with_relations().order_by(desc(Recipe.created_at)).limit(page_size + 1).all()
+    data = {
+        'authenticated': False,
+        'user': None,
+        'recipes': [recipe.to_dict() for recipe in recipes[:page_size]],
+        'has_more': len(recipes) > page_size,
+        'favorites': [],
+        'favorite_recipes': [],
+        'user_recipes': [],
+        'liked': [],
+        'ingredients': sorted(COMMON_INGREDIENTS)
+    }
+
+    if not current_user.is_authenticated:
+        return jsonify(data)
+
+    user_id = current_user.id
+    favorites = [row.recipe_id for row in db.session.query(Favorite.recipe_id).filter_by(user_id=user_id)]
+    pantry = [row.name for row in db.session.query(UserIngredient.name).filter_by(user_id=user_id)]
+    liked = [row.recipe_id for row in db.session.query(Like.recipe_id).filter_by(user_id=user_id)]
+
+    # Избранные и собственные рецепты нужны вкладкам, даже если не попали на первую страницу
+    own_and_favorite = Recipe.with_relations().filter(or_(
+        Recipe.id.in_(favorites),
+        and_(Recipe.is_user_recipe.is_(True), Recipe.user_id == user_id)
+    )).order_by(desc(Recipe.created_at)).all()
+
+    favorite_ids = set(favorites)
+    for recipe in own_and_favorite:
+        recipe_dict = recipe.to_dict()
+        if recipe.id in favorite_ids:
+            data['favorite_recipes'].append(recipe_dict)
+        if recipe.is_user_recipe and recipe.user_id == user_id:
+            data['user_recipes'].append(recipe_dict)
+
+    data.update({
+        'authenticated': True,
+        'user': current_user.to_dict(),
+        'favorites': favorites,
+        'liked': liked,
+        'ingredients': sorted(set(COMMON_INGREDIENTS) | set(pantry))
+    })
+    return jsonify(data)
+
+
 # ========== API ПОИСКА ПО ФОТО ==========
 
 @app.route('/api/photo-search', methods=['POST'])
@@ -1670,14 +2190,17 @@ def photo_search():
     file.save(filepath)
 
     try:
-        product_stats, detections = detect_products(filepath, confidence_threshold=0.25)
+        model_entry = get_model_entry()
+        model_version = model_entry['version'] if model_entry else None
+        product_stats, detections = detect_products(filepath, confidence_threshold=0.25, model_entry=model_entry)
 
         if "error" in product_stats:
             return jsonify({
                 'success': False,
                 'message': product_stats["error"],
                 'detected_products': [],
-                'recipes': []
+                'recipes': [],
+                'model_version': model_version
             })
 
         if "message" in product_stats:
@@ -1687,7 +2210,8 @@ def photo_search():
                 'detected_products': [],
                 'recipes': [],
                 'total_products': 0,
-                'total_recipes': 0
+                'total_recipes': 0,
+                'model_version': model_version
             })
 
         if not product_stats:
@@ -1697,11 +2221,12 @@ def photo_search():
                 'detected_products': [],
                 'recipes': [],
                 'total_products': 0,
-                'total_recipes': 0
+                'total_recipes': 0,
+                'model_version': model_version
             })
 
         search_products = list(product_stats.keys())
-        matching_recipes = find_recipes_by_products(search_products)
+        matching_recipes = find_recipes_by_products(search_products, model_entry.get('synonyms'))
 
         formatted_recipes = []
         for match in matching_recipes:
@@ -1730,7 +2255,8 @@ def photo_search():
             'detected_products': formatted_products,
             'recipes': formatted_recipes,
             'total_products': len(formatted_products),
-            'total_recipes': len(formatted_recipes)
+            'total_recipes': len(formatted_recipes),
+            'model_version': model_version
         })
 
     finally:
@@ -1745,36 +2271,46 @@ def photo_search():
 @json_response
 def update_profile():
     data = request.json
+    user = db.session.get(User, current_user.id)
 
     if 'username' in data:
         username = data['username'].strip()
-        if username and username != current_user.username:
+        if username and username != user.username:
             if User.query.filter_by(username=username).first():
                 return jsonify({'error': 'Пользователь с таким именем уже существует'}), 400
-            current_user.username = username
+            user.username = username
 
     if 'avatar' in data:
         avatar = data['avatar'].strip()
         if avatar:
-            current_user.avatar = avatar
+            user.avatar = avatar
 
     db.session.commit()
-    return jsonify({'success': True, 'user': current_user.to_dict()})
+    user_cache.invalidate(user.id)
+    return jsonify({'success': True, 'user': user.to_dict()})
 
 
 @app.route('/api/profile/stats')
 @login_required
 @json_response
 def get_profile_stats():
-    recipes_count = Recipe.query.filter_by(user_id=current_user.id).count()
-    favorites_count = Favorite.query.filter_by(user_id=current_user.id).count()
-    ingredients_count = UserIngredient.query.filter_by(user_id=current_user.id).count()
+    return jsonify(profile_stats_cache.get(current_user.id, _load_profile_stats))
 
-    return jsonify({
-        'recipes_count': recipes_count,
-        'favorites_count': favorites_count,
-        'ingredients_count': ingredients_count
-    })
+
+def _load_profile_stats(user_id):
+    """Все счетчики профиля одним запросом из скалярных подзапросов"""
+    row = db.session.execute(select(
+        select(func.count(Recipe.id)).where(Recipe.user_id == user_id)
+        .scalar_subquery().label('recipes_count'),
+        select(func.count(Favorite.id)).where(Favorite.user_id == user_id)
+        .scalar_subquery().label('favorites_count'),
+        select(func.count(UserIngredient.id)).where(UserIngredient.user_id == user_id)
+        .scalar_subquery().label('ingredients_count'),
+        # likes_count рецептов поддерживается в like_recipe, считать строки likes не нужно
+        select(func.coalesce(func.sum(Recipe.likes_count), 0)).where(Recipe.user_id == user_id)
+        .scalar_subquery().label('likes_received')
+    )).one()
+    return dict(row._mapping)
 
 
 # ========== API СТАТУСОВ ==========
@@ -1782,21 +2318,23 @@ def get_profile_stats():
 @app.route('/api/model-status')
 @json_response
 def model_status():
-    model, class_names = get_model()
+    entry = model_registry.active()
+    registry_status = model_registry.status()
 
-    if model is None:
+    if entry is None:
         return jsonify({
             'loaded': False,
             'message': 'Модель не загружена',
             'class_count': 0,
             'device': 'none',
             'classes': [],
-            'is_demo': False
+            'is_demo': False,
+            'registry': registry_status
         })
 
+    model, class_names = entry['model'], entry['class_names']
     device = next(model.model.parameters()).device.type if hasattr(model, 'model') else 'cpu'
-    model_size = os.path.getsize(MODEL_PATH) if os.path.exists(MODEL_PATH) else 0
-    is_demo = model_size < 1024
+    is_demo = entry['is_demo']
 
     return jsonify({
         'loaded': True,
@@ -1804,10 +2342,57 @@ def model_status():
         'class_count': len(class_names) if class_names else 0,
         'device': device,
         'is_demo': is_demo,
-        'classes': class_names if class_names else []
+        'classes': class_names if class_names else [],
+        'model_version': entry['version'],
+        'registry': registry_status
     })
 
 
+@app.route('/api/models')
+@login_required
+@json_response
+def list_models():
+    if not current_user.is_admin:
+        return jsonify({'error': 'Доступ запрещен'}), 403
+    return jsonify(model_registry.status())
+
+
+@app.route('/api/models/activate', methods=['POST'])
+@login_required
+@json_response
+def activate_model():
+    """Переключает активную модель и долю трафика для модели-кандидата"""
+    if not current_user.is_admin:
+        return jsonify({'error': 'Доступ запрещен'}), 403
+
+    data = request.get_json(silent=True) or {}
+    version = data.get('version')
+    if not isinstance(version, str) or not version.strip():
+        return jsonify({'error': 'Не указана версия'}), 400
+
+    candidate = data.get('candidate') or None
+    if candidate is not None and not isinstance(candidate, str):
+        return jsonify({'error': 'Версия кандидата должна быть строкой'}), 400
+
+    try:
+        candidate_percent = float(data.get('candidate_percent', 0) or 0)
+    except (TypeError, ValueError):
+        candidate_percent = None
+    if candidate_percent is None or not 0 <= candidate_percent <= 100:
+        return jsonify({'error': 'candidate_percent должен быть числом от 0 до 100'}), 400
+
+    try:
+        model_registry.activate(
+            version.strip(),
+            candidate=candidate.strip() if candidate else None,
+            candidate_percent=candidate_percent
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 404
+
+    return jsonify({'success': True, **model_registry.status()})
+
+
 @app.route('/api/db-status')
 @json_response
 def db_status():
@@ -1845,25 +2430,29 @@ def db_migrate():
 @app.route('/api/quick-test', methods=['POST'])
 @json_response
 def quick_test():
-    model, class_names = get_model()
+    entry = model_registry.active()
 
-    if model is None:
+    if entry is None:
         return jsonify({'success': False, 'error': 'Модель не загружена'})
 
+    import cv2
+    import numpy as np
+
     test_path = os.path.join(UPLOAD_FOLDER, 'test_image.jpg')
     test_image = np.zeros((640, 640, 3), dtype=np.uint8)
     cv2.putText(test_image, 'Test Image', (200, 320), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
     cv2.imwrite(test_path, test_image)
 
     try:
-        product_stats, detections = detect_products(test_path, confidence_threshold=0.1)
+        product_stats, detections = detect_products(test_path, confidence_threshold=0.1, model_entry=entry)
         return jsonify({
             'success': True,
             'model_working': 'error' not in product_stats and 'message' not in product_stats,
             'detections_count': len(detections),
             'product_stats': product_stats,
-            'class_count': len(class_names) if class_names else 0,
-            'is_demo': os.path.getsize(MODEL_PATH) < 1024 if os.path.exists(MODEL_PATH) else True
+            'class_count': len(entry['class_names']),
+            'is_demo': entry['is_demo'],
+            'model_version': entry['version']
         })
     finally:
         if os.path.exists(test_path):
@@ -1891,17 +2480,83 @@ def test_search():
     })
 
 
-# ========== ЗАПУСК ПРИЛОЖЕНИЯ ==========
+# ========== ФАБРИКА ПРИЛОЖЕНИЯ ==========
 
-if __name__ == '__main__':
+def preload_models():
+    """Загружает модели заранее, до форка воркеров
+
+    Веса остаются в памяти мастер-процесса и делятся с воркерами по
+    copy-on-write. Инференс здесь не запускается: пул потоков torch,
+    созданный до fork, в дочерних процессах может зависнуть.
+    """
+    entry = model_registry.active()
+    if entry:
+        logger.info('Модель детекции %s предзагружена', entry['version'])
+    else:
+        logger.warning('Модель детекции продуктов НЕ загружена')
+
+    classifier, _ = get_classifier()
+    if classifier is not None:
+        logger.info('Классификатор предзагружен')
+
+
+def _after_fork_in_child():
+    """Воркер после fork: свои соединения с БД и свои настройки потоков torch"""
     with app.app_context():
-        # Создаем таблицы
-        db.create_all()
-        print("✅ Таблицы базы данных созданы")
+        # close=False - не закрываем соединения, которыми продолжает пользоваться родитель
+        db.engine.dispose(close=False)
+
+    if 'torch' in sys.modules:
+        from model import cpu_profile_from_env, configure_cpu_threads
+        profile = cpu_profile_from_env()
+        configure_cpu_threads(profile['intra_op_threads'], profile['inter_op_threads'])
 
-        # Создаем шаблоны ошибок
+
+_app_initialized = False
+
+
+def create_app(config=None):
+    """Готовит приложение к работе: конфигурация, папки, таблицы, модели
+
+    Маршруты регистрируются на модульном app при импорте, фабрика лишь
+    применяет настройки и выполняет побочные эффекты запуска. Используется
+    точкой входа wsgi.py (gunicorn) и режимом разработки.
+    """
+    global _app_initialized
+
+    if config:
+        app.config.update(config)
+
+    if _app_initialized:
+        return app
+
+    for folder in (DATA_FOLDER, UPLOAD_FOLDER, RECIPE_IMAGES_FOLDER, MODEL_FOLDER):
+        os.makedirs(folder, exist_ok=True)
+
+    if not os.environ.get('SECRET_KEY') and int(os.environ.get('WEB_CONCURRENCY', 1)) > 1:
+        logger.warning('SECRET_KEY не задан: без preload_app у каждого воркера будет свой ключ и сессии сломаются')
+
+    with app.app_context():
+        db.create_all()
         create_error_templates()
 
+    if app.config['PRELOAD_MODELS']:
+        preload_models()
+
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=_after_fork_in_child)
+
+    _app_initialized = True
+    return app
+
+
+# ========== ЗАПУСК ПРИЛОЖЕНИЯ ==========
+
+if __name__ == '__main__':
+    create_app()
+    print("✅ Таблицы базы данных созданы")
+
+    with app.app_context():
         # Проверяем наличие рецептов
         recipes_count = Recipe.query.count()
         if recipes_count == 0:
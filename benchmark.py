@@ -0,0 +1,744 @@
+# benchmark.py
+import os
+import sys
+import json
+import time
+import random
+import logging
+import importlib.util
+import threading
+import statistics
+import subprocess
+import tracemalloc
+from io import BytesIO
+from types import SimpleNamespace
+from datetime import datetime
+
+# Бенчмарки работают с отдельной базой, чтобы не засорять рабочую
+_basedir = os.path.abspath(os.path.dirname(__file__))
+BENCH_RESULTS_FOLDER = os.path.join(_basedir, 'data', 'benchmarks')
+os.makedirs(BENCH_RESULTS_FOLDER, exist_ok=True)
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(BENCH_RESULTS_FOLDER, 'bench.db'))
+
+from sqlalchemy import insert, select
+from werkzeug.security import generate_password_hash
+from app import app, create_app, migrate_recipes_from_json
+from models import db, User, Recipe, Like, Favorite
+import metrics
+
+# Эндпоинты с крупными JSON-ответами
+COMPRESSION_ENDPOINTS = [
+    '/api/all-recipes',
+    '/api/recipes',
+    '/api/test-search'
+]
+
+
+def save_results(name, results):
+    """Сохраняет результаты бенчмарка в data/benchmarks/<name>.json"""
+    path = os.path.join(BENCH_RESULTS_FOLDER, f'{name}.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'benchmark': name,
+            'created_at': datetime.utcnow().isoformat(),
+            'results': results
+        }, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 Результаты сохранены: {path}")
+
+
+def ensure_recipes():
+    create_app()
+    with app.app_context():
+        if Recipe.query.count() == 0:
+            migrate_recipes_from_json()
+
+
+def bench_compression(repeat=20):
+    """Размер и время ответа API без сжатия, с gzip и с brotli"""
+    ensure_recipes()
+    client = app.test_client()
+    results = []
+
+    print(f"{'Эндпоинт':<22} {'Кодировка':<10} {'Байт':>10} {'Сжатие':>8} {'мс':>8}")
+    print("-" * 62)
+
+    for endpoint in COMPRESSION_ENDPOINTS:
+        raw_size = None
+        for encoding in ('identity', 'gzip', 'br'):
+            headers = {'Accept': 'application/json', 'Accept-Encoding': encoding}
+
+            start = time.perf_counter()
+            for _ in range(repeat):
+                response = client.get(endpoint, headers=headers)
+            elapsed_ms = (time.perf_counter() - start) * 1000 / repeat
+
+            size = len(response.get_data())
+            used = response.headers.get('Content-Encoding', 'identity')
+            if encoding == 'identity':
+                raw_size = size
+            if used != encoding:
+                # Например, brotli не установлен - отдельной строки не нужно
+                continue
+
+            ratio = raw_size / size if size else 0
+            results.append({
+                'endpoint': endpoint,
+                'encoding': used,
+                'bytes': size,
+                'uncompressed_bytes': raw_size,
+                'ratio': round(ratio, 2),
+                'avg_ms': round(elapsed_ms, 2)
+            })
+            print(f"{endpoint:<22} {used:<10} {size:>10} {ratio:>7.2f}x {elapsed_ms:>8.2f}")
+
+    save_results('compression', results)
+    return results
+
+
+def seed_recipes(count, batch_size=5000):
+    """Догружает в базу синтетический каталог (catalog_generator) до count рецептов"""
+    from catalog_generator import load_catalog
+
+    create_app()
+    with app.app_context():
+        existing = Recipe.query.count()
+        if existing >= count:
+            return existing
+
+        print(f"🌱 Добавляем {count - existing} синтетических рецептов...")
+        load_catalog(count - existing, batch_size=batch_size, seed=existing)
+        return count
+
+
+def seed_users(count, batch_size=5000):
+    """Догружает пользователей bench_user_<n> с паролем BENCH_PASSWORD"""
+    create_app()
+    with app.app_context():
+        existing = User.query.filter(User.username.like('bench_user_%')).count()
+        if existing >= count:
+            return existing
+
+        print(f"🌱 Добавляем {count - existing} пользователей...")
+        # Хеш пароля считаем один раз - он намеренно медленный
+        password_hash = generate_password_hash(BENCH_PASSWORD)
+        now = datetime.utcnow()
+        for start in range(existing + 1, count + 1, batch_size):
+            db.session.execute(insert(User), [{
+                'username': f'bench_user_{n}',
+                'email': f'bench_user_{n}@example.com',
+                'password_hash': password_hash,
+                'is_active': True,
+                'is_admin': False,
+                'created_at': now
+            } for n in range(start, min(start + batch_size, count + 1))])
+        db.session.commit()
+        return count
+
+
+def _seed_pairs(model, count, batch_size=20000):
+    """Догружает случайные уникальные пары (пользователь, рецепт) в likes/favorites"""
+    existing_pairs = set(db.session.execute(select(model.user_id, model.recipe_id)).all())
+    if len(existing_pairs) >= count:
+        return len(existing_pairs)
+
+    user_ids = db.session.scalars(select(User.id).where(User.username.like('bench_user_%'))).all()
+    recipe_ids = db.session.scalars(select(Recipe.id)).all()
+    count = min(count, len(user_ids) * len(recipe_ids))
+
+    now = datetime.utcnow()
+    new_pairs = []
+    pairs = set(existing_pairs)
+    while len(pairs) < count:
+        pair = (random.choice(user_ids), random.choice(recipe_ids))
+        if pair not in pairs:
+            pairs.add(pair)
+            new_pairs.append(pair)
+
+    for start in range(0, len(new_pairs), batch_size):
+        db.session.execute(insert(model), [
+            {'user_id': user_id, 'recipe_id': recipe_id, 'created_at': now}
+            for user_id, recipe_id in new_pairs[start:start + batch_size]
+        ])
+    db.session.commit()
+    return count
+
+
+def seed_api_dataset(scale):
+    """Синтетическая база заданного масштаба: рецепты, пользователи, лайки, избранное"""
+    sizes = API_SCALES[scale]
+    ensure_recipes()
+    seed_recipes(sizes['recipes'])
+    seed_users(sizes['users'])
+
+    with app.app_context():
+        print("🌱 Лайки и избранное...")
+        _seed_pairs(Like, sizes['likes'])
+        _seed_pairs(Favorite, sizes['favorites'])
+        # Счетчики лайков должны совпадать с таблицей likes
+        db.session.execute(db.text(
+            'UPDATE recipes SET likes_count = (SELECT COUNT(*) FROM likes WHERE likes.recipe_id = recipes.id)'))
+        db.session.commit()
+
+        return {
+            'recipes': Recipe.query.count(),
+            'users': User.query.count(),
+            'likes': Like.query.count(),
+            'favorites': Favorite.query.count()
+        }
+
+
+def bench_memory(count=100000):
+    """Пиковая память /api/all-recipes: полный список против потоковой отдачи"""
+    seed_recipes(count)
+    client = app.test_client()
+    results = []
+
+    for mode, stream in (('list', '0'), ('stream', '1')):
+        headers = {'Accept': 'application/json', 'Accept-Encoding': 'identity'}
+        tracemalloc.start()
+        start = time.perf_counter()
+
+        response = client.get(f'/api/all-recipes?stream={stream}', headers=headers, buffered=False)
+        total_bytes = 0
+        for chunk in response.response:
+            total_bytes += len(chunk)
+        response.close()
+
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        results.append({
+            'mode': mode,
+            'recipes': count,
+            'bytes': total_bytes,
+            'peak_mb': round(peak / (1024 * 1024), 1),
+            'seconds': round(elapsed, 2)
+        })
+        print(f"  {mode:<8} пик памяти: {peak / (1024 * 1024):8.1f} MB, "
+              f"{total_bytes} байт за {elapsed:.2f} с")
+
+    save_results('memory', results)
+    return results
+
+
+def _per_image_ms(func, images, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(images)
+    return (time.perf_counter() - start) * 1000 / (repeat * len(images))
+
+
+def bench_preprocess(count=32):
+    """Стоимость предобработки одного изображения для классификатора"""
+    import numpy as np
+    from PIL import Image
+    from model import VegetableClassifier, VAL_TRANSFORM, preprocess_image, preprocess_batch
+
+    rng = np.random.default_rng(0)
+    images = [Image.fromarray(rng.integers(0, 255, (480, 640, 3), dtype=np.uint8)) for _ in range(count)]
+
+    def legacy(batch):
+        # Как было раньше: новая EfficientNet ради val_transform на каждый вызов
+        for image in batch:
+            VegetableClassifier(pretrained=False).val_transform(image).unsqueeze(0)
+
+    cases = [
+        ('transform_only', lambda batch: [VAL_TRANSFORM(image) for image in batch], images),
+        ('preprocess_image', lambda batch: [preprocess_image(image) for image in batch], images),
+        ('preprocess_batch', preprocess_batch, images),
+        ('legacy_per_call_model', legacy, images[:4])
+    ]
+
+    results = []
+    for name, func, batch in cases:
+        ms = _per_image_ms(func, batch)
+        results.append({'case': name, 'images': len(batch), 'ms_per_image': round(ms, 3)})
+        print(f"  {name:<24} {ms:10.3f} мс/изобр.")
+
+    save_results('preprocess', results)
+    return results
+
+
+def bench_inference(batch_size=16, repeat=5):
+    """Матрица CPU-настроек классификатора: потоки x channels_last x точность -> изобр./с"""
+    import torch
+    from model import VegetableClassifier, configure_cpu_threads, optimize_for_cpu, PRECISIONS
+
+    cpu_count = os.cpu_count() or 1
+    thread_options = sorted({1, 2, 4, cpu_count} & set(range(1, cpu_count + 1)))
+    batch = torch.randn(batch_size, 3, 224, 224)
+    state_dict = VegetableClassifier(pretrained=False).state_dict()
+    results = []
+
+    print(f"{'Потоки':>7} {'channels_last':>14} {'Точность':>9} {'изобр./с':>10}")
+    print("-" * 44)
+
+    for threads in thread_options:
+        configure_cpu_threads(threads)
+        for channels_last in (False, True):
+            for precision in PRECISIONS:
+                model = VegetableClassifier(pretrained=False)
+                model.load_state_dict(state_dict)
+                try:
+                    model = optimize_for_cpu(model, channels_last, precision)
+                    model.predict_batch(batch[:2])  # прогрев
+
+                    start = time.perf_counter()
+                    for _ in range(repeat):
+                        model.predict_batch(batch, batch_size=batch_size)
+                    images_per_sec = batch_size * repeat / (time.perf_counter() - start)
+                except (RuntimeError, NotImplementedError) as e:
+                    print(f"{threads:>7} {str(channels_last):>14} {precision:>9}   не поддерживается: {e}")
+                    continue
+
+                results.append({
+                    'threads': threads,
+                    'channels_last': channels_last,
+                    'precision': precision,
+                    'images_per_sec': round(images_per_sec, 2)
+                })
+                print(f"{threads:>7} {str(channels_last):>14} {precision:>9} {images_per_sec:>10.2f}")
+
+    save_results('inference', results)
+    return results
+
+
+# Модули, время импорта которых отслеживаем: веб-приложение и скрипты
+IMPORT_TARGETS = ['app', 'models', 'migrate_db', 'migrate_auth', 'fix_models', 'model']
+
+
+def _parse_importtime(stderr, module):
+    """Разбирает вывод python -X importtime
+
+    Возвращает общее время импорта модуля (мкс) и список его прямых
+    зависимостей [(имя, cumulative мкс), ...].
+    """
+    entries = []
+    for line in stderr.splitlines():
+        parts = line.split('|')
+        if not line.startswith('import time:') or len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2][1:]
+        depth = (len(name) - len(name.lstrip(' '))) // 2
+        entries.append((depth, name.strip(), int(parts[1])))
+
+    for index in range(len(entries) - 1, -1, -1):
+        depth, name, cumulative = entries[index]
+        if depth == 0 and name == module:
+            children = []
+            for child_depth, child_name, child_cumulative in reversed(entries[:index]):
+                if child_depth == 0:
+                    break
+                if child_depth == 1:
+                    children.append((child_name, child_cumulative))
+            return cumulative, children
+    return 0, []
+
+
+def bench_importtime(modules=None):
+    """Время импорта приложения и скриптов (python -X importtime)"""
+    results = []
+    for module in modules or IMPORT_TARGETS:
+        proc = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+            cwd=_basedir, capture_output=True, text=True
+        )
+        if proc.returncode != 0:
+            print(f"  {module:<14} ❌ ошибка импорта: {proc.stderr.strip().splitlines()[-1]}")
+            continue
+
+        total_us, children = _parse_importtime(proc.stderr, module)
+        heaviest = sorted(children, key=lambda item: item[1], reverse=True)[:5]
+
+        results.append({
+            'module': module,
+            'total_ms': round(total_us / 1000, 1),
+            'heaviest': [{'module': name, 'ms': round(us / 1000, 1)} for name, us in heaviest]
+        })
+        print(f"  {module:<14} {total_us / 1000:9.1f} мс  " +
+              ', '.join(f"{name} {us / 1000:.0f}" for name, us in heaviest))
+
+    save_results('importtime', results)
+    return results
+
+
+def _wait_for_server(url, timeout=60):
+    import requests
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return True
+        except requests.RequestException:
+            time.sleep(0.3)
+    return False
+
+
+def _drive_load(url, clients, duration):
+    """Нагружает url из clients потоков duration секунд; возвращает (запросов, ошибок)"""
+    import requests
+    from concurrent.futures import ThreadPoolExecutor
+
+    deadline = time.time() + duration
+
+    def client():
+        done = errors = 0
+        with requests.Session() as http:
+            http.headers['Accept'] = 'application/json'
+            while time.time() < deadline:
+                try:
+                    if http.get(url, timeout=30).status_code == 200:
+                        done += 1
+                    else:
+                        errors += 1
+                except requests.RequestException:
+                    errors += 1
+        return done, errors
+
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        totals = list(executor.map(lambda _: client(), range(clients)))
+    return sum(t[0] for t in totals), sum(t[1] for t in totals)
+
+
+def bench_load(worker_counts=(1, 2, 4), worker_classes=('sync', 'gthread'),
+               clients=16, duration=10, endpoint='/api/recipes?stream=0', port=5055):
+    """Пропускная способность gunicorn в зависимости от числа и типа воркеров"""
+    ensure_recipes()
+    url = f'http://127.0.0.1:{port}{endpoint}'
+    results = []
+
+    print(f"{'Класс':<8} {'Воркеры':>8} {'запр./с':>10} {'Ошибки':>8}")
+    print("-" * 38)
+
+    for worker_class in worker_classes:
+        for workers in worker_counts:
+            env = dict(os.environ, PORT=str(port), WEB_CONCURRENCY=str(workers),
+                       GUNICORN_WORKER_CLASS=worker_class, PRELOAD_MODELS='false')
+            server = subprocess.Popen(
+                [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+                 '--access-logfile', '/dev/null', '--error-logfile', '/dev/null', 'wsgi:app'],
+                cwd=_basedir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+            try:
+                if not _wait_for_server(url):
+                    print(f"{worker_class:<8} {workers:>8}   ❌ сервер не запустился")
+                    continue
+                done, errors = _drive_load(url, clients, duration)
+            finally:
+                server.terminate()
+                server.wait(timeout=30)
+
+            rps = done / duration
+            results.append({
+                'worker_class': worker_class,
+                'workers': workers,
+                'clients': clients,
+                'endpoint': endpoint,
+                'requests_per_sec': round(rps, 1),
+                'errors': errors
+            })
+            print(f"{worker_class:<8} {workers:>8} {rps:>10.1f} {errors:>8}")
+
+    save_results('load', results)
+    return results
+
+
+# ---------- бенчмарк API ----------
+
+API_SCALES = {
+    'small': {'recipes': 1000, 'users': 50, 'likes': 5000, 'favorites': 2000},
+    'medium': {'recipes': 10000, 'users': 500, 'likes': 50000, 'favorites': 20000},
+    'large': {'recipes': 100000, 'users': 5000, 'likes': 500000, 'favorites': 200000}
+}
+BENCH_PASSWORD = 'bench-password'
+# Допустимый рост p95 относительно базовой линии, прежде чем считать это регрессией
+API_REGRESSION_TOLERANCE = float(os.environ.get('BENCH_REGRESSION_TOLERANCE', 0.2))
+
+
+class StubDetector:
+    """Заглушка YOLO: фиксированные боксы без нейросети
+
+    Позволяет мерить обвязку поиска по фото (загрузка, декодирование,
+    подбор рецептов) отдельно от инференса.
+    """
+
+    def __init__(self, class_count, boxes=3):
+        self.class_count = class_count
+        self.boxes = boxes
+
+    def __call__(self, image, conf=0.25, imgsz=640, verbose=False):
+        height, width = image.shape[:2]
+        step = max(1, width // (self.boxes + 1))
+        boxes = [SimpleNamespace(conf=[0.9], cls=[i % self.class_count],
+                                 xyxy=[(i * step, 0, (i + 1) * step, height)])
+                 for i in range(self.boxes)]
+        return [SimpleNamespace(boxes=boxes, speed={'preprocess': 0.0, 'inference': 0.0, 'postprocess': 0.0})]
+
+
+def install_stub_detector():
+    """Подменяет реестр моделей приложения реестром с одной заглушкой"""
+    import app as app_module
+    from class_metadata import DEMO_CLASS_NAMES, synonym_index
+    from model_registry import ModelRegistry, DETECTOR_FILENAME
+
+    folder = os.path.join(BENCH_RESULTS_FOLDER, 'stub_model')
+    os.makedirs(folder, exist_ok=True)
+    open(os.path.join(folder, DETECTOR_FILENAME), 'ab').close()
+
+    def load_stub(version_folder):
+        return {
+            'model': StubDetector(len(DEMO_CLASS_NAMES)),
+            'class_names': DEMO_CLASS_NAMES,
+            'synonyms': synonym_index(),
+            'path': os.path.join(version_folder, DETECTOR_FILENAME),
+            'size': 0,
+            'is_demo': False
+        }
+
+    app_module.model_registry = ModelRegistry(folder, load_stub, default_version='default')
+
+
+def _bench_photo():
+    """JPEG для поиска по фото или None, если нет библиотек пайплайна детекции"""
+    if any(importlib.util.find_spec(name) is None for name in ('cv2', 'torch', 'PIL')):
+        return None
+
+    from PIL import Image
+
+    image = Image.effect_noise((640, 480), 64).convert('RGB')
+    buffer = BytesIO()
+    image.save(buffer, format='JPEG', quality=85)
+    return buffer.getvalue()
+
+
+class _ClientDriver:
+    """Запросы через тестовый клиент Flask (без сети)"""
+
+    def __init__(self):
+        self.client = app.test_client()
+
+    def request(self, method, url, json=None, files=None):
+        data = None
+        if files:
+            data = {field: (BytesIO(content), name, mimetype) for field, (name, content, mimetype) in files.items()}
+        response = self.client.open(url, method=method, json=json, data=data,
+                                    headers={'Accept': 'application/json'})
+        response.get_data()
+        response.close()
+        return response.status_code
+
+
+class _ServerDriver:
+    """Запросы по HTTP к локальному серверу werkzeug в этом же процессе"""
+
+    def __init__(self, base_url):
+        import requests
+        self.base_url = base_url
+        self.session = requests.Session()
+        self.session.headers['Accept'] = 'application/json'
+
+    def request(self, method, url, json=None, files=None):
+        response = self.session.request(method, self.base_url + url, json=json, files=files)
+        return response.status_code
+
+
+def _api_scenarios(recipe_ids, photo):
+    """Сценарии: (имя, метод, url(), аргументы запроса())"""
+    scenarios = [
+        ('recipes', 'GET', lambda: '/api/recipes', dict),
+        ('all_recipes_stream', 'GET', lambda: '/api/all-recipes', dict),
+        ('all_recipes_full', 'GET', lambda: '/api/all-recipes?stream=0', dict),
+        ('search', 'GET', lambda: '/api/test-search', dict),
+        ('like_toggle', 'POST', lambda: f'/api/recipe/{random.choice(recipe_ids)}/like', dict),
+        ('likes_info', 'GET', lambda: f'/api/recipe/{random.choice(recipe_ids)}/likes', dict),
+        ('favorite_toggle', 'POST', lambda: '/api/favorites',
+         lambda: {'json': {'recipeId': random.choice(recipe_ids)}}),
+        ('favorites', 'GET', lambda: '/api/favorites', dict)
+    ]
+    if photo:
+        scenarios.append(('photo_search', 'POST', lambda: '/api/photo-search',
+                          lambda: {'files': {'file': ('bench.jpg', photo, 'image/jpeg')}}))
+    return scenarios
+
+
+def _percentile_summary(latencies_ms):
+    if len(latencies_ms) < 2:
+        value = latencies_ms[0] if latencies_ms else 0.0
+        return value, value, value
+    cuts = statistics.quantiles(latencies_ms, n=100, method='inclusive')
+    return cuts[49], cuts[94], cuts[98]
+
+
+def run_api_scenarios(driver, scenarios, requests_per_scenario, warmup=3):
+    results = []
+
+    print(f"{'Сценарий':<20} {'p50':>8} {'p95':>8} {'p99':>8} {'запр./с':>9} {'SQL/запр.':>10} {'Ошибки':>7}")
+    print("-" * 76)
+
+    for name, method, make_url, make_kwargs in scenarios:
+        for _ in range(warmup):
+            driver.request(method, make_url(), **make_kwargs())
+
+        latencies = []
+        errors = 0
+        queries_before = metrics.DB_QUERIES.value()
+        started = time.perf_counter()
+        for _ in range(requests_per_scenario):
+            url, kwargs = make_url(), make_kwargs()
+            start = time.perf_counter()
+            status = driver.request(method, url, **kwargs)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if status >= 400:
+                errors += 1
+        elapsed = time.perf_counter() - started
+        queries = (metrics.DB_QUERIES.value() - queries_before) / requests_per_scenario
+
+        p50, p95, p99 = _percentile_summary(latencies)
+        results.append({
+            'scenario': name,
+            'requests': requests_per_scenario,
+            'p50_ms': round(p50, 2),
+            'p95_ms': round(p95, 2),
+            'p99_ms': round(p99, 2),
+            'requests_per_sec': round(requests_per_scenario / elapsed, 1),
+            'queries_per_request': round(queries, 2),
+            'errors': errors
+        })
+        print(f"{name:<20} {p50:>8.1f} {p95:>8.1f} {p99:>8.1f} "
+              f"{requests_per_scenario / elapsed:>9.1f} {queries:>10.1f} {errors:>7}")
+
+    return results
+
+
+def compare_with_baseline(results, baseline):
+    """Возвращает список регрессий: рост p95 сверх допуска или больше SQL-запросов"""
+    base_by_name = {item['scenario']: item for item in baseline['results']}
+    regressions = []
+
+    print(f"\n📏 Сравнение с базовой линией от {baseline['created_at']} (допуск p95 {API_REGRESSION_TOLERANCE:.0%})")
+    for item in results:
+        base = base_by_name.get(item['scenario'])
+        if not base:
+            continue
+
+        problems = []
+        if item['p95_ms'] > base['p95_ms'] * (1 + API_REGRESSION_TOLERANCE):
+            problems.append(f"p95 {base['p95_ms']} → {item['p95_ms']} мс")
+        if item['queries_per_request'] > base['queries_per_request'] + 0.5:
+            problems.append(f"SQL {base['queries_per_request']} → {item['queries_per_request']}")
+
+        if problems:
+            regressions.append({'scenario': item['scenario'], 'problems': problems})
+            print(f"  ❌ {item['scenario']}: {', '.join(problems)}")
+        else:
+            print(f"  ✅ {item['scenario']}")
+
+    return regressions
+
+
+def bench_api(scale='small', requests_per_scenario=30, server=False, save_baseline=False, port=5056):
+    """p50/p95/p99, пропускная способность и SQL-запросы горячих эндпоинтов API"""
+    create_app({'SESSION_COOKIE_SECURE': False, 'REMEMBER_COOKIE_SECURE': False, 'PROFILE_ENABLED': False})
+    dataset = seed_api_dataset(scale)
+    print(f"📦 Данные ({scale}): {dataset}")
+
+    install_stub_detector()
+    photo = _bench_photo()
+    if photo is None:
+        print("⚠️ Нет opencv-python/torch/Pillow - сценарий поиска по фото пропущен")
+
+    with app.app_context():
+        recipe_ids = db.session.scalars(select(Recipe.id)).all()
+
+    http_server = None
+    if server:
+        from werkzeug.serving import make_server
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+        http_server = make_server('127.0.0.1', port, app, threaded=True)
+        threading.Thread(target=http_server.serve_forever, daemon=True).start()
+        driver = _ServerDriver(f'http://127.0.0.1:{port}')
+    else:
+        driver = _ClientDriver()
+
+    try:
+        status = driver.request('POST', '/api/auth/login',
+                                json={'login': 'bench_user_1', 'password': BENCH_PASSWORD})
+        if status != 200:
+            print(f"❌ Не удалось войти под bench_user_1 (HTTP {status})")
+            return None
+
+        print(f"\n🚀 Режим: {'локальный сервер' if server else 'тестовый клиент'}, "
+              f"запросов на сценарий: {requests_per_scenario}\n")
+        results = run_api_scenarios(driver, _api_scenarios(recipe_ids, photo), requests_per_scenario)
+    finally:
+        if http_server is not None:
+            http_server.shutdown()
+
+    mode = 'server' if server else 'client'
+    name = f'api-{scale}-{mode}'
+    save_results(name, {'dataset': dataset, 'scenarios': results})
+
+    baseline_path = os.path.join(BENCH_RESULTS_FOLDER, f'{name}-baseline.json')
+    if save_baseline:
+        with open(baseline_path, 'w', encoding='utf-8') as f:
+            json.dump({'created_at': datetime.utcnow().isoformat(), 'dataset': dataset, 'results': results},
+                      f, ensure_ascii=False, indent=2)
+        print(f"📌 Базовая линия сохранена: {baseline_path}")
+        return results, []
+
+    if not os.path.exists(baseline_path):
+        print("ℹ️  Базовой линии нет - сохраните её флагом --save-baseline")
+        return results, []
+
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    # Лайки и избранное сценарии сами меняют, сравниваем только размер каталога
+    base_dataset = baseline.get('dataset') or {}
+    if any(base_dataset.get(key) != dataset[key] for key in ('recipes', 'users')):
+        print(f"⚠️ Данные отличаются от базовой линии: {baseline.get('dataset')}")
+    return results, compare_with_baseline(results, baseline)
+
+
+def bench_api_cli(args):
+    """python benchmark.py --api [small|medium|large] [--server] [--requests N] [--save-baseline]"""
+    requests_per_scenario = 30
+    if '--requests' in args:
+        requests_per_scenario = int(args[args.index('--requests') + 1])
+
+    outcome = bench_api(
+        scale=next((arg for arg in args if arg in API_SCALES), 'small'),
+        requests_per_scenario=requests_per_scenario,
+        server='--server' in args,
+        save_baseline='--save-baseline' in args
+    )
+    if outcome is None or outcome[1]:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    print("⏱️ Cookly Benchmarks")
+    print("=" * 62)
+
+    commands = {
+        '--compression': bench_compression,
+        '--memory': bench_memory,
+        '--preprocess': bench_preprocess,
+        '--inference': bench_inference,
+        '--importtime': bench_importtime,
+        '--load': bench_load,
+        '--api': lambda: bench_api_cli(sys.argv[2:])
+    }
+
+    if len(sys.argv) > 1 and sys.argv[1] in commands:
+        commands[sys.argv[1]]()
+    else:
+        print("Доступные команды:")
+        print("  python benchmark.py --compression   - размер JSON-ответов с gzip/brotli")
+        print("  python benchmark.py --memory        - пиковая память списка из 100k рецептов")
+        print("  python benchmark.py --preprocess    - стоимость предобработки изображений")
+        print("  python benchmark.py --inference     - изобр./с для разных CPU-настроек")
+        print("  python benchmark.py --importtime    - время импорта приложения и скриптов")
+        print("  python benchmark.py --load          - запр./с gunicorn при 1/2/4 воркерах")
+        print("  python benchmark.py --api [small|medium|large] [--server] [--requests N] [--save-baseline]")
+        print("                                      - p50/p95/p99 и SQL-запросы API, сравнение с базовой линией")
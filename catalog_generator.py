@@ -0,0 +1,435 @@
+# catalog_generator.py
+import os
+import sys
+import json
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+from app import app, create_app, COMMON_INGREDIENTS
+from models import db, Recipe, Ingredient, Instruction
+from class_metadata import DEMO_CLASS_NAMES, load_class_metadata
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+SYNTHETIC_FOLDER = os.path.join(basedir, 'data', 'synthetic')
+MODEL_FOLDER = os.path.join(basedir, 'model')
+
+# ========== КАТАЛОГ РЕЦЕПТОВ ==========
+
+# Базовые продукты: есть почти в каждом рецепте, но в название не попадают
+STAPLES = {"Соль", "Перец", "Сахар", "Мука", "Оливковое масло", "Подсолнечное масло",
+           "Масло сливочное", "Корица", "Какао"}
+MAIN_INGREDIENTS = [name for name in COMMON_INGREDIENTS if name not in STAPLES]
+
+DISH_TYPES = ["Салат", "Суп", "Рагу", "Запеканка", "Паста", "Гратен", "Боул",
+              "Ризотто", "Пирог", "Омлет", "Плов", "Котлеты", "Крем-суп", "Жаркое"]
+DISH_STYLES = ["по-домашнему", "по-итальянски", "по-деревенски", "на скорую руку", "к ужину", ""]
+
+# Единицы измерения для продуктов, которые не взвешивают в граммах
+AMOUNTS = {
+    "Соль": ["по вкусу", "1 ч.л.", "щепотка"],
+    "Перец": ["по вкусу", "щепотка"],
+    "Сахар": ["1 ч.л.", "2 ст.л.", "100 г"],
+    "Корица": ["1 ч.л.", "щепотка"],
+    "Какао": ["2 ст.л.", "1 ст.л."],
+    "Мед": ["1 ст.л.", "2 ст.л."],
+    "Оливковое масло": ["2 ст.л.", "3 ст.л.", "50 мл"],
+    "Подсолнечное масло": ["2 ст.л.", "50 мл"],
+    "Молоко": ["200 мл", "300 мл", "500 мл"],
+    "Сливки": ["100 мл", "200 мл"],
+    "Сметана": ["2 ст.л.", "100 г"],
+    "Яйца": ["1 шт.", "2 шт.", "3 шт."],
+    "Чеснок": ["2 зубчика", "3 зубчика"],
+    "Лук репчатый": ["1 шт.", "2 шт."],
+    "Лимон": ["1/2 шт.", "1 шт."],
+    "Апельсин": ["1 шт.", "2 шт."],
+    "Авокадо": ["1 шт.", "2 шт."],
+    "Перец болгарский": ["1 шт.", "2 шт."],
+    "Петрушка": ["1 пучок", "1/2 пучка"],
+    "Укроп": ["1 пучок", "1/2 пучка"],
+    "Базилик": ["несколько листьев", "1 пучок"],
+    "Кинза": ["1 пучок"],
+    "Лук зеленый": ["1 пучок", "3 стебля"],
+    "Салат листовой": ["1 пучок"],
+}
+GRAMS = [50, 100, 150, 200, 250, 300, 400, 500]
+
+PREPARE_STEPS = [
+    "Подготовьте продукты: вымойте и обсушите {a}.",
+    "Очистите {a} и нарежьте небольшими кусочками.",
+]
+COOK_STEPS = [
+    "Нарежьте {a} кубиками, а {b} - тонкой соломкой.",
+    "Разогрейте сковороду с маслом и обжарьте {a} {minutes} минут.",
+    "Добавьте {a} и {b}, перемешайте.",
+    "Готовьте под крышкой на медленном огне {minutes} минут.",
+    "Отварите {a} в подсоленной воде до готовности.",
+    "Смешайте {a} с {b} в глубокой миске.",
+    "Выложите {a} в форму и запекайте при 180°C {minutes} минут.",
+    "Посолите и поперчите по вкусу.",
+]
+SERVE_STEPS = [
+    "Выложите на блюдо и подавайте горячим.",
+    "Подавайте, украсив зеленью.",
+    "Дайте блюду настояться {minutes} минут и подавайте.",
+]
+
+# Ссылки на фото из recipes.json - чтобы srcset строился так же, как для настоящего каталога
+_sample_images = None
+
+
+def _load_sample_images():
+    global _sample_images
+    if _sample_images is None:
+        try:
+            with open(os.path.join(basedir, 'recipes.json'), 'r', encoding='utf-8') as f:
+                _sample_images = [r['image'] for r in json.load(f) if r.get('image')]
+        except (OSError, ValueError):
+            _sample_images = []
+    return _sample_images
+
+
+def _servings(count):
+    if count == 1:
+        return "1 порция"
+    if count < 5:
+        return f"{count} порции"
+    return f"{count} порций"
+
+
+def _amount(rng, name):
+    options = AMOUNTS.get(name)
+    return rng.choice(options) if options else f"{rng.choice(GRAMS)} г"
+
+
+def generate_recipe(rng, recipe_id=None):
+    """Один рецепт в формате recipes.json"""
+    main = rng.sample(MAIN_INGREDIENTS, rng.randint(2, 6))
+    staples = rng.sample(sorted(STAPLES), rng.randint(1, 3))
+    names = main + staples
+
+    dish = rng.choice(DISH_TYPES)
+    style = rng.choice(DISH_STYLES)
+    title = f"{dish}: {main[0].lower()} и {main[1].lower()}" + (f" {style}" if style else "")
+
+    lowered = [name.lower() for name in main]
+    steps = [rng.choice(PREPARE_STEPS).format(a=', '.join(lowered[:2]))]
+    for _ in range(rng.randint(1, 6)):
+        a, b = rng.sample(lowered, 2)
+        steps.append(rng.choice(COOK_STEPS).format(a=a, b=b, minutes=rng.choice([5, 10, 15, 20, 30, 40])))
+    steps.append(rng.choice(SERVE_STEPS).format(minutes=rng.choice([5, 10, 15])))
+
+    difficulty = "Легко" if len(steps) <= 4 else "Средне" if len(steps) <= 6 else "Сложно"
+    images = _load_sample_images()
+
+    recipe = {
+        "title": title,
+        "image": rng.choice(images) if images else None,
+        "time": f"{rng.randint(2, 24) * 5 + len(steps) * 5} мин",
+        "difficulty": difficulty,
+        "calories": f"{rng.randint(12, 95) * 10} ккал",
+        "servings": _servings(rng.randint(1, 8)),
+        "ingredients": [{"name": name, "amount": _amount(rng, name)} for name in names],
+        "instructions": steps
+    }
+    if recipe_id is not None:
+        recipe = {"id": recipe_id, **recipe}
+    return recipe
+
+
+def generate_recipes(count, seed=None, start_id=1):
+    """Ленивый генератор count рецептов - каталог любого размера не держится в памяти"""
+    rng = random.Random(seed)
+    for recipe_id in range(start_id, start_id + count):
+        yield generate_recipe(rng, recipe_id)
+
+
+def write_catalog_json(path, count, seed=None):
+    """Пишет каталог в файл формата recipes.json по одному рецепту"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('[\n')
+        for n, recipe in enumerate(generate_recipes(count, seed)):
+            f.write((',\n' if n else '') + json.dumps(recipe, ensure_ascii=False))
+        f.write('\n]\n')
+    return path
+
+
+def _insert_recipes(rows):
+    """Вставляет пачку рецептов; id назначает база, возвращаются в порядке rows"""
+    if db.engine.dialect.insert_executemany_returning_sort_by_parameter_order:
+        # PostgreSQL, SQLite 3.35+: одна пачка INSERT ... RETURNING id
+        stmt = insert(Recipe).returning(Recipe.id, sort_by_parameter_order=True)
+        return db.session.execute(stmt, rows).scalars().all()
+
+    # Без RETURNING (MySQL): flush проставляет id из lastrowid
+    recipes = [Recipe(**row) for row in rows]
+    db.session.add_all(recipes)
+    db.session.flush()
+    return [recipe.id for recipe in recipes]
+
+
+def load_catalog(count, batch_size=5000, seed=None, progress=True):
+    """Загружает count синтетических рецептов в базу пачками через executemany
+
+    Вызывается внутри app.app_context(). Идентификаторы рецептов назначает
+    база (последовательность PostgreSQL продвигается как при обычной вставке),
+    ингредиенты и шаги вставляются по возвращенным id.
+    """
+    now = datetime.utcnow()
+    recipes = generate_recipes(count, seed)
+
+    loaded = 0
+    while loaded < count:
+        batch = [next(recipes) for _ in range(min(batch_size, count - loaded))]
+
+        recipe_ids = _insert_recipes([{
+            'title': recipe['title'],
+            'image': recipe['image'],
+            'time': recipe['time'],
+            'difficulty': recipe['difficulty'],
+            'calories': recipe['calories'],
+            'servings': recipe['servings'],
+            'is_user_recipe': False,
+            'author_name': 'Cookly',
+            'likes_count': 0,
+            'created_at': now - timedelta(minutes=recipe['id']),
+            'updated_at': now
+        } for recipe in batch])
+        db.session.execute(insert(Ingredient), [
+            {'recipe_id': recipe_id, 'name': ingredient['name'], 'amount': ingredient['amount']}
+            for recipe_id, recipe in zip(recipe_ids, batch) for ingredient in recipe['ingredients']
+        ])
+        db.session.execute(insert(Instruction), [
+            {'recipe_id': recipe_id, 'step_number': step_number, 'description': description}
+            for recipe_id, recipe in zip(recipe_ids, batch)
+            for step_number, description in enumerate(recipe['instructions'], 1)
+        ])
+        db.session.commit()
+
+        loaded += len(batch)
+        if progress:
+            print(f"  ✓ {loaded}/{count}")
+
+    return loaded
+
+
+# ========== СИНТЕТИЧЕСКИЕ ФОТО ХОЛОДИЛЬНИКА ==========
+
+# Как рисовать каждый класс детектора: цвета, пропорции (ширина/высота) и размер
+VEGETABLE_SHAPES = {
+    "морковь": {'colors': [(237, 118, 30), (225, 100, 20)], 'aspect': (3.0, 4.0), 'size': (90, 150)},
+    "картофель": {'colors': [(176, 132, 78), (160, 118, 70)], 'aspect': (1.2, 1.5), 'size': (55, 85)},
+    "помидор": {'colors': [(214, 42, 36), (196, 30, 30)], 'aspect': (1.0, 1.15), 'size': (55, 85)},
+    "огурец": {'colors': [(58, 118, 42), (70, 135, 50)], 'aspect': (3.2, 4.2), 'size': (100, 160)},
+    "лук": {'colors': [(205, 160, 82), (190, 140, 70)], 'aspect': (0.95, 1.1), 'size': (55, 80)},
+    "перец": {'colors': [(220, 30, 30), (240, 190, 30), (60, 150, 50)], 'aspect': (0.75, 0.9), 'size': (60, 90)},
+    "капуста": {'colors': [(165, 205, 125), (150, 195, 115)], 'aspect': (1.0, 1.1), 'size': (110, 150)},
+    "болгарский перец": {'colors': [(220, 30, 30), (240, 190, 30), (60, 150, 50)], 'aspect': (0.75, 0.9),
+                         'size': (60, 90)},
+    "фасоль": {'colors': [(120, 170, 60), (105, 155, 50)], 'aspect': (4.0, 5.5), 'size': (70, 110)},
+    "горькая тыква": {'colors': [(95, 150, 55), (80, 135, 45)], 'aspect': (2.8, 3.6), 'size': (100, 150)},
+    "бутылочная тыква": {'colors': [(170, 200, 110), (155, 190, 100)], 'aspect': (0.45, 0.6), 'size': (110, 160)},
+    "баклажан": {'colors': [(75, 35, 90), (60, 25, 75)], 'aspect': (2.0, 2.6), 'size': (100, 150)},
+    "брокколи": {'colors': [(50, 120, 45), (40, 105, 40)], 'aspect': (0.9, 1.1), 'size': (80, 120)},
+    "цветная капуста": {'colors': [(240, 235, 210), (230, 225, 195)], 'aspect': (1.0, 1.2), 'size': (100, 140)},
+    "папайя": {'colors': [(240, 165, 50), (220, 180, 60)], 'aspect': (1.5, 1.9), 'size': (100, 150)},
+    "тыква": {'colors': [(235, 125, 30), (220, 110, 25)], 'aspect': (1.15, 1.35), 'size': (120, 170)},
+    "редис": {'colors': [(200, 40, 80), (185, 30, 70)], 'aspect': (0.9, 1.05), 'size': (35, 55)},
+}
+
+# Для классов без своего описания (другая модель в model/) - нейтральный овал
+DEFAULT_SHAPE = {'colors': [(150, 160, 140), (170, 150, 120)], 'aspect': (1.0, 1.5), 'size': (60, 110)}
+
+
+def detector_classes(model_folder=MODEL_FOLDER):
+    """Классы детектора [(id, метка)] из model/classes.json; без метаданных - демо-список"""
+    metadata = load_class_metadata(model_folder)
+    if metadata:
+        return [(cls['id'], cls['label']) for cls in metadata['classes']]
+    return list(enumerate(DEMO_CLASS_NAMES))
+
+
+def _shade(color, delta):
+    return tuple(max(0, min(255, c + delta)) for c in color)
+
+
+def _draw_vegetable(draw, label, box, color, rng):
+    x1, y1, x2, y2 = box
+    width, height = x2 - x1, y2 - y1
+    draw.ellipse(box, fill=color, outline=_shade(color, -50), width=2)
+
+    if label in ("морковь", "огурец"):
+        # Поперечные полоски и хвостик
+        for i in range(1, 4):
+            x = x1 + width * i // 4
+            draw.line([(x, y1 + height // 4), (x, y2 - height // 4)], fill=_shade(color, -35), width=1)
+        if label == "морковь":
+            draw.ellipse((x1 - width // 8, y1 + height // 4, x1 + width // 10, y2 - height // 4), fill=(60, 140, 40))
+    elif label == "помидор":
+        cx = (x1 + x2) // 2
+        draw.ellipse((cx - width // 8, y1 - height // 12, cx + width // 8, y1 + height // 8), fill=(50, 120, 40))
+    elif label == "лук":
+        cx = (x1 + x2) // 2
+        draw.polygon([(cx - width // 8, y1 + height // 6), (cx + width // 8, y1 + height // 6),
+                      (cx, y1 - height // 6)], fill=_shade(color, -25))
+    elif label == "картофель":
+        for _ in range(4):
+            px, py = rng.randint(x1 + width // 5, x2 - width // 5), rng.randint(y1 + height // 5, y2 - height // 5)
+            draw.ellipse((px - 2, py - 2, px + 2, py + 2), fill=_shade(color, -45))
+    elif label == "капуста":
+        for i in range(1, 4):
+            inset_x, inset_y = width * i // 9, height * i // 9
+            draw.arc((x1 + inset_x, y1 + inset_y, x2 - inset_x, y2 - inset_y), 200, 340,
+                     fill=_shade(color, -40), width=2)
+    elif label in ("перец", "болгарский перец"):
+        cx = (x1 + x2) // 2
+        draw.rectangle((cx - 3, y1 - height // 8, cx + 3, y1 + 4), fill=(50, 110, 40))
+    elif label in ("брокколи", "цветная капуста"):
+        # Соцветия поверх основного овала
+        for _ in range(6):
+            px, py = rng.randint(x1 + width // 5, x2 - width // 5), rng.randint(y1 + height // 6, y1 + height // 2)
+            r = max(3, width // 8)
+            draw.ellipse((px - r, py - r, px + r, py + r), fill=_shade(color, rng.randint(-30, 10)))
+    elif label in ("баклажан", "редис"):
+        draw.ellipse((x1 - width // 12, y1 + height // 3, x1 + width // 8, y2 - height // 3), fill=(60, 120, 40))
+
+
+def _overlaps(box, boxes, max_iou=0.1):
+    for other in boxes:
+        ix = max(0, min(box[2], other[2]) - max(box[0], other[0]))
+        iy = max(0, min(box[3], other[3]) - max(box[1], other[1]))
+        intersection = ix * iy
+        union = (box[2] - box[0]) * (box[3] - box[1]) + (other[2] - other[0]) * (other[3] - other[1]) - intersection
+        if union and intersection / union > max_iou:
+            return True
+    return False
+
+
+def generate_fridge_image(rng, size=(640, 480), objects=(3, 9), classes=None):
+    """Рисует полки холодильника с овощами; возвращает (изображение, список объектов с bbox)
+
+    classes - [(id, метка)] как в detector_classes(), id попадают в разметку.
+    """
+    from PIL import Image, ImageDraw, ImageFilter
+
+    classes = classes or detector_classes()
+    width, height = size
+    base = rng.randint(205, 235)
+    image = Image.new('RGB', size, (base, base, base + 5))
+    draw = ImageDraw.Draw(image)
+
+    # Задняя стенка с градиентом и полки
+    for y in range(height):
+        shade = base - y * 25 // height
+        draw.line([(0, y), (width, y)], fill=(shade, shade, shade + 6))
+    shelf_count = rng.randint(2, 3)
+    shelves = [height * (i + 1) // shelf_count for i in range(shelf_count)]
+    for y in shelves:
+        draw.rectangle((0, y - 6, width, y), fill=(180, 190, 200))
+
+    placed = []
+    boxes = []
+    for _ in range(rng.randint(*objects)):
+        class_id, label = rng.choice(classes)
+        shape = VEGETABLE_SHAPES.get(label, DEFAULT_SHAPE)
+
+        for _attempt in range(20):
+            long_side = rng.randint(*shape['size']) * width // 640
+            aspect = rng.uniform(*shape['aspect'])
+            box_w, box_h = (long_side, int(long_side / aspect)) if aspect >= 1 else (int(long_side * aspect), long_side)
+            shelf_bottom = rng.choice(shelves) - 6
+            x1 = rng.randint(5, max(6, width - box_w - 5))
+            y1 = max(5, shelf_bottom - box_h)
+            box = (x1, y1, x1 + box_w, min(shelf_bottom, y1 + box_h))
+            if not _overlaps(box, boxes):
+                break
+        else:
+            continue
+
+        color = _shade(rng.choice(shape['colors']), rng.randint(-15, 15))
+        _draw_vegetable(draw, label, box, color, rng)
+        boxes.append(box)
+        placed.append({'label': label, 'class_id': class_id, 'bbox': list(box)})
+
+    if rng.random() < 0.5:
+        image = image.filter(ImageFilter.GaussianBlur(rng.uniform(0.3, 1.0)))
+    return image, placed
+
+
+def generate_fridge_images(count, output_dir=None, seed=None, size=(640, 480)):
+    """Сохраняет count фото с разметкой: manifest.json и YOLO-метки в labels/"""
+    output_dir = output_dir or os.path.join(SYNTHETIC_FOLDER, 'fridge')
+    images_dir = os.path.join(output_dir, 'images')
+    labels_dir = os.path.join(output_dir, 'labels')
+    os.makedirs(images_dir, exist_ok=True)
+    os.makedirs(labels_dir, exist_ok=True)
+
+    rng = random.Random(seed)
+    classes = detector_classes()
+    # Индекс в списке classes совпадает с id класса в YOLO-метках
+    names = [None] * (max(class_id for class_id, _ in classes) + 1)
+    for class_id, label in classes:
+        names[class_id] = label
+    manifest = {'classes': names, 'images': []}
+    width, height = size
+
+    for n in range(1, count + 1):
+        image, objects = generate_fridge_image(rng, size, classes=classes)
+        name = f'fridge_{n:05d}'
+        image.save(os.path.join(images_dir, name + '.jpg'), 'JPEG', quality=rng.randint(75, 92))
+
+        with open(os.path.join(labels_dir, name + '.txt'), 'w', encoding='utf-8') as f:
+            for obj in objects:
+                x1, y1, x2, y2 = obj['bbox']
+                f.write(f"{obj['class_id']} {(x1 + x2) / 2 / width:.6f} {(y1 + y2) / 2 / height:.6f} "
+                        f"{(x2 - x1) / width:.6f} {(y2 - y1) / height:.6f}\n")
+
+        manifest['images'].append({'file': f'images/{name}.jpg', 'width': width, 'height': height,
+                                   'objects': objects})
+
+    manifest_path = os.path.join(output_dir, 'manifest.json')
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest_path
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    options = {'--recipes': None, '--json': None, '--images': None, '--seed': None, '--out': None}
+    load = False
+
+    while args:
+        arg = args.pop(0)
+        if arg == '--load':
+            load = True
+        elif arg in options and args:
+            options[arg] = args.pop(0)
+        else:
+            print("Использование: python catalog_generator.py [--recipes N [--load] [--json файл]] "
+                  "[--images N [--out папка]] [--seed S]")
+            sys.exit(1)
+
+    seed = int(options['--seed']) if options['--seed'] is not None else None
+
+    if options['--recipes']:
+        count = int(options['--recipes'])
+        if options['--json']:
+            print(f"📝 Генерация {count} рецептов в {options['--json']}...")
+            write_catalog_json(options['--json'], count, seed)
+            print("✅ Файл каталога создан")
+        if load or not options['--json']:
+            create_app()
+            with app.app_context():
+                print(f"🌱 Загрузка {count} рецептов в базу...")
+                load_catalog(count, seed=seed)
+                print(f"✅ В базе {Recipe.query.count()} рецептов")
+
+    if options['--images']:
+        print(f"🖼️ Генерация {options['--images']} фото холодильника...")
+        path = generate_fridge_images(int(options['--images']), options['--out'], seed)
+        print(f"✅ Разметка сохранена: {path}")
+
+    if not options['--recipes'] and not options['--images']:
+        print("Использование: python catalog_generator.py [--recipes N [--load] [--json файл]] "
+              "[--images N [--out папка]] [--seed S]")
@@ -0,0 +1,158 @@
+# class_metadata.py
+import os
+import sys
+import json
+import pickle
+import threading
+
+CLASSES_FILENAME = 'classes.json'
+LEGACY_CLASSES_FILENAME = 'class_names.pkl'
+
+# Перевод английских классов модели на русский
+TRANSLATIONS = {
+    'carrot': 'морковь', 'carrots': 'морковь',
+    'potato': 'картофель', 'potatoes': 'картофель',
+    'tomato': 'помидор', 'tomatoes': 'помидоры',
+    'cucumber': 'огурец', 'cucumbers': 'огурцы',
+    'onion': 'лук', 'onions': 'лук',
+    'pepper': 'перец', 'peppers': 'перец',
+    'bell pepper': 'болгарский перец', 'capsicum': 'болгарский перец',
+    'cabbage': 'капуста', 'broccoli': 'брокколи',
+    'cauliflower': 'цветная капуста', 'garlic': 'чеснок',
+    'ginger': 'имбирь', 'lettuce': 'салат',
+    'spinach': 'шпинат', 'zucchini': 'кабачок',
+    'eggplant': 'баклажан', 'eggplants': 'баклажаны', 'brinjal': 'баклажан',
+    'pumpkin': 'тыква', 'beet': 'свекла',
+    'bean': 'фасоль', 'beans': 'фасоль',
+    'radish': 'редис', 'papaya': 'папайя',
+    'bitter gourd': 'горькая тыква', 'bottle gourd': 'бутылочная тыква',
+    'apple': 'яблоко', 'apples': 'яблоки',
+    'banana': 'банан', 'bananas': 'бананы',
+    'orange': 'апельсин', 'oranges': 'апельсины',
+    'lemon': 'лимон', 'lemons': 'лимоны'
+}
+
+# Разговорные названия продуктов -> каноническая метка
+PRODUCT_SYNONYMS = {
+    'морковка': 'морковь', 'картошка': 'картофель',
+    'помидорка': 'помидор', 'помидорчик': 'помидор',
+    'огурчик': 'огурец', 'огурцы': 'огурец',
+    'луковица': 'лук', 'перчик': 'перец',
+    'капустка': 'капуста', 'яблочко': 'яблоки',
+    'бананчик': 'банан', 'апельсинчик': 'апельсин',
+    'лимончик': 'лимон'
+}
+
+DEMO_CLASS_NAMES = ["морковь", "картофель", "помидор", "огурец", "лук", "перец", "капуста"]
+
+
+def _class_key(name):
+    return name.lower().strip().replace('_', ' ')
+
+
+def translate_class(name):
+    return TRANSLATIONS.get(_class_key(name), name)
+
+
+def translate_classes_to_russian(english_classes):
+    return [translate_class(cls) for cls in english_classes]
+
+
+def build_class_metadata(class_names):
+    """Строит структуру classes.json: метки, русские названия и синонимы каждого класса"""
+    classes = []
+    for class_id, name in enumerate(class_names):
+        label = translate_class(name)
+        synonyms = sorted(synonym for synonym, target in PRODUCT_SYNONYMS.items() if target == label)
+        classes.append({
+            'id': class_id,
+            'name': name,
+            'label': label,
+            'synonyms': synonyms
+        })
+    return {'version': 1, 'classes': classes}
+
+
+class _ListOfStringsUnpickler(pickle.Unpickler):
+    """Старый class_names.pkl - просто список строк, любые объекты запрещены"""
+
+    def find_class(self, module, name):
+        raise pickle.UnpicklingError(f'Недопустимый объект в файле классов: {module}.{name}')
+
+
+def read_legacy_class_names(pkl_path):
+    with open(pkl_path, 'rb') as f:
+        class_names = _ListOfStringsUnpickler(f).load()
+    if not isinstance(class_names, list) or not all(isinstance(name, str) for name in class_names):
+        raise ValueError('Ожидается список строк')
+    return class_names
+
+
+def convert_pickle(pkl_path, json_path=None):
+    """Конвертирует class_names.pkl в classes.json рядом с моделью"""
+    json_path = json_path or os.path.join(os.path.dirname(pkl_path), CLASSES_FILENAME)
+    metadata = build_class_metadata(read_legacy_class_names(pkl_path))
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, ensure_ascii=False, indent=2)
+    return json_path, metadata
+
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def load_class_metadata(folder):
+    """Загружает метаданные классов папки модели (один раз, пока файл не изменится)
+
+    Возвращает None, если ни classes.json, ни class_names.pkl нет.
+    """
+    json_path = os.path.join(folder, CLASSES_FILENAME)
+    pkl_path = os.path.join(folder, LEGACY_CLASSES_FILENAME)
+
+    path = json_path if os.path.exists(json_path) else pkl_path
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+    cached = _cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    if path == json_path:
+        with open(json_path, 'r', encoding='utf-8') as f:
+            metadata = json.load(f)
+    else:
+        metadata = build_class_metadata(read_legacy_class_names(pkl_path))
+
+    with _cache_lock:
+        _cache[path] = (mtime, metadata)
+    return metadata
+
+
+def class_labels(metadata):
+    return [cls['label'] for cls in metadata['classes']]
+
+
+def synonym_index(metadata=None):
+    """Словарь синоним -> метка: общие синонимы плюс синонимы из метаданных модели"""
+    index = dict(PRODUCT_SYNONYMS)
+    if metadata:
+        for cls in metadata['classes']:
+            for synonym in cls.get('synonyms', []):
+                index[synonym.lower()] = cls['label']
+    return index
+
+
+if __name__ == '__main__':
+    source = sys.argv[1] if len(sys.argv) > 1 else os.path.join(
+        os.path.abspath(os.path.dirname(__file__)), 'model', LEGACY_CLASSES_FILENAME)
+
+    print(f"🔄 Конвертация {source}...")
+    try:
+        path, result = convert_pickle(source, sys.argv[2] if len(sys.argv) > 2 else None)
+    except (OSError, ValueError, pickle.UnpicklingError) as e:
+        print(f"❌ Ошибка: {e}")
+        sys.exit(1)
+
+    print(f"✅ Сохранено {len(result['classes'])} классов в {path}")
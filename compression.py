@@ -0,0 +1,100 @@
+# compression.py
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Типы ответов, которые сжимаем на лету (статику отдают заранее сжатые файлы)
+COMPRESS_MIMETYPES = {'application/json', 'text/html'}
+
+
+def choose_encoding(accept_encoding, encodings=None):
+    """Выбирает кодировку по заголовку Accept-Encoding с учетом q: br, затем gzip
+
+    encodings - из каких кодировок выбирать (по умолчанию те, что умеем сжимать на лету).
+    """
+    if not accept_encoding:
+        return None
+
+    accepted = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+
+    if encodings is None:
+        encodings = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+    for encoding in encodings:
+        if accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return None
+
+
+def make_compressor(encoding, level=6, br_level=4):
+    """Возвращает пару функций (compress(chunk), finish()) для потокового сжатия"""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=br_level)
+        return compressor.process, compressor.finish
+
+    # wbits=31 - формат gzip с заголовком и контрольной суммой
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress, compressor.flush
+
+
+def compress_bytes(data, encoding, level=6, br_level=4):
+    compress, finish = make_compressor(encoding, level, br_level)
+    return compress(data) + finish()
+
+
+def _compress_stream(chunks, encoding, level, br_level):
+    compress, finish = make_compressor(encoding, level, br_level)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        compressed = compress(chunk)
+        if compressed:
+            yield compressed
+    yield finish()
+
+
+def compress_response(response, accept_encoding, min_size=500, level=6, br_level=4):
+    """Сжимает ответ Flask, если клиент это поддерживает и тело достаточно большое"""
+    if response.status_code < 200 or response.status_code in (204, 304):
+        return response
+    if 'Content-Encoding' in response.headers or response.mimetype not in COMPRESS_MIMETYPES:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(accept_encoding)
+    if not encoding:
+        return response
+
+    if response.is_streamed:
+        # Файлы (send_file) идут напрямую, генераторы сжимаем по мере отдачи
+        if response.direct_passthrough:
+            return response
+        response.response = _compress_stream(response.response, encoding, level, br_level)
+        response.headers.pop('Content-Length', None)
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    data = response.get_data()
+    if len(data) < min_size:
+        return response
+
+    compressed = compress_bytes(data, encoding, level, br_level)
+    if len(compressed) >= len(data):
+        return response
+
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    return response
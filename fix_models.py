@@ -2,7 +2,9 @@
 import json
 import os
 import shutil
-from app import app, db, Recipe, RecipeImage
+from app import app
+from models import db, Recipe, RecipeImage
+from image_pipeline import recipe_image_url
 
 
 def update_images_from_json(json_file='recipes.json'):
@@ -89,7 +91,7 @@ def update_images_from_json(json_file='recipes.json'):
                 db.session.add(new_image)
 
                 # Обновляем поля рецепта
-                recipe.image = image_file
+                recipe.image = recipe_image_url(image_file)
                 recipe.has_local_image = True
 
                 print(f"  ✓ Установлено новое изображение: {image_file}")
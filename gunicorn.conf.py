@@ -0,0 +1,59 @@
+# gunicorn.conf.py
+# Запуск: gunicorn -c gunicorn.conf.py wsgi:app
+import gc
+import os
+import shutil
+import tempfile
+import multiprocessing
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+
+# Число воркеров; WEB_CONCURRENCY также учитывается при выборе числа потоков torch
+workers = int(os.environ.get('WEB_CONCURRENCY', min(4, multiprocessing.cpu_count())))
+os.environ.setdefault('WEB_CONCURRENCY', str(workers))
+
+# sync - один запрос на воркер; gthread - несколько потоков на воркер (выгодно при ожидании БД/сети)
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 4)) if worker_class == 'gthread' else 1
+
+# Приложение и модели загружаются в мастере один раз, воркеры получают их через fork
+preload_app = True
+os.environ.setdefault('PRELOAD_MODELS', 'true')
+
+# Инференс на CPU может занимать секунды
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+
+# Перезапуск воркеров ограничивает рост памяти при долгой работе
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = 100
+
+accesslog = '-'
+errorlog = '-'
+
+# Метрики всех воркеров собираются через файлы: своя папка на каждый запуск мастера,
+# поэтому счетчики начинаются с нуля после перезапуска сервиса
+os.environ.setdefault('METRICS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), f'cookly_metrics_{os.getpid()}'))
+
+
+def when_ready(server):
+    # Переносим уже созданные объекты (в т.ч. веса моделей) в постоянное поколение GC,
+    # чтобы сборщик мусора в воркерах не трогал их страницы и не ломал copy-on-write
+    gc.freeze()
+    server.log.info("Cookly готов: %s воркеров (%s, потоков: %s)", workers, worker_class, threads)
+
+
+def worker_exit(server, worker):
+    # Последние значения воркера - в его файл, до того как мастер перенесет их в архив
+    import metrics
+    metrics.write_process_file()
+
+
+def child_exit(server, worker):
+    import metrics
+    metrics.mark_process_dead(worker.pid, os.environ['METRICS_MULTIPROC_DIR'])
+
+
+def on_exit(server):
+    shutil.rmtree(os.environ['METRICS_MULTIPROC_DIR'], ignore_errors=True)
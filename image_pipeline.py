@@ -0,0 +1,121 @@
+# image_pipeline.py
+import os
+import re
+
+# Размеры производных изображений (ширина в пикселях)
+DERIVATIVE_SIZES = {
+    'thumb': 160,
+    'card': 400,
+    'detail': 800
+}
+
+# Форматы: расширение -> (формат Pillow, параметры сохранения)
+DERIVATIVE_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True})
+}
+
+RECIPE_IMAGES_URL = '/static/uploads/recipes/'
+
+
+def recipe_image_url(image):
+    """URL изображения рецепта: внешние ссылки и URL как есть, имя файла - в /static/uploads/recipes/"""
+    if not image or image.startswith(('http://', 'https://', '/')):
+        return image
+    return RECIPE_IMAGES_URL + image
+
+
+def generate_derivatives(source_path, output_dir=None, base_name=None):
+    """Создает уменьшенные копии изображения во всех размерах и форматах
+
+    Возвращает словарь вида
+    {'card': {'width': 400, 'height': 300, 'webp': 'x_card.webp', 'jpg': 'x_card.jpg'}, ...}
+    Изображения меньше целевой ширины не увеличиваются. При ошибке уже
+    записанные файлы удаляются.
+    """
+    output_dir = output_dir or os.path.dirname(source_path)
+    base_name = base_name or os.path.splitext(os.path.basename(source_path))[0]
+    os.makedirs(output_dir, exist_ok=True)
+
+    variants = {}
+    written = []
+    try:
+        _write_derivatives(source_path, output_dir, base_name, variants, written)
+    except Exception:
+        for path in written:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        raise
+    return variants
+
+
+def _write_derivatives(source_path, output_dir, base_name, variants, written):
+    from PIL import Image, ImageOps
+
+    with Image.open(source_path) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'L'):
+            # Прозрачность заливаем белым, чтобы JPEG не получил черный фон
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            rgba = image.convert('RGBA')
+            background.paste(rgba, mask=rgba.split()[-1])
+            image = background
+        elif image.mode == 'L':
+            image = image.convert('RGB')
+
+        # От большего к меньшему: каждый размер уменьшается из предыдущего
+        current = image
+        for size_name, width in sorted(DERIVATIVE_SIZES.items(), key=lambda item: item[1], reverse=True):
+            if current.width > width:
+                height = max(1, round(current.height * width / current.width))
+                current = current.resize((width, height), Image.LANCZOS)
+
+            variant = {'width': current.width, 'height': current.height}
+            for ext, (fmt, options) in DERIVATIVE_FORMATS.items():
+                filename = f"{base_name}_{size_name}.{ext}"
+                path = os.path.join(output_dir, filename)
+                written.append(path)
+                current.save(path, fmt, **options)
+                variant[ext] = filename
+            variants[size_name] = variant
+
+
+def remove_derivatives(variants, output_dir):
+    """Удаляет файлы производных изображений"""
+    for variant in (variants or {}).values():
+        for ext in DERIVATIVE_FORMATS:
+            filename = variant.get(ext)
+            if filename:
+                try:
+                    os.remove(os.path.join(output_dir, filename))
+                except OSError:
+                    pass
+
+
+def build_srcset(variants, ext='webp', url_prefix=RECIPE_IMAGES_URL):
+    """Собирает атрибут srcset из словаря производных изображений"""
+    if not variants:
+        return None
+
+    entries = {}
+    for variant in variants.values():
+        if variant.get(ext):
+            # Маленькие исходники дают несколько одинаковых ширин - оставляем одну
+            entries.setdefault(variant['width'], f"{url_prefix}{variant[ext]} {variant['width']}w")
+
+    return ', '.join(entries[width] for width in sorted(entries)) or None
+
+
+def build_remote_srcset(url):
+    """srcset для внешних изображений Unsplash через параметр ширины w="""
+    if not url or 'images.unsplash.com' not in url:
+        return None
+
+    base = re.sub(r'([?&])w=\d+&?', r'\1', url).rstrip('?&')
+    separator = '&' if '?' in base else '?'
+    return ', '.join(
+        f"{base}{separator}w={width} {width}w"
+        for width in sorted(DERIVATIVE_SIZES.values())
+    )
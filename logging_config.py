@@ -0,0 +1,147 @@
+# logging_config.py
+import os
+import sys
+import copy
+import json
+import queue
+import atexit
+import logging
+import contextvars
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# Идентификатор текущего запроса; пустой вне запросов (скрипты, фоновые задачи)
+request_id_var = contextvars.ContextVar('request_id', default='-')
+
+# Атрибуты LogRecord, которые не считаются пользовательскими полями из extra=
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime',
+                                                                                    'request_id', 'taskName'}
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON-строка на запись: время, уровень, логгер, сообщение, request_id и поля из extra="""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', '-')
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Читаемый формат для разработки; поля из extra= дописываются в конец строки"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        fields = {k: v for k, v in record.__dict__.items() if k not in _RECORD_ATTRIBUTES and not k.startswith('_')}
+        if fields:
+            line += ' ' + ' '.join(f'{key}={value}' for key, value in fields.items())
+        if record.exc_text and not record.exc_info and record.exc_text not in line:
+            line += '\n' + record.exc_text
+        return line
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """Кладет запись в очередь, не форматируя её в потоке запроса
+
+    Стандартный QueueHandler склеивает сообщение с трейсбэком, из-за чего
+    JSON-формат теряет структуру. Здесь трейсбэк сохраняется отдельно.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_queue_handler = None
+_listener = None
+
+
+def _start_listener(stream_handler):
+    global _listener
+    log_queue = queue.SimpleQueue()
+    _queue_handler.queue = log_queue
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+
+
+def _restart_after_fork():
+    # Поток-писатель не переживает fork: воркеру нужны своя очередь и свой поток
+    if _listener is not None:
+        _start_listener(_listener.handlers[0])
+
+
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()
+
+
+def parse_levels(value):
+    """'werkzeug=WARNING,sqlalchemy.engine=INFO' -> {'werkzeug': 'WARNING', ...}"""
+    levels = {}
+    for part in (value or '').split(','):
+        name, _, level = part.partition('=')
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging(level=None, log_format=None, module_levels=None):
+    """Настраивает корневой логгер: запись уходит в очередь, в поток вывода пишет отдельный поток
+
+    Параметры по умолчанию берутся из LOG_LEVEL, LOG_FORMAT (json|text) и
+    LOG_LEVELS (уровни отдельных логгеров). Повторный вызов только меняет уровни.
+    """
+    global _queue_handler
+
+    level = (level or os.environ.get('LOG_LEVEL', 'INFO')).upper()
+    log_format = (log_format or os.environ.get('LOG_FORMAT', 'json')).lower()
+    if module_levels is None:
+        module_levels = parse_levels(os.environ.get('LOG_LEVELS', ''))
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    for name, module_level in module_levels.items():
+        logging.getLogger(name).setLevel(module_level)
+
+    if _queue_handler is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter() if log_format == 'json' else TextFormatter())
+
+    _queue_handler = _NonBlockingQueueHandler(None)
+    _queue_handler.addFilter(RequestIdFilter())
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+
+    _start_listener(stream_handler)
+    atexit.register(_stop_listener)
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=_restart_after_fork)
@@ -0,0 +1,355 @@
+# metrics.py
+import os
+import json
+import time
+import atexit
+import threading
+from contextlib import contextmanager
+
+# Границы корзин гистограмм (секунды) - от быстрых API-запросов до инференса
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class Counter:
+    """Монотонно растущий счетчик с метками"""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(str(labels.get(name, '')) for name in self.labelnames), 0)
+
+    def reset(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def empty_copy(self):
+        return Counter(self.name, self.documentation, self.labelnames)
+
+    def dump(self):
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def load(self, entries):
+        """Прибавляет значения из dump() другого процесса"""
+        with self._lock:
+            for key, value in entries:
+                key = tuple(key)
+                self._values[key] = self._values.get(key, 0) + value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    """Гистограмма в формате Prometheus: накопительные корзины, сумма и количество"""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def reset(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def empty_copy(self):
+        return Histogram(self.name, self.documentation, self.labelnames, buckets=self.buckets[:-1])
+
+    def dump(self):
+        with self._lock:
+            return [[list(key), list(state[0]), state[1], state[2]] for key, state in self._values.items()]
+
+    def load(self, entries):
+        """Прибавляет значения из dump() другого процесса"""
+        with self._lock:
+            for key, counts, total, count in entries:
+                key = tuple(key)
+                state = self._values.get(key)
+                if state is None:
+                    state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+                state[0] = [a + b for a, b in zip(state[0], counts)]
+                state[1] += total
+                state[2] += count
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = sorted((key, (list(state[0]), state[1], state[2])) for key, state in self._values.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, ('le', _format_value(float(bound))))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+REGISTRY = []
+
+
+def register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+REQUEST_LATENCY = register(Histogram(
+    'cookly_http_request_duration_seconds', 'Время обработки HTTP-запроса',
+    ('method', 'endpoint', 'status')))
+REQUEST_EXCEPTIONS = register(Counter(
+    'cookly_http_exceptions_total', 'Необработанные исключения в обработчиках API', ('endpoint',)))
+REQUEST_DB_QUERIES = register(Histogram(
+    'cookly_http_request_db_queries', 'Количество SQL-запросов на один HTTP-запрос',
+    ('endpoint',), buckets=QUERY_COUNT_BUCKETS))
+REQUEST_DB_TIME = register(Histogram(
+    'cookly_http_request_db_seconds', 'Суммарное время SQL-запросов на один HTTP-запрос', ('endpoint',)))
+DB_QUERIES = register(Counter('cookly_db_queries_total', 'Выполненные SQL-запросы'))
+DB_QUERY_TIME = register(Counter('cookly_db_query_seconds_total', 'Суммарное время SQL-запросов'))
+INFERENCE_STAGE = register(Histogram(
+    'cookly_inference_stage_seconds', 'Время этапов детекции продуктов',
+    ('stage', 'model_version')))
+TELEGRAM_MESSAGES = register(Counter(
+    'cookly_telegram_messages_total', 'Исходящие сообщения Telegram (sent/retry/failed/dropped)', ('result',)))
+USER_CACHE = register(Counter(
+    'cookly_user_cache_lookups_total', 'Обращения к кешам данных пользователей (hit/miss)', ('cache', 'result')))
+
+
+def render_prometheus():
+    """Текст всех метрик в формате Prometheus (text/plain; version=0.0.4)
+
+    В режиме нескольких процессов - сумма по всем воркерам, включая завершившиеся.
+    """
+    collected = REGISTRY if _multiprocess_dir is None else collect_multiprocess(_multiprocess_dir)
+    lines = []
+    for metric in collected:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# ---------- несколько процессов (воркеры gunicorn) ----------
+
+# Воркеры gunicorn слушают один сокет, и /metrics отвечает тот, кому достался запрос.
+# Поэтому каждый процесс раз в interval секунд (и при выходе) сохраняет свои значения
+# в <папка>/metrics_<pid>.json, а /metrics суммирует файлы всех процессов. Файлы
+# завершившихся воркеров мастер переносит в общий архив (mark_process_dead), чтобы
+# счетчики не откатывались назад при перезапуске воркера (max_requests).
+
+PROCESS_FILE_PREFIX = 'metrics_'
+ARCHIVE_FILENAME = 'archive.json'
+
+_multiprocess_dir = None
+
+
+def _process_file(directory, pid):
+    return os.path.join(directory, f'{PROCESS_FILE_PREFIX}{pid}.json')
+
+
+def _read_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path, data):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _merge(states):
+    """Новые экземпляры метрик реестра с суммой значений из states"""
+    merged = []
+    for metric in REGISTRY:
+        total = metric.empty_copy()
+        for state in states:
+            total.load(state.get(metric.name, []))
+        merged.append(total)
+    return merged
+
+
+def write_process_file():
+    """Сохраняет значения текущего процесса в папку метрик"""
+    if _multiprocess_dir is None:
+        return
+    try:
+        _write_json(_process_file(_multiprocess_dir, os.getpid()),
+                    {metric.name: metric.dump() for metric in REGISTRY})
+    except OSError:
+        # Например, при выходе мастера папку уже удалил on_exit
+        pass
+
+
+def collect_multiprocess(directory):
+    """Метрики, просуммированные по файлам всех процессов и архиву"""
+    write_process_file()
+
+    # Сначала файлы процессов, потом архив: если воркер успели перенести в архив
+    # между чтениями, его файл пропускается по списку pids архива
+    files = {}
+    for name in os.listdir(directory):
+        if name.startswith(PROCESS_FILE_PREFIX) and name.endswith('.json'):
+            state = _read_json(os.path.join(directory, name))
+            if state is not None:
+                files[name[len(PROCESS_FILE_PREFIX):-len('.json')]] = state
+
+    archive = _read_json(os.path.join(directory, ARCHIVE_FILENAME)) or {}
+    archived = {str(pid) for pid in archive.get('pids', [])}
+    states = [state for pid, state in files.items() if pid not in archived]
+    states.append(archive.get('metrics', {}))
+    return _merge(states)
+
+
+def mark_process_dead(pid, directory=None):
+    """Переносит значения завершившегося процесса в архив (вызывается из мастера gunicorn)"""
+    directory = directory or _multiprocess_dir
+    if not directory:
+        return
+    path = _process_file(directory, pid)
+    state = _read_json(path)
+    if state is None:
+        return
+
+    archive_path = os.path.join(directory, ARCHIVE_FILENAME)
+    archive = _read_json(archive_path) or {}
+    merged = _merge([archive.get('metrics', {}), state])
+    _write_json(archive_path, {
+        'pids': archive.get('pids', []) + [pid],
+        'metrics': {metric.name: metric.dump() for metric in merged}
+    })
+    os.remove(path)
+
+
+def _writer_loop(interval):
+    while True:
+        time.sleep(interval)
+        write_process_file()
+
+
+def _start_writer(interval):
+    threading.Thread(target=_writer_loop, args=(interval,), name='metrics-writer', daemon=True).start()
+
+
+def _after_fork(interval):
+    # Дочерний процесс начинает с нуля: значения мастера остаются в его собственном файле
+    for metric in REGISTRY:
+        metric.reset()
+    _start_writer(interval)
+
+
+def enable_multiprocess(directory, interval=1.0):
+    """Включает сбор метрик со всех процессов через файлы в directory"""
+    global _multiprocess_dir
+    if _multiprocess_dir is not None:
+        return
+    os.makedirs(directory, exist_ok=True)
+    _multiprocess_dir = directory
+    _start_writer(interval)
+    atexit.register(write_process_file)
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=lambda: _after_fork(interval))
+
+
+# ---------- SQLAlchemy ----------
+
+_sqlalchemy_instrumented = False
+
+
+def instrument_sqlalchemy(on_query=None):
+    """Считает запросы и время SQL для всех движков через события SQLAlchemy
+
+    on_query(duration) вызывается после каждого запроса - через него
+    приложение привязывает статистику к текущему HTTP-запросу.
+    """
+    global _sqlalchemy_instrumented
+    if _sqlalchemy_instrumented:
+        return
+
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    @event.listens_for(Engine, 'before_cursor_execute')
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+    @event.listens_for(Engine, 'after_cursor_execute')
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('query_start_time')
+        if not starts:
+            return
+        duration = time.perf_counter() - starts.pop()
+        DB_QUERIES.inc()
+        DB_QUERY_TIME.inc(duration)
+        if on_query is not None:
+            on_query(duration)
+
+    @event.listens_for(Engine, 'handle_error')
+    def _handle_error(context):
+        # Запрос упал - убираем его отметку времени, иначе стек рассинхронизируется
+        starts = context.connection.info.get('query_start_time') if context.connection else None
+        if starts:
+            starts.pop()
+
+    _sqlalchemy_instrumented = True
@@ -2,7 +2,11 @@
 import os
 import json
 import requests
-from app import app, db, Recipe, RecipeImage
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from app import app
+from models import db, Recipe, RecipeImage
+from image_pipeline import generate_derivatives, recipe_image_url, RECIPE_IMAGES_URL
 from werkzeug.utils import secure_filename
 import uuid
 import time
@@ -11,10 +15,48 @@ import time
 UPLOAD_FOLDER = 'static/uploads/recipes'
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+# Параметры параллельной загрузки
+MAX_WORKERS = int(os.environ.get('IMPORT_MAX_WORKERS', 8))
+COMMIT_BATCH_SIZE = 20
+MAX_RETRIES = 3
+BACKOFF_BASE = 1.0  # секунды, удваивается на каждой попытке
+PROGRESS_FILE = os.path.join(UPLOAD_FOLDER, '.import_progress.json')
 
-def download_image(url, recipe_id):
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+}
+
+
+def create_session(pool_size=MAX_WORKERS):
+    """Создает общую HTTP-сессию с пулом соединений"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update(DEFAULT_HEADERS)
+    return session
+
+
+def load_progress(progress_file=PROGRESS_FILE):
+    """Загружает множество уже обработанных ID рецептов"""
+    try:
+        with open(progress_file, 'r', encoding='utf-8') as f:
+            return set(json.load(f).get('done', []))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return set()
+
+
+def save_progress(done_ids, progress_file=PROGRESS_FILE):
+    """Сохраняет прогресс импорта, чтобы его можно было продолжить"""
+    tmp_file = progress_file + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump({'done': sorted(done_ids)}, f)
+    os.replace(tmp_file, progress_file)
+
+
+def download_image(url, recipe_id, session=None, max_retries=MAX_RETRIES, backoff=BACKOFF_BASE):
     """Скачивает изображение по URL и сохраняет локально"""
-    max_retries = 3
+    http = session or requests
     for attempt in range(max_retries):
         try:
             # Генерируем уникальное имя файла
@@ -30,22 +72,19 @@ def download_image(url, recipe_id):
             filepath = os.path.join(UPLOAD_FOLDER, filename)
 
             # Скачиваем изображение
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            }
-            response = requests.get(url, timeout=30, stream=True, headers=headers)
-            response.raise_for_status()
-
-            # Проверяем content-type
-            content_type = response.headers.get('content-type', '')
-            if 'image' not in content_type:
-                print(f"  ⚠️ Не изображение: {content_type}")
-                return None, None
-
-            with open(filepath, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
+            with http.get(url, timeout=30, stream=True, headers=DEFAULT_HEADERS) as response:
+                response.raise_for_status()
+
+                # Проверяем content-type
+                content_type = response.headers.get('content-type', '')
+                if 'image' not in content_type:
+                    print(f"  ⚠️ Не изображение: {content_type}")
+                    return None, None
+
+                with open(filepath, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=8192):
+                        if chunk:
+                            f.write(chunk)
 
             # Проверяем, что файл действительно скачался
             if os.path.getsize(filepath) > 1024:  # Больше 1KB
@@ -57,16 +96,40 @@ def download_image(url, recipe_id):
 
         except Exception as e:
             print(f"  ⚠️ Попытка {attempt + 1}/{max_retries} не удалась: {e}")
-            if attempt < max_retries - 1:
-                time.sleep(2)  # Ждем перед повторной попыткой
-            else:
-                print(f"  ❌ Не удалось скачать {url}")
+
+        if attempt < max_retries - 1:
+            # Экспоненциальная задержка перед повторной попыткой
+            time.sleep(backoff * (2 ** attempt))
+        else:
+            print(f"  ❌ Не удалось скачать {url}")
 
     return None, None
 
 
-def import_images_from_json(json_file='recipes.json'):
-    """Импортирует изображения из JSON-файла"""
+def download_and_process_image(url, recipe_id, session=None):
+    """Скачивает изображение и сразу строит производные размеры (в рабочем потоке)"""
+    filename, filepath = download_image(url, recipe_id, session)
+    if not (filename and filepath):
+        return None, None, None
+
+    try:
+        variants = generate_derivatives(filepath, UPLOAD_FOLDER)
+    except Exception as e:
+        print(f"  ⚠️ Не удалось создать превью для {filename}: {e}")
+        variants = None
+
+    return filename, filepath, variants
+
+
+def import_images_from_json(json_file='recipes.json', max_workers=MAX_WORKERS,
+                            batch_size=COMMIT_BATCH_SIZE, progress_file=PROGRESS_FILE, session=None):
+    """Импортирует изображения из JSON-файла
+
+    Загрузка идет параллельно в ограниченном пуле потоков через общую сессию,
+    а запись в БД выполняется в основном потоке пачками по batch_size рецептов.
+    Уже обработанные рецепты запоминаются в progress_file, поэтому прерванный
+    импорт можно просто запустить заново.
+    """
     with app.app_context():
         print("🔄 Импорт изображений из JSON...")
 
@@ -86,60 +149,103 @@ def import_images_from_json(json_file='recipes.json'):
         error_count = 0
         skipped_count = 0
 
+        done_ids = load_progress(progress_file)
+        if done_ids:
+            print(f"↩️ Продолжаем импорт: уже обработано {len(done_ids)} рецептов")
+
+        # Одним запросом получаем рецепты и те, у которых уже есть локальные изображения
+        json_ids = [r.get('id') for r in recipes_data if r.get('id')]
+        recipes = {r.id: r for r in Recipe.query.filter(Recipe.id.in_(json_ids)).all()} if json_ids else {}
+        with_images = {row.recipe_id for row in db.session.query(RecipeImage.recipe_id)
+                       .filter(RecipeImage.recipe_id.in_(json_ids)).distinct()} if json_ids else set()
+
+        tasks = []
         for recipe_data in recipes_data:
             recipe_id = recipe_data.get('id')
             image_url = recipe_data.get('image')
-            title = recipe_data.get('title', 'Unknown')
 
             if not recipe_id or not image_url:
                 print(f"⚠️ Пропуск: нет ID или URL")
                 skipped_count += 1
                 continue
 
-            # Находим рецепт в БД
-            recipe = db.session.get(Recipe, recipe_id)
-            if not recipe:
+            if recipe_id not in recipes:
                 print(f"❌ Рецепт с ID {recipe_id} не найден в БД")
                 error_count += 1
                 continue
 
-            print(f"\n📝 Обработка рецепта #{recipe_id}: {title}")
-
             # Проверяем, есть ли уже локальное изображение
-            existing_image = RecipeImage.query.filter_by(recipe_id=recipe.id).first()
-            if existing_image:
-                print(f"  ✓ Уже есть локальное изображение: {existing_image.filename}")
+            if recipe_id in with_images or recipe_id in done_ids:
                 skipped_count += 1
                 continue
 
-            # Скачиваем изображение
-            filename, filepath = download_image(image_url, recipe_id)
+            tasks.append((recipe_id, image_url))
+
+        print(f"⬇️ К загрузке: {len(tasks)} изображений, потоков: {max_workers}")
+
+        own_session = session is None
+        http = session or create_session(max_workers)
+        batch_ids = []
+
+        def flush():
+            """Коммитит накопленную пачку и возвращает (успешно, ошибки)"""
+            count = len(batch_ids)
+            try:
+                db.session.commit()
+                done_ids.update(batch_ids)
+                save_progress(done_ids, progress_file)
+                return count, 0
+            except Exception as e:
+                db.session.rollback()
+                print(f"  ❌ Ошибка сохранения в БД: {e}")
+                return 0, count
+            finally:
+                batch_ids.clear()
+
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = {
+                    executor.submit(download_and_process_image, url, recipe_id, http): recipe_id
+                    for recipe_id, url in tasks
+                }
+
+                for future in as_completed(futures):
+                    recipe_id = futures[future]
+                    filename, filepath, variants = future.result()
+
+                    if not (filename and filepath):
+                        error_count += 1
+                        print(f"  ⚠️ Не удалось скачать изображение для рецепта #{recipe_id}")
+                        continue
 
-            if filename and filepath:
-                try:
                     # Сохраняем информацию о файле
+                    recipe = recipes[recipe_id]
                     recipe_image = RecipeImage(
                         recipe_id=recipe.id,
                         filename=filename,
                         filepath=filepath,
                         is_primary=True
                     )
+                    recipe_image.set_variants(variants)
                     db.session.add(recipe_image)
 
                     # Обновляем рецепт
                     recipe.has_local_image = True
-                    recipe.image = filename
-
-                    db.session.commit()
-                    success_count += 1
-                    print(f"  ✅ Изображение сохранено для рецепта #{recipe_id}")
-                except Exception as e:
-                    db.session.rollback()
-                    print(f"  ❌ Ошибка сохранения в БД: {e}")
-                    error_count += 1
-            else:
-                error_count += 1
-                print(f"  ⚠️ Не удалось скачать изображение для рецепта #{recipe_id}")
+                    recipe.image = recipe_image_url(filename)
+                    batch_ids.append(recipe_id)
+
+                    if len(batch_ids) >= batch_size:
+                        saved, failed = flush()
+                        success_count += saved
+                        error_count += failed
+
+            if batch_ids:
+                saved, failed = flush()
+                success_count += saved
+                error_count += failed
+        finally:
+            if own_session:
+                http.close()
 
         print(f"\n📊 ИТОГИ:")
         print(f"  ✅ Успешно: {success_count}")
@@ -158,18 +264,24 @@ def fix_image_urls_in_db():
 
         for recipe in recipes:
             try:
-                if recipe.has_local_image and recipe.recipe_images:
-                    # Уже есть локальное изображение
-                    continue
-
                 if recipe.image and not recipe.image.startswith(('http://', 'https://')):
-                    # Это может быть имя файла
-                    file_path = os.path.join(UPLOAD_FOLDER, recipe.image)
+                    # Старые записи хранят имя файла, новые - URL /static/uploads/recipes/...
+                    filename = recipe.image[len(RECIPE_IMAGES_URL):] \
+                        if recipe.image.startswith(RECIPE_IMAGES_URL) else recipe.image
+                    if recipe.image != recipe_image_url(filename):
+                        recipe.image = recipe_image_url(filename)
+                        fixed_count += 1
+
+                    if recipe.images:
+                        # Уже есть локальное изображение
+                        continue
+
+                    file_path = os.path.join(UPLOAD_FOLDER, filename)
                     if os.path.exists(file_path):
                         # Файл существует, добавляем запись в RecipeImage
                         recipe_image = RecipeImage(
                             recipe_id=recipe.id,
-                            filename=recipe.image,
+                            filename=filename,
                             filepath=file_path,
                             is_primary=True
                         )
@@ -189,7 +301,55 @@ def fix_image_urls_in_db():
             print(f"❌ Ошибка при сохранении: {e}")
 
 
+def reprocess_images(max_workers=MAX_WORKERS, only_missing=True):
+    """Перестраивает производные изображения для уже сохраненных RecipeImage
+
+    Обработка идет в фоновом пуле потоков, результаты пишутся в БД пачками.
+    """
+    with app.app_context():
+        print("🔄 Пересоздание превью изображений...")
+
+        query = RecipeImage.query
+        if only_missing:
+            query = query.filter(RecipeImage.variants.is_(None))
+        images = query.all()
+        print(f"📊 Изображений к обработке: {len(images)}")
+
+        def process(image):
+            # Только файловая работа: объект модели меняем в основном потоке
+            source_path = image.filepath
+            if not os.path.isabs(source_path):
+                source_path = os.path.join(app.root_path, source_path)
+            return generate_derivatives(source_path, UPLOAD_FOLDER)
+
+        processed_count = 0
+        error_count = 0
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(process, image): image for image in images}
+            for future in as_completed(futures):
+                image = futures[future]
+                try:
+                    image.set_variants(future.result())
+                    processed_count += 1
+                except Exception as e:
+                    error_count += 1
+                    print(f"  ❌ {image.filename}: {e}")
+                    continue
+
+                if processed_count % COMMIT_BATCH_SIZE == 0:
+                    db.session.commit()
+
+        db.session.commit()
+        print(f"\n✅ Обработано: {processed_count}, Ошибки: {error_count}")
+
+
 if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] == '--reprocess':
+        reprocess_images(only_missing='--all' not in sys.argv)
+        sys.exit(0)
+
     print("=" * 50)
     print("📷 ИМПОРТ ИЗОБРАЖЕНИЙ РЕЦЕПТОВ")
     print("=" * 50)
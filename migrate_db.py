@@ -1,5 +1,6 @@
 # migrate_db.py
-from app import app, db
+from app import app
+from models import db
 from sqlalchemy import inspect, text
 import os
 
@@ -32,6 +33,30 @@ def add_column_if_not_exists(engine, table_name, column_name, column_type):
         return False
 
 
+def create_index_if_not_exists(engine, table_name, index_name, columns):
+    """Создает индекс, если его нет (для таблиц, созданных до появления индекса)"""
+    inspector = inspect(engine)
+
+    if table_name not in inspector.get_table_names():
+        print(f"❌ Таблица {table_name} не найдена. Пропускаем...")
+        return False
+
+    if index_name in [index['name'] for index in inspector.get_indexes(table_name)]:
+        print(f"✓ Индекс {index_name} уже существует")
+        return False
+
+    print(f"➕ Создаем индекс {index_name} ({', '.join(columns)})...")
+    try:
+        with engine.connect() as conn:
+            conn.execute(text(f'CREATE INDEX {index_name} ON {table_name} ({", ".join(columns)})'))
+            conn.commit()
+        print(f"✓ Индекс {index_name} создан")
+        return True
+    except Exception as e:
+        print(f"❌ Ошибка при создании индекса {index_name}: {e}")
+        return False
+
+
 def create_tables_if_not_exist(engine):
     """Создает недостающие таблицы"""
     inspector = inspect(engine)
@@ -41,7 +66,7 @@ def create_tables_if_not_exist(engine):
     required_tables = [
         'users', 'recipes', 'ingredients', 'instructions',
         'favorites', 'user_ingredients', 'telegram_chats',
-        'likes', 'recipe_images'
+        'telegram_auth_codes', 'likes', 'recipe_images'
     ]
 
     missing_tables = []
@@ -133,6 +158,15 @@ def migrate_database():
             images_column_names = [col['name'] for col in images_columns]
             print(f"   Колонки: {', '.join(images_column_names)}")
 
+            # Производные изображения (WebP/JPEG разных размеров)
+            add_column_if_not_exists(engine, 'recipe_images', 'variants', 'TEXT')
+
+        print("-" * 60)
+
+        # 6. Вход через Telegram: поиск чата по chat_id
+        print("\n🤖 Проверка таблицы telegram_chats:")
+        create_index_if_not_exists(engine, 'telegram_chats', 'ix_telegram_chats_chat_id', ['chat_id'])
+
         print("=" * 60)
         print("✅ Миграция базы данных завершена!")
 
@@ -211,7 +245,7 @@ def show_db_structure():
 def fix_recipes_author_names():
     """Обновляет имена авторов для существующих рецептов"""
     with app.app_context():
-        from app import Recipe
+        from models import Recipe
 
         print("\n🔄 Обновление имен авторов для рецептов...")
 
@@ -239,7 +273,7 @@ def fix_recipes_author_names():
 def reset_likes_count():
     """Сбрасывает счетчики лайков и пересчитывает их заново"""
     with app.app_context():
-        from app import Recipe, Like
+        from models import Recipe, Like
 
         print("\n🔄 Пересчет лайков...")
 
@@ -300,6 +334,12 @@ if __name__ == '__main__':
             with app.app_context():
                 fix_relationship_conflicts()
 
+        elif sys.argv[1] == '--purge-auth-codes':
+            # Для cron: приложение само чистит коды не чаще TELEGRAM_CODE_PURGE_INTERVAL
+            from app import purge_expired_auth_codes
+            with app.app_context():
+                print(f"🧹 Удалено истекших кодов Telegram: {purge_expired_auth_codes()}")
+
         elif sys.argv[1] == '--full':
             print("🔄 Выполняется полная миграция...")
             migrate_database()
@@ -318,6 +358,7 @@ if __name__ == '__main__':
             print("  python migrate_db.py --fix-authors    - исправить имена авторов")
             print("  python migrate_db.py --reset-likes    - пересчитать лайки")
             print("  python migrate_db.py --fix-relations  - проверить целостность")
+            print("  python migrate_db.py --purge-auth-codes - удалить истекшие коды Telegram")
             print("  python migrate_db.py --full           - полная миграция + исправления")
     else:
         # Обычная миграция
@@ -325,7 +366,7 @@ if __name__ == '__main__':
 
         # После миграции спрашиваем, нужно ли исправить авторов
         with app.app_context():
-            from app import Recipe
+            from models import Recipe
 
             need_fix = Recipe.query.filter(
                 (Recipe.author_name == None) |
@@ -1,12 +1,90 @@
+import os
+import numpy as np
 import torch
 import torch.nn as nn
 import torchvision.models as models
+from PIL import Image
 from torchvision import transforms
 
+IMAGENET_MEAN = [0.485, 0.456, 0.406]
+IMAGENET_STD = [0.229, 0.224, 0.225]
+
+# Аугментации для обучения
+TRAIN_TRANSFORM = transforms.Compose([
+    transforms.RandomResizedCrop(224),
+    transforms.RandomHorizontalFlip(),
+    transforms.RandomRotation(20),
+    transforms.ColorJitter(brightness=0.2, contrast=0.2, saturation=0.2),
+    transforms.ToTensor(),
+    transforms.Normalize(IMAGENET_MEAN, IMAGENET_STD)
+])
+
+# Преобразования для инференса
+VAL_TRANSFORM = transforms.Compose([
+    transforms.Resize(256),
+    transforms.CenterCrop(224),
+    transforms.ToTensor(),
+    transforms.Normalize(IMAGENET_MEAN, IMAGENET_STD)
+])
+
+TRANSFORMS = {
+    'train': TRAIN_TRANSFORM,
+    'val': VAL_TRANSFORM
+}
+
+PRECISIONS = ('fp32', 'bf16', 'int8')
+
+
+def cpu_profile_from_env():
+    """Настройки CPU-инференса из переменных окружения
+
+    INFERENCE_THREADS - потоков torch на воркер (0 = ядра / WEB_CONCURRENCY),
+    INFERENCE_INTEROP_THREADS, INFERENCE_CHANNELS_LAST, INFERENCE_PRECISION (fp32/bf16/int8).
+    """
+    workers = max(1, int(os.environ.get('WEB_CONCURRENCY', 1)))
+    threads = int(os.environ.get('INFERENCE_THREADS', 0)) or max(1, (os.cpu_count() or 1) // workers)
+    precision = os.environ.get('INFERENCE_PRECISION', 'fp32').lower()
+
+    return {
+        'intra_op_threads': threads,
+        'inter_op_threads': max(1, int(os.environ.get('INFERENCE_INTEROP_THREADS', 1))),
+        'channels_last': os.environ.get('INFERENCE_CHANNELS_LAST', 'false').lower() == 'true',
+        'precision': precision if precision in PRECISIONS else 'fp32'
+    }
+
+
+def configure_cpu_threads(intra_op_threads, inter_op_threads=None):
+    """Ограничивает число потоков torch, чтобы воркеры не делили ядра друг у друга"""
+    torch.set_num_threads(intra_op_threads)
+    if inter_op_threads:
+        try:
+            torch.set_num_interop_threads(inter_op_threads)
+        except RuntimeError:
+            # Можно задать только до первого параллельного вычисления
+            pass
+
+
+def optimize_for_cpu(model, channels_last=False, precision='fp32'):
+    """Применяет к классификатору формат channels_last и пониженную точность"""
+    model.eval()
+
+    if channels_last:
+        model = model.to(memory_format=torch.channels_last)
+        model.channels_last = True
+
+    if precision == 'bf16':
+        model = model.to(torch.bfloat16)
+    elif precision == 'int8':
+        # Динамическая квантизация полносвязной головы, свертки остаются fp32
+        model = torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8, inplace=True)
+
+    return model
+
 
 class VegetableClassifier(nn.Module):
     def __init__(self, num_classes=15, pretrained=True):
         super(VegetableClassifier, self).__init__()
+        self.num_classes = num_classes
 
         # Используем EfficientNet как базовую модель
         self.model = models.efficientnet_b0(pretrained=pretrained)
@@ -22,55 +100,96 @@ class VegetableClassifier(nn.Module):
             nn.Linear(512, num_classes)
         )
 
-        # Аугментации для обучения
-        self.train_transform = transforms.Compose([
-            transforms.RandomResizedCrop(224),
-            transforms.RandomHorizontalFlip(),
-            transforms.RandomRotation(20),
-            transforms.ColorJitter(brightness=0.2, contrast=0.2, saturation=0.2),
-            transforms.ToTensor(),
-            transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
-        ])
-
-        # Преобразования для инференса
-        self.val_transform = transforms.Compose([
-            transforms.Resize(256),
-            transforms.CenterCrop(224),
-            transforms.ToTensor(),
-            transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
-        ])
+        # Общие для всех экземпляров преобразования
+        self.train_transform = TRAIN_TRANSFORM
+        self.val_transform = VAL_TRANSFORM
+
+        # Формат входных тензоров (меняется в optimize_for_cpu)
+        self.channels_last = False
 
     def forward(self, x):
         return self.model(x)
 
     def predict(self, image_tensor):
         """Предсказание для одного изображения"""
-        self.eval()
-        with torch.no_grad():
-            output = self.forward(image_tensor.unsqueeze(0))
-            probabilities = torch.nn.functional.softmax(output, dim=1)
-            confidence, predicted = torch.max(probabilities, 1)
-        return predicted.item(), confidence.item()
+        classes, probabilities = self.predict_batch(image_tensor.unsqueeze(0), top_k=1)
+        return int(classes[0, 0]), float(probabilities[0, 0])
+
+    def predict_batch(self, images, top_k=1, batch_size=32):
+        """Предсказание для пачки изображений
+
+        images - тензор [N, 3, H, W] (или [3, H, W]) либо список PIL-изображений/массивов NumPy.
+        Входы обрабатываются порциями по batch_size, чтобы ограничить расход памяти.
+        Возвращает два массива NumPy формы [N, top_k]: индексы классов и их вероятности.
+        """
+        if self.training:
+            self.eval()
+
+        first_parameter = next(self.parameters())
+        device, dtype = first_parameter.device, first_parameter.dtype
+        memory_format = torch.channels_last if self.channels_last else torch.contiguous_format
+        top_k = max(1, min(top_k, self.num_classes))
+
+        if isinstance(images, torch.Tensor):
+            batch = images if images.dim() == 4 else images.unsqueeze(0)
+            chunks = batch.split(batch_size)
+        else:
+            images = list(images)
+            chunks = (preprocess_batch(images[i:i + batch_size]) for i in range(0, len(images), batch_size))
 
+        all_classes = []
+        all_probabilities = []
+        with torch.inference_mode():
+            for chunk in chunks:
+                chunk = chunk.to(device, dtype=dtype, non_blocking=True).contiguous(memory_format=memory_format)
+                output = self.forward(chunk).float()
+                probabilities = torch.nn.functional.softmax(output, dim=1)
+                top_probabilities, top_classes = probabilities.topk(top_k, dim=1)
+                all_classes.append(top_classes.cpu())
+                all_probabilities.append(top_probabilities.cpu())
 
-def load_model(model_path="models/best_model.pth", num_classes=15):
+        if not all_classes:
+            return np.empty((0, top_k), dtype=np.int64), np.empty((0, top_k), dtype=np.float32)
+
+        return torch.cat(all_classes).numpy(), torch.cat(all_probabilities).numpy()
+
+
+def load_model(model_path="models/best_model.pth", num_classes=15, cpu_profile=None):
     """Загрузка обученной модели"""
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
-    model = VegetableClassifier(num_classes=num_classes)
+    # Веса целиком берутся из файла - предобученные ImageNet скачивать незачем
+    model = VegetableClassifier(num_classes=num_classes, pretrained=False)
     model.load_state_dict(torch.load(model_path, map_location=device))
     model.to(device)
     model.eval()
 
+    if device.type == 'cpu':
+        profile = cpu_profile or cpu_profile_from_env()
+        configure_cpu_threads(profile['intra_op_threads'], profile['inter_op_threads'])
+        model = optimize_for_cpu(model, profile['channels_last'], profile['precision'])
+
     return model, device
 
 
+def _to_pil(image):
+    """Приводит PIL-изображение или массив NumPy (HxWxC, RGB) к RGB PIL.Image"""
+    if isinstance(image, np.ndarray):
+        if image.dtype != np.uint8:
+            image = np.clip(image * 255 if image.max() <= 1.0 else image, 0, 255).astype(np.uint8)
+        image = Image.fromarray(image)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return image
+
+
 def preprocess_image(image, transform_type='val'):
     """Предобработка изображения для модели"""
-    model = VegetableClassifier()
-    if transform_type == 'val':
-        transform = model.val_transform
-    else:
-        transform = model.train_transform
+    transform = TRANSFORMS['val' if transform_type == 'val' else 'train']
+    return transform(_to_pil(image)).unsqueeze(0)  # Добавляем batch dimension
+
 
-    return transform(image).unsqueeze(0)  # Добавляем batch dimension
\ No newline at end of file
+def preprocess_batch(images, transform_type='val'):
+    """Предобработка списка изображений (PIL или NumPy) в один тензор [N, 3, 224, 224]"""
+    transform = TRANSFORMS['val' if transform_type == 'val' else 'train']
+    return torch.stack([transform(_to_pil(image)) for image in images])
\ No newline at end of file
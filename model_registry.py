@@ -0,0 +1,157 @@
+# model_registry.py
+import os
+import json
+import random
+import threading
+
+DETECTOR_FILENAME = 'vegetable_detector.pt'
+DEFAULT_VERSION = 'default'
+ACTIVE_FILENAME = 'active.json'
+
+
+class ModelRegistry:
+    """Реестр версий модели детекции в папке model/
+
+    Версия - подпапка model/<version>/ с файлом vegetable_detector.pt,
+    файлы в корне model/ считаются версией 'default'. Активная версия и
+    кандидат для A/B хранятся в model/active.json, поэтому переключение
+    видят все воркеры. Загруженные модели кешируются; переключение лишь
+    подменяет ссылку, и запросы, уже получившие старую модель, спокойно
+    дорабатывают с ней. В кеше остаются только активная версия и кандидат.
+    """
+
+    def __init__(self, folder, loader, default_version=None):
+        self.folder = folder
+        self.loader = loader
+        self.default_version = default_version or os.environ.get('MODEL_VERSION', DEFAULT_VERSION)
+        self.active_file = os.path.join(folder, ACTIVE_FILENAME)
+
+        self._lock = threading.RLock()
+        self._loaded = {}
+        self._active = None
+        self._candidate = None
+        self._candidate_percent = 0.0
+        self._state_mtime = None
+
+    # ---------- версии ----------
+
+    def version_folder(self, version):
+        return self.folder if version == DEFAULT_VERSION else os.path.join(self.folder, version)
+
+    def list_versions(self):
+        versions = []
+        if os.path.exists(os.path.join(self.folder, DETECTOR_FILENAME)):
+            versions.append(DEFAULT_VERSION)
+        if os.path.isdir(self.folder):
+            for name in sorted(os.listdir(self.folder)):
+                if os.path.exists(os.path.join(self.folder, name, DETECTOR_FILENAME)):
+                    versions.append(name)
+        return versions
+
+    def get(self, version):
+        """Возвращает загруженную версию (загружает при первом обращении) или None"""
+        entry = self._loaded.get(version)
+        if entry is not None:
+            return entry
+
+        with self._lock:
+            entry = self._loaded.get(version)
+            if entry is None:
+                # Загружаем только известные версии: имя приходит из запроса и из
+                # active.json, а файл модели - pickle, который исполняется при загрузке
+                if version not in self.list_versions():
+                    return None
+                folder = self.version_folder(version)
+                entry = self.loader(folder)
+                if entry is None:
+                    return None
+                entry['version'] = version
+                self._loaded[version] = entry
+            return entry
+
+    # ---------- состояние ----------
+
+    def _read_state(self):
+        try:
+            mtime = os.stat(self.active_file).st_mtime_ns
+        except OSError:
+            mtime = None
+
+        if mtime == self._state_mtime and self._active is not None:
+            return
+
+        state = {}
+        if mtime is not None:
+            try:
+                with open(self.active_file, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+            except (OSError, ValueError):
+                state = {}
+
+        try:
+            candidate_percent = float(state.get('candidate_percent', 0) or 0)
+        except (TypeError, ValueError):
+            candidate_percent = 0.0
+
+        with self._lock:
+            self._active = state.get('active') or self._active or self.default_version
+            self._candidate = state.get('candidate')
+            self._candidate_percent = candidate_percent
+            self._state_mtime = mtime
+            self._evict_unused()
+
+    def _evict_unused(self):
+        """Забывает версии, которые не активны и не кандидат, чтобы их память освободилась"""
+        keep = {self._active, self._candidate}
+        for version in [version for version in self._loaded if version not in keep]:
+            del self._loaded[version]
+
+    def _write_state(self):
+        tmp_file = self.active_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({
+                'active': self._active,
+                'candidate': self._candidate,
+                'candidate_percent': self._candidate_percent
+            }, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, self.active_file)
+        self._state_mtime = os.stat(self.active_file).st_mtime_ns
+
+    def activate(self, version, candidate=None, candidate_percent=0):
+        """Делает версию активной; модель загружается до переключения"""
+        if self.get(version) is None:
+            raise ValueError(f'Версия модели {version} не найдена')
+        if candidate and self.get(candidate) is None:
+            raise ValueError(f'Версия модели {candidate} не найдена')
+
+        with self._lock:
+            self._active = version
+            self._candidate = candidate
+            self._candidate_percent = max(0.0, min(100.0, float(candidate_percent or 0))) if candidate else 0.0
+            self._write_state()
+            self._evict_unused()
+
+    def status(self):
+        self._read_state()
+        return {
+            'active': self._active,
+            'candidate': self._candidate,
+            'candidate_percent': self._candidate_percent,
+            'available': self.list_versions(),
+            'loaded': sorted(self._loaded)
+        }
+
+    # ---------- выбор модели для запроса ----------
+
+    def active(self):
+        self._read_state()
+        return self.get(self._active)
+
+    def select(self):
+        """Модель для очередного запроса с учетом доли трафика кандидата"""
+        self._read_state()
+        if self._candidate and self._candidate_percent > 0 and random.random() * 100 < self._candidate_percent:
+            entry = self.get(self._candidate)
+            if entry is not None:
+                return entry
+        return self.get(self._active)
@@ -0,0 +1,307 @@
+# models.py
+import json
+from datetime import datetime
+from flask_sqlalchemy import SQLAlchemy
+from flask_login import UserMixin
+from sqlalchemy import insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import selectinload
+from werkzeug.security import generate_password_hash, check_password_hash
+from image_pipeline import build_srcset, build_remote_srcset, recipe_image_url
+
+# Модели не зависят от приложения: db привязывается к нему через db.init_app(app)
+db = SQLAlchemy()
+
+
+def insert_ignore(model):
+    """INSERT, пропускающий строки, которые нарушают уникальное ограничение
+
+    Повторное добавление не дает ошибки и не требует предварительного SELECT,
+    поэтому такие вставки идемпотентны и не ломаются при параллельных запросах.
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert(model).on_conflict_do_nothing()
+    if dialect == 'sqlite':
+        return sqlite.insert(model).on_conflict_do_nothing()
+    # MySQL / MariaDB
+    return insert(model).prefix_with('IGNORE')
+
+
+# ========== МОДЕЛИ БАЗЫ ДАННЫХ ==========
+class User(UserMixin, db.Model):
+    """Модель пользователя"""
+    __tablename__ = 'users'
+
+    id = db.Column(db.Integer, primary_key=True)
+    email = db.Column(db.String(120), unique=True, nullable=True)
+    username = db.Column(db.String(80), unique=True, nullable=False)
+    password_hash = db.Column(db.String(200), nullable=True)
+    avatar = db.Column(db.String(500), nullable=True)
+
+    google_id = db.Column(db.String(100), unique=True, nullable=True)
+    telegram_id = db.Column(db.String(100), unique=True, nullable=True)
+
+    is_active = db.Column(db.Boolean, default=True)
+    is_admin = db.Column(db.Boolean, default=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_login = db.Column(db.DateTime, nullable=True)
+
+    # Отношения
+    recipes = db.relationship('Recipe', backref='author', lazy=True, foreign_keys='Recipe.user_id')
+    favorites = db.relationship('Favorite', backref='user', cascade='all, delete-orphan', lazy=True)
+    user_ingredients = db.relationship('UserIngredient', backref='user', cascade='all, delete-orphan', lazy=True)
+    telegram_chats = db.relationship('TelegramChat', backref='user', lazy=True)
+
+    # Изменяем имя backref для likes, чтобы избежать конфликта
+    given_likes = db.relationship('Like', backref='liking_user', cascade='all, delete-orphan', lazy=True,
+                                  foreign_keys='Like.user_id')
+
+    def set_password(self, password):
+        self.password_hash = generate_password_hash(password)
+
+    def check_password(self, password):
+        if self.password_hash:
+            return check_password_hash(self.password_hash, password)
+        return False
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'email': self.email,
+            'username': self.username,
+            'avatar': self.avatar,
+            'is_admin': self.is_admin,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'last_login': self.last_login.isoformat() if self.last_login else None,
+            'google_id': self.google_id,
+            'telegram_id': self.telegram_id
+        }
+
+
+class Recipe(db.Model):
+    """Модель рецепта"""
+    __tablename__ = 'recipes'
+
+    id = db.Column(db.Integer, primary_key=True)
+    title = db.Column(db.String(200), nullable=False)
+    image = db.Column(db.String(500), nullable=True)
+    time = db.Column(db.String(50), nullable=False)
+    difficulty = db.Column(db.String(20), nullable=False)
+    calories = db.Column(db.String(50), nullable=False)
+    servings = db.Column(db.String(50), nullable=False)
+    is_user_recipe = db.Column(db.Boolean, default=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Новые поля
+    author_name = db.Column(db.String(80), default='Cookly')
+    likes_count = db.Column(db.Integer, default=0)
+
+    ingredients = db.relationship('Ingredient', backref='recipe', cascade='all, delete-orphan', lazy=True)
+    instructions = db.relationship('Instruction', backref='recipe', cascade='all, delete-orphan', lazy=True)
+
+    # Изменяем имя backref для likes
+    received_likes = db.relationship('Like', backref='liked_recipe', cascade='all, delete-orphan', lazy=True,
+                                     foreign_keys='Like.recipe_id')
+
+    def primary_image(self):
+        for image in self.images:
+            if image.is_primary:
+                return image
+        return None
+
+    @classmethod
+    def with_relations(cls, query=None):
+        """Подгружает связи, нужные to_dict(), пачками вместо запроса на каждый рецепт"""
+        query = query if query is not None else cls.query
+        return query.options(
+            selectinload(cls.ingredients),
+            selectinload(cls.instructions),
+            selectinload(cls.images),
+            selectinload(cls.author)
+        )
+
+    def to_dict(self):
+        # Старые записи импорта хранят только имя файла - приводим к URL
+        image = recipe_image_url(self.image) or 'https://images.unsplash.com/photo-1546069901-ba9599a7e63c'
+        primary_image = self.primary_image()
+        if primary_image and primary_image.get_variants():
+            srcset = primary_image.srcset()
+        else:
+            srcset = build_remote_srcset(image)
+
+        return {
+            'id': self.id,
+            'title': self.title,
+            'image': image,
+            'srcset': srcset,
+            'time': self.time,
+            'difficulty': self.difficulty,
+            'calories': self.calories,
+            'servings': self.servings,
+            'isUserRecipe': self.is_user_recipe,
+            'author': self.author.username if self.author else self.author_name,
+            'author_id': self.user_id,
+            'author_name': self.author_name,
+            'likes_count': self.likes_count,
+            'ingredients': [ing.to_dict() for ing in self.ingredients],
+            'instructions': [inst.to_dict() for inst in self.instructions]
+        }
+
+
+class Like(db.Model):
+    """Модель лайка рецепта"""
+    __tablename__ = 'likes'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    recipe_id = db.Column(db.Integer, db.ForeignKey('recipes.id', ondelete='CASCADE'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.UniqueConstraint('user_id', 'recipe_id', name='unique_user_recipe_like'),)
+
+    # Явно указываем foreign_keys для избежания конфликтов
+    user = db.relationship('User', foreign_keys=[user_id])
+    recipe = db.relationship('Recipe', foreign_keys=[recipe_id])
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'recipe_id': self.recipe_id,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+
+class Ingredient(db.Model):
+    """Модель ингредиента"""
+    __tablename__ = 'ingredients'
+
+    id = db.Column(db.Integer, primary_key=True)
+    recipe_id = db.Column(db.Integer, db.ForeignKey('recipes.id', ondelete='CASCADE'), nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+    amount = db.Column(db.String(50), nullable=False)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'amount': self.amount
+        }
+
+
+class Instruction(db.Model):
+    """Модель шага приготовления"""
+    __tablename__ = 'instructions'
+
+    id = db.Column(db.Integer, primary_key=True)
+    recipe_id = db.Column(db.Integer, db.ForeignKey('recipes.id', ondelete='CASCADE'), nullable=False)
+    step_number = db.Column(db.Integer, nullable=False)
+    description = db.Column(db.Text, nullable=False)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'step_number': self.step_number,
+            'description': self.description
+        }
+
+
+class Favorite(db.Model):
+    """Модель избранного рецепта"""
+    __tablename__ = 'favorites'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    recipe_id = db.Column(db.Integer, db.ForeignKey('recipes.id', ondelete='CASCADE'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.UniqueConstraint('user_id', 'recipe_id', name='unique_user_recipe_favorite'),)
+
+
+class UserIngredient(db.Model):
+    """Модель пользовательского ингредиента"""
+    __tablename__ = 'user_ingredients'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.UniqueConstraint('user_id', 'name', name='unique_user_ingredient'),)
+
+
+class TelegramChat(db.Model):
+    """Модель чата Telegram для авторизации"""
+    __tablename__ = 'telegram_chats'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=True)
+    chat_id = db.Column(db.String(100), nullable=False, index=True)
+    telegram_username = db.Column(db.String(100), nullable=True)
+    # Устарели: коды входа хранятся в telegram_auth_codes
+    auth_code = db.Column(db.String(50), nullable=True)
+    auth_code_expires = db.Column(db.DateTime, nullable=True)
+    is_active = db.Column(db.Boolean, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.UniqueConstraint('user_id', 'chat_id', name='unique_user_chat'),)
+
+
+class TelegramAuthCode(db.Model):
+    """Одноразовый код входа через Telegram
+
+    Не больше одного действующего кода на чат: проверка - поиск по первичному
+    ключу. attempts - неверные попытки чата с created_at (начало окна блокировки),
+    новый код их не обнуляет. Запись удаляется после входа и задачей очистки
+    истекших кодов (индекс по expires_at).
+    """
+    __tablename__ = 'telegram_auth_codes'
+
+    chat_id = db.Column(db.String(100), primary_key=True)
+    code = db.Column(db.String(50), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class RecipeImage(db.Model):
+    """Модель для хранения изображений рецептов"""
+    __tablename__ = 'recipe_images'
+
+    id = db.Column(db.Integer, primary_key=True)
+    recipe_id = db.Column(db.Integer, db.ForeignKey('recipes.id', ondelete='CASCADE'), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    filepath = db.Column(db.String(500), nullable=False)
+    is_primary = db.Column(db.Boolean, default=True)
+    # JSON с производными изображениями (thumb/card/detail в WebP и JPEG)
+    variants = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    recipe = db.relationship('Recipe', backref='images')
+
+    def get_variants(self):
+        try:
+            return json.loads(self.variants) if self.variants else {}
+        except ValueError:
+            return {}
+
+    def set_variants(self, variants):
+        self.variants = json.dumps(variants) if variants else None
+
+    def srcset(self, ext='webp'):
+        return build_srcset(self.get_variants(), ext)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'recipe_id': self.recipe_id,
+            'filename': self.filename,
+            'url': recipe_image_url(self.filename),
+            'is_primary': self.is_primary,
+            'variants': self.get_variants(),
+            'srcset': self.srcset('webp'),
+            'srcset_jpeg': self.srcset('jpg')
+        }
@@ -0,0 +1,152 @@
+# profiling.py
+import os
+import sys
+import glob
+import time
+import pstats
+import random
+import cProfile
+import threading
+from datetime import datetime
+
+PROFILE_EXTENSION = '.prof'
+
+# cProfile в одном процессе может работать только для одного запроса сразу
+# (в Python 3.12+ второй профилировщик просто не включится), поэтому
+# параллельные запросы в это время выполняются без профилирования
+_profile_lock = threading.Lock()
+
+
+class RequestProfile:
+    """cProfile одного запроса; сохраняется, если запрос попал в выборку или был медленным"""
+
+    def __init__(self, endpoint, sampled):
+        self.endpoint = endpoint
+        self.sampled = sampled
+        self.profiler = cProfile.Profile()
+        self.start = time.perf_counter()
+        self.finished = False
+
+    def enable(self):
+        self.profiler.enable()
+
+    def disable(self):
+        self.profiler.disable()
+
+    def finish(self, output_dir, slow_ms=None):
+        """Останавливает профилирование и пишет дамп; возвращает путь или None"""
+        if self.finished:
+            return None
+        self.finished = True
+
+        try:
+            self.profiler.disable()
+            elapsed_ms = (time.perf_counter() - self.start) * 1000
+            if not self.sampled and (slow_ms is None or elapsed_ms < slow_ms):
+                return None
+
+            os.makedirs(output_dir, exist_ok=True)
+            stamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+            path = os.path.join(output_dir, f'{self.endpoint}-{stamp}-{os.getpid()}-{int(elapsed_ms)}ms'
+                                            f'{PROFILE_EXTENSION}')
+            self.profiler.dump_stats(path)
+            return path
+        finally:
+            _profile_lock.release()
+
+
+def start_request_profile(endpoint, sample_rate=0.0, slow_ms=None):
+    """Начинает профилирование запроса или возвращает None
+
+    Запрос профилируется, если попал в долю sample_rate; при заданном
+    slow_ms профилируются все запросы, а дамп остается только у медленных.
+    """
+    sampled = sample_rate > 0 and random.random() < sample_rate
+    if not sampled and slow_ms is None:
+        return None
+    if not _profile_lock.acquire(blocking=False):
+        return None
+
+    profile = RequestProfile(endpoint, sampled)
+    try:
+        profile.enable()
+    except ValueError:
+        # Уже активен другой профилировщик (например, отладчик)
+        _profile_lock.release()
+        return None
+    return profile
+
+
+class ProfiledStream:
+    """Обертка потокового ответа: профилирует генерацию каждой части
+
+    Профиль завершается в close(), который сервер вызывает всегда, даже
+    если тело так и не было прочитано (HEAD, обрыв соединения).
+    """
+
+    def __init__(self, chunks, profile, on_finish):
+        self.chunks = chunks
+        self.profile = profile
+        self.on_finish = on_finish
+        self._iterator = iter(chunks)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        self.profile.enable()
+        try:
+            return next(self._iterator)
+        finally:
+            self.profile.disable()
+
+    def close(self):
+        try:
+            if hasattr(self.chunks, 'close'):
+                self.chunks.close()
+        finally:
+            self.on_finish()
+
+
+# ---------- агрегирование дампов ----------
+
+def find_dumps(output_dir, endpoint=None):
+    pattern = f'{endpoint}-*{PROFILE_EXTENSION}' if endpoint else f'*{PROFILE_EXTENSION}'
+    return sorted(glob.glob(os.path.join(output_dir, pattern)))
+
+
+def aggregate_dumps(paths, sort='cumulative', top=25, stream=None):
+    """Объединяет дампы и печатает самые горячие функции"""
+    if not paths:
+        return None
+
+    stats = pstats.Stats(paths[0], stream=stream or sys.stdout)
+    for path in paths[1:]:
+        stats.add(path)
+    stats.strip_dirs().sort_stats(sort).print_stats(top)
+    return stats
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    options = {'--dir': os.environ.get('PROFILE_DIR', os.path.join(
+        os.path.abspath(os.path.dirname(__file__)), 'data', 'profiles')), '--sort': 'cumulative', '--top': '25'}
+    endpoint = None
+
+    while args:
+        arg = args.pop(0)
+        if arg in options and args:
+            options[arg] = args.pop(0)
+        elif not arg.startswith('--'):
+            endpoint = arg
+        else:
+            print("Использование: python profiling.py [эндпоинт] [--dir папка] [--sort cumulative|tottime] [--top N]")
+            sys.exit(1)
+
+    dumps = find_dumps(options['--dir'], endpoint)
+    if not dumps:
+        print(f"ℹ️  Дампов профилирования нет в {options['--dir']}")
+        sys.exit(0)
+
+    print(f"📊 Объединено дампов: {len(dumps)}" + (f" (эндпоинт {endpoint})" if endpoint else ""))
+    aggregate_dumps(dumps, sort=options['--sort'], top=int(options['--top']))
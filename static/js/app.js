@@ -3,6 +3,8 @@ let recipesCache = null;
 let userRecipesCache = null;
 let favoritesCache = null;
 let ingredientsCache = null;
+let favoriteRecipesCache = null;
+let likedRecipeIds = null;
 let lastFetchTime = 0;
 const CACHE_DURATION = 30000;
 let isModalOpening = false;
@@ -10,6 +12,8 @@ let lastCardClickTime = 0;
 let authCheckInProgress = false;
 let lastAuthCheck = 0;
 const AUTH_CHECK_INTERVAL = 2000;
+const FAVORITES_QUEUE_KEY = 'cookly_favorites_queue';
+const FAVORITES_SYNC_MAX_CHANGES = 500;
 
 // ========== ГЛОБАЛЬНЫЙ ПЕРЕХВАТ КЛИКОВ ==========
 document.addEventListener('click', function(e) {
@@ -248,6 +252,8 @@ async function logout() {
             userRecipesCache = null;
             favoritesCache = null;
             ingredientsCache = null;
+            favoriteRecipesCache = null;
+            likedRecipeIds = null;
             lastFetchTime = 0;
             lastAuthCheck = 0;
 
@@ -334,6 +340,49 @@ async function apiRequest(endpoint, method = 'GET', data = null, isFormData = fa
     }
 }
 
+// ========== НАЧАЛЬНАЯ ЗАГРУЗКА ==========
+
+async function loadBootstrap() {
+    try {
+        console.log('📦 Начальная загрузка данных...');
+        const data = await apiRequest('/bootstrap');
+        if (!data || !Array.isArray(data.recipes)) {
+            return null;
+        }
+
+        const now = Date.now();
+        const authData = { authenticated: data.authenticated, user: data.user };
+
+        // Заполняем кэши, чтобы отрисовка вкладок не делала повторных запросов
+        recipesCache = data.recipes;
+        // Неполный каталог не считаем свежим: loadAllRecipes() догрузит его целиком
+        lastFetchTime = data.has_more ? 0 : now;
+        favoritesCache = data.authenticated ? data.favorites : null;
+        favoriteRecipesCache = data.authenticated ? data.favorite_recipes : null;
+        userRecipesCache = data.authenticated ? data.user_recipes : null;
+        likedRecipeIds = data.authenticated ? new Set(data.liked) : null;
+        ingredientsCache = data.ingredients;
+
+        try {
+            if (data.authenticated) {
+                sessionStorage.setItem('cookly_auth_check', JSON.stringify({
+                    timestamp: now,
+                    data: authData
+                }));
+            } else {
+                sessionStorage.removeItem('cookly_auth_check');
+            }
+        } catch (e) {}
+        lastAuthCheck = now;
+
+        console.log(`✅ Загружено рецептов: ${data.recipes.length}${data.has_more ? ' (первая страница)' : ''}`);
+        return data;
+    } catch (error) {
+        console.error('❌ Ошибка начальной загрузки:', error);
+        return null;
+    }
+}
+
 // ========== ФУНКЦИИ ДЛЯ РЕЦЕПТОВ ==========
 
 async function loadAllRecipes(forceRefresh = false) {
@@ -423,34 +472,143 @@ async function loadFavorites(forceRefresh = false) {
     }
 }
 
+function setFavoriteState(recipeId, isFavorite) {
+    // Кэш избранного меняем на месте - перечитывать весь список с сервера не нужно
+    if (favoritesCache) {
+        favoritesCache = favoritesCache.filter(id => id !== recipeId);
+        if (isFavorite) favoritesCache.push(recipeId);
+    }
+
+    document.querySelectorAll(`.favorite-btn[data-recipe-id="${recipeId}"]`).forEach(btn => {
+        btn.classList.toggle('active', isFavorite);
+        btn.innerHTML = `<i class="${isFavorite ? 'fas' : 'far'} fa-bookmark"></i>`;
+    });
+
+    const modalBtn = document.getElementById(`modal-favorite-btn-${recipeId}`);
+    if (modalBtn) {
+        modalBtn.classList.toggle('active', isFavorite);
+        modalBtn.innerHTML = `<i class="${isFavorite ? 'fas' : 'far'} fa-bookmark"></i> ${isFavorite ? 'В избранном' : 'В избранное'}`;
+    }
+}
+
+function readFavoritesQueue() {
+    try {
+        const queue = JSON.parse(localStorage.getItem(FAVORITES_QUEUE_KEY) || '[]');
+        return Array.isArray(queue) ? queue : [];
+    } catch (e) {
+        return [];
+    }
+}
+
+function queueFavoriteChange(recipeId, favorite) {
+    try {
+        // Для рецепта важно только последнее изменение - очередь не растет от повторных нажатий
+        const queue = readFavoritesQueue().filter(change => change.recipeId !== recipeId);
+        queue.push({ recipeId, favorite });
+        localStorage.setItem(FAVORITES_QUEUE_KEY, JSON.stringify(queue));
+    } catch (e) {
+        console.warn('Failed to queue favorite change:', e);
+    }
+}
+
+function removeSentFavoriteChanges(sent) {
+    // Пока шел запрос, пользователь мог снова изменить рецепт - такие изменения оставляем
+    const sentKeys = new Set(sent.map(change => `${change.recipeId}:${change.favorite}`));
+    const rest = readFavoritesQueue().filter(change => !sentKeys.has(`${change.recipeId}:${change.favorite}`));
+    localStorage.setItem(FAVORITES_QUEUE_KEY, JSON.stringify(rest));
+}
+
+async function syncFavoritesQueue() {
+    const latest = new Map();
+    readFavoritesQueue().forEach(change => latest.set(change.recipeId, change.favorite));
+    const queue = Array.from(latest, ([recipeId, favorite]) => ({ recipeId, favorite }));
+    if (queue.length === 0 || !navigator.onLine) {
+        return null;
+    }
+
+    const result = { added: [], removed: [], unknown: [] };
+    for (let i = 0; i < queue.length; i += FAVORITES_SYNC_MAX_CHANGES) {
+        const batch = queue.slice(i, i + FAVORITES_SYNC_MAX_CHANGES);
+        let response;
+        let data = null;
+        try {
+            response = await fetch('/api/favorites/sync', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'Accept': 'application/json'
+                },
+                credentials: 'same-origin',
+                body: JSON.stringify({ changes: batch })
+            });
+            const contentType = response.headers.get('content-type');
+            if (!response.redirected && contentType && contentType.includes('application/json')) {
+                data = await response.json();
+            }
+        } catch (error) {
+            console.warn('⚠️ Нет связи, избранное синхронизируем позже:', error);
+            return null;
+        }
+
+        if (response.status === 400) {
+            // Сервер отклонил сами изменения - повторять их бессмысленно
+            console.error('❌ Сервер отклонил очередь избранного:', data && data.error);
+            removeSentFavoriteChanges(batch);
+            continue;
+        }
+        if (!response.ok || !data) {
+            // Сессия истекла (редирект на вход) или сервер недоступен - очередь ждет
+            // следующего входа или события online
+            console.warn(`⚠️ Синхронизация избранного отложена (HTTP ${response.status})`);
+            return null;
+        }
+
+        removeSentFavoriteChanges(batch);
+        data.added.forEach(id => setFavoriteState(id, true));
+        data.removed.forEach(id => setFavoriteState(id, false));
+        result.added.push(...data.added);
+        result.removed.push(...data.removed);
+        result.unknown.push(...data.unknown);
+    }
+
+    console.log(`🔄 Избранное синхронизировано: +${result.added.length}, -${result.removed.length}`);
+    return result;
+}
+
 async function toggleFavorite(recipeId) {
     try {
-        const authData = await checkAuth(true);
+        const offline = !navigator.onLine;
+        const authData = offline ? restoreAuthFromStorage() : await checkAuth(true);
         if (!authData || !authData.authenticated) {
             showNotification('Войдите, чтобы добавлять в избранное', 'info-circle');
             return null;
         }
 
-        const response = await apiRequest('/favorites', 'POST', { recipeId });
-        if (response && response.success) {
-            favoritesCache = null;
-            await renderFavorites();
+        const favorites = offline ? (favoritesCache || []) : await loadFavorites();
+        const isFavorite = !favorites.includes(recipeId);
+        setFavoriteState(recipeId, isFavorite);
 
-            document.querySelectorAll(`.favorite-btn[data-recipe-id="${recipeId}"]`).forEach(btn => {
-                const isFavorite = response.favorites.includes(recipeId);
-                btn.classList.toggle('active', isFavorite);
-                btn.innerHTML = `<i class="${isFavorite ? 'fas' : 'far'} fa-bookmark"></i>`;
-            });
+        if (offline) {
+            // Без сети копим изменения и отправляем их одним запросом при подключении
+            queueFavoriteChange(recipeId, isFavorite);
+            showNotification('Нет сети: изменение избранного сохранится при подключении', 'bookmark');
+            return { success: true, queued: true };
+        }
 
-            const modalBtn = document.getElementById(`modal-favorite-btn-${recipeId}`);
-            if (modalBtn) {
-                const isFavorite = response.favorites.includes(recipeId);
-                modalBtn.classList.toggle('active', isFavorite);
-                modalBtn.innerHTML = `<i class="${isFavorite ? 'fas' : 'far'} fa-bookmark"></i> ${isFavorite ? 'В избранном' : 'В избранное'}`;
+        let response;
+        try {
+            response = await apiRequest(`/favorites/${recipeId}`, isFavorite ? 'PUT' : 'DELETE');
+        } catch (error) {
+            if (error instanceof TypeError) {
+                queueFavoriteChange(recipeId, isFavorite);
+                return { success: true, queued: true };
             }
-
-            showNotification(isFavorite ? 'Добавлено в избранное' : 'Удалено из избранного', 'bookmark');
+            setFavoriteState(recipeId, !isFavorite);
+            throw error;
         }
+
+        await renderFavorites(authData);
+        showNotification(isFavorite ? 'Добавлено в избранное' : 'Удалено из избранного', 'bookmark');
         return response;
     } catch (error) {
         console.error('❌ Ошибка добавления в избранное:', error);
@@ -506,50 +664,23 @@ async function renderRecipes(recipesArray, containerId, showFavoriteBtn = true,
     const authData = await checkAuth();
     const favorites = authData && authData.authenticated ? await loadFavorites() : [];
 
-    // Загружаем информацию о лайках для каждого рецепта
+    // Состояние лайков: счетчик приходит вместе с рецептом, отметки пользователя -
+    // из /api/bootstrap (без отдельного запроса на каждую карточку)
     const likesData = {};
-
-    // Сначала пробуем загрузить из кэша
+    let cachedLikes = {};
     try {
-        const cachedLikes = JSON.parse(localStorage.getItem('cookly_likes') || '{}');
-        recipesArray.forEach(recipe => {
-            if (cachedLikes[recipe.id]) {
-                likesData[recipe.id] = cachedLikes[recipe.id];
-            } else {
-                likesData[recipe.id] = { likes_count: recipe.likes_count || 0, user_liked: false };
-            }
-        });
-    } catch (e) {
-        recipesArray.forEach(recipe => {
-            likesData[recipe.id] = { likes_count: recipe.likes_count || 0, user_liked: false };
-        });
-    }
+        cachedLikes = JSON.parse(localStorage.getItem('cookly_likes') || '{}');
+    } catch (e) {}
 
-    // Обновляем с сервера для авторизованных пользователей
-    if (authData && authData.authenticated) {
-        for (const recipe of recipesArray) {
-            try {
-                const response = await fetch(`/api/recipe/${recipe.id}/likes`, {
-                    credentials: 'same-origin',
-                    headers: {
-                        'Cache-Control': 'no-cache'
-                    }
-                });
-                if (response.ok) {
-                    const data = await response.json();
-                    likesData[recipe.id] = data;
-                    // Сохраняем в кэш
-                    try {
-                        const cachedLikes = JSON.parse(localStorage.getItem('cookly_likes') || '{}');
-                        cachedLikes[recipe.id] = data;
-                        localStorage.setItem('cookly_likes', JSON.stringify(cachedLikes));
-                    } catch (e) {}
-                }
-            } catch (error) {
-                console.error('Error loading likes:', error);
-            }
+    recipesArray.forEach(recipe => {
+        let userLiked = false;
+        if (authData && authData.authenticated) {
+            userLiked = likedRecipeIds
+                ? likedRecipeIds.has(recipe.id)
+                : Boolean(cachedLikes[recipe.id] && cachedLikes[recipe.id].user_liked);
         }
-    }
+        likesData[recipe.id] = { likes_count: recipe.likes_count || 0, user_liked: userLiked };
+    });
 
     recipesArray.forEach(recipe => {
         const recipeCard = document.createElement('div');
@@ -561,6 +692,7 @@ async function renderRecipes(recipesArray, containerId, showFavoriteBtn = true,
             id: recipe.id,
             title: recipe.title,
             image: recipe.image,
+            srcset: recipe.srcset || null,
             time: recipe.time,
             difficulty: recipe.difficulty,
             calories: recipe.calories,
@@ -593,7 +725,7 @@ async function renderRecipes(recipesArray, containerId, showFavoriteBtn = true,
         // Создаем карточку с лайками в самом низу, БЕЗ кнопок редактирования/удаления
         recipeCard.innerHTML = `
             <div class="recipe-img-container">
-                <img src="${recipe.image}" alt="${recipe.title}" class="recipe-img" onerror="this.onerror=null; this.src='https://images.unsplash.com/photo-1546069901-ba9599a7e63c?ixlib=rb-4.0.3&auto=format&fit=crop&w=800&q=80'">
+                <img src="${recipe.image}" ${recipe.srcset ? `srcset="${recipe.srcset}" sizes="(max-width: 600px) 100vw, 400px"` : ''} loading="lazy" alt="${recipe.title}" class="recipe-img" onerror="this.onerror=null; this.removeAttribute('srcset'); this.src='https://images.unsplash.com/photo-1546069901-ba9599a7e63c?ixlib=rb-4.0.3&auto=format&fit=crop&w=800&q=80'">
                 <div class="recipe-overlay"></div>
                 ${showFavoriteBtn ? `<button class="favorite-btn ${favoriteClass}" data-recipe-id="${recipe.id}">
                     <i class="${isFavorite ? 'fas' : 'far'} fa-bookmark"></i>
@@ -629,8 +761,8 @@ async function renderRecipes(recipesArray, containerId, showFavoriteBtn = true,
     attachLikeHandlers(containerId);
     return true;
 }
-async function renderAllRecipes() {
-    const allRecipes = await loadAllRecipes();
+async function renderAllRecipes(recipes = null) {
+    const allRecipes = recipes || await loadAllRecipes();
     const hasRecipes = await renderRecipes(allRecipes, 'recipes-list');
 
     if (!hasRecipes) {
@@ -647,8 +779,10 @@ async function renderAllRecipes() {
     }
 }
 
-async function renderFavorites() {
-    const authData = await checkAuth(true);
+async function renderFavorites(authData = null) {
+    // authData передается, когда кэш избранного актуален (после /api/bootstrap или своего изменения)
+    const fromBootstrap = authData !== null;
+    authData = authData || await checkAuth(true);
 
     const container = document.getElementById('favorites-list');
     const emptyMessage = document.getElementById('empty-favorites');
@@ -669,8 +803,14 @@ async function renderFavorites() {
         return;
     }
 
-    const favorites = await loadFavorites(true);
-    const allRecipes = await loadAllRecipes();
+    const favorites = await loadFavorites(!fromBootstrap);
+
+    // Рецепты избранного из начальной загрузки; полный каталог - только если чего-то не хватает
+    const knownRecipes = new Map();
+    (favoriteRecipesCache || []).concat(recipesCache || []).forEach(recipe => knownRecipes.set(recipe.id, recipe));
+    const allRecipes = favorites.every(id => knownRecipes.has(id))
+        ? Array.from(knownRecipes.values())
+        : await loadAllRecipes();
     const favoriteRecipes = allRecipes.filter(recipe => favorites.includes(recipe.id));
 
     if (favoriteRecipes.length > 0) {
@@ -689,8 +829,10 @@ async function renderFavorites() {
     }
 }
 
-async function renderMyRecipes() {
-    const authData = await checkAuth(true);
+async function renderMyRecipes(authData = null) {
+    // authData передается после /api/bootstrap - тогда рецепты пользователя уже в кэше
+    const fromBootstrap = authData !== null;
+    authData = authData || await checkAuth(true);
 
     const container = document.getElementById('my-recipes-list');
     const emptyMessage = document.getElementById('empty-my-recipes');
@@ -711,7 +853,7 @@ async function renderMyRecipes() {
         return;
     }
 
-    const userRecipes = await loadUserRecipes(true);
+    const userRecipes = await loadUserRecipes(!fromBootstrap);
 
     if (userRecipes.length > 0) {
         await renderRecipes(userRecipes, 'my-recipes-list', true, true);
@@ -836,6 +978,21 @@ function attachLikeHandlers(containerId = null) {
 }
 
 function updateLikesInLocalStorage(recipeId, likesCount, userLiked) {
+    // Синхронизируем кэши в памяти, чтобы перерисовка вкладок показала новое состояние
+    const id = Number(recipeId);
+    if (likedRecipeIds) {
+        if (userLiked) {
+            likedRecipeIds.add(id);
+        } else {
+            likedRecipeIds.delete(id);
+        }
+    }
+    [recipesCache, favoriteRecipesCache, userRecipesCache].forEach(cache => {
+        (cache || []).forEach(recipe => {
+            if (recipe.id === id) recipe.likes_count = likesCount;
+        });
+    });
+
     try {
         const likesData = JSON.parse(localStorage.getItem('cookly_likes') || '{}');
         likesData[recipeId] = { likes_count: likesCount, user_liked: userLiked };
@@ -1718,6 +1875,9 @@ async function loadStats() {
         const statIngredients = document.getElementById('stat-ingredients');
         if (statIngredients) statIngredients.textContent = stats.ingredients_count || 0;
 
+        const statLikes = document.getElementById('stat-likes');
+        if (statLikes) statLikes.textContent = stats.likes_received || 0;
+
     } catch (error) {
         console.error('❌ Ошибка загрузки статистики:', error);
     }
@@ -2354,9 +2514,21 @@ async function initApp() {
 
     const currentPath = window.location.pathname;
 
-    // Несколько попыток проверки авторизации
+    // Главная страница: пользователь, первая страница рецептов, избранное,
+    // ингредиенты и лайки одним запросом /api/bootstrap
     let authData = null;
-    for (let i = 0; i < 3; i++) {
+    let bootstrap = null;
+    if (document.getElementById('recipes-list')) {
+        // Сначала отправляем изменения избранного, накопленные без сети
+        await syncFavoritesQueue();
+        bootstrap = await loadBootstrap();
+        if (bootstrap) {
+            authData = { authenticated: bootstrap.authenticated, user: bootstrap.user };
+        }
+    }
+
+    // Несколько попыток проверки авторизации
+    for (let i = 0; i < 3 && !authData; i++) {
         authData = await checkAuth(true);
         if (authData) break;
         await new Promise(resolve => setTimeout(resolve, 500));
@@ -2403,9 +2575,20 @@ async function initApp() {
     if (document.getElementById('recipes-list')) {
         console.log('📚 Загрузка рецептов...');
 
-        await renderAllRecipes();
-        await renderFavorites();
-        await renderMyRecipes();
+        if (bootstrap) {
+            await renderAllRecipes(bootstrap.recipes);
+            await renderFavorites(authData);
+            await renderMyRecipes(authData);
+
+            // Остальной каталог догружаем в фоне, первая страница уже на экране
+            if (bootstrap.has_more) {
+                loadAllRecipes(true).then(recipes => renderAllRecipes(recipes));
+            }
+        } else {
+            await renderAllRecipes();
+            await renderFavorites();
+            await renderMyRecipes();
+        }
 
         attachRecipeCardHandlers();
 
@@ -2434,6 +2617,8 @@ async function initApp() {
     console.log('✅ Инициализация завершена');
 }
 
+window.addEventListener('online', syncFavoritesQueue);
+
 if (document.readyState === 'loading') {
     document.addEventListener('DOMContentLoaded', initApp);
 } else {
@@ -0,0 +1,110 @@
+# static_assets.py
+import os
+import gzip
+import hashlib
+import threading
+
+from compression import choose_encoding
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Какие файлы имеет смысл сжимать заранее
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.svg', '.json', '.html', '.txt'}
+MIN_COMPRESS_SIZE = 1024
+
+# Кодировка -> расширение сжатого варианта (в порядке предпочтения)
+PRECOMPRESSED_VARIANTS = [('br', '.br'), ('gzip', '.gz')]
+
+_fingerprints = {}
+_fingerprints_lock = threading.Lock()
+
+
+def file_fingerprint(path, length=12):
+    """Короткий хеш содержимого файла, пересчитывается только при изменении mtime"""
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+    cached = _fingerprints.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    digest = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    fingerprint = digest.hexdigest()[:length]
+
+    with _fingerprints_lock:
+        _fingerprints[path] = (mtime, fingerprint)
+    return fingerprint
+
+
+def find_precompressed(path, accept_encoding):
+    """Возвращает (кодировка, путь) к актуальному сжатому варианту файла или (None, None)"""
+    if not accept_encoding:
+        return None, None
+
+    try:
+        source_mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None, None
+
+    available = {}
+    for encoding, suffix in PRECOMPRESSED_VARIANTS:
+        candidate = path + suffix
+        try:
+            # Устаревший вариант (исходник менялся после сжатия) не отдаем
+            if os.stat(candidate).st_mtime_ns >= source_mtime:
+                available[encoding] = candidate
+        except OSError:
+            continue
+
+    # Те же правила (q-значения, *), что и для ответов, сжимаемых на лету
+    encoding = choose_encoding(accept_encoding, encodings=list(available))
+    return (encoding, available[encoding]) if encoding else (None, None)
+
+
+def precompress_static(static_folder, verbose=True):
+    """Создает .gz и .br версии текстовых статических файлов"""
+    created = 0
+    for root, dirs, files in os.walk(static_folder):
+        # Загружаемые пользователями картинки не трогаем
+        dirs[:] = [d for d in dirs if d != 'uploads']
+
+        for name in files:
+            path = os.path.join(root, name)
+            if os.path.splitext(name)[1].lower() not in COMPRESSIBLE_EXTENSIONS:
+                continue
+            if os.path.getsize(path) < MIN_COMPRESS_SIZE:
+                continue
+
+            with open(path, 'rb') as f:
+                data = f.read()
+
+            outputs = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+            if brotli is not None:
+                outputs.append(('.br', brotli.compress(data, quality=11)))
+
+            for suffix, compressed in outputs:
+                with open(path + suffix, 'wb') as f:
+                    f.write(compressed)
+                created += 1
+                if verbose:
+                    print(f"  ✓ {os.path.relpath(path + suffix, static_folder)}: "
+                          f"{len(data)} → {len(compressed)} bytes")
+
+    if brotli is None and verbose:
+        print("⚠️ Модуль brotli не установлен, созданы только .gz файлы")
+    return created
+
+
+if __name__ == '__main__':
+    folder = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'static')
+    print("🗜️ Предварительное сжатие статических файлов...")
+    count = precompress_static(folder)
+    print(f"✅ Создано файлов: {count}")
@@ -0,0 +1,302 @@
+# telegram_dispatcher.py
+import os
+import sys
+import json
+import time
+import heapq
+import random
+import atexit
+import logging
+import threading
+import itertools
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_API_URL = 'https://api.telegram.org'
+
+
+class OutgoingMessage:
+    """Сообщение в очереди: куда, что и с какой попытки"""
+
+    __slots__ = ('chat_id', 'payload', 'attempt', 'created')
+
+    def __init__(self, chat_id, payload):
+        self.chat_id = str(chat_id)
+        self.payload = payload
+        self.attempt = 0
+        self.created = time.monotonic()
+
+
+class TelegramDispatcher:
+    """Отправка сообщений Bot API из фонового потока
+
+    Обработчик запроса только кладет сообщение в очередь и сразу отвечает.
+    Поток-отправитель держит одно keep-alive соединение (requests.Session),
+    соблюдает лимиты Bot API - не чаще одного сообщения в chat_interval
+    секунд в один чат и не больше global_rate сообщений в секунду всего -
+    и повторяет отправку с экспоненциальной задержкой при 429, 5xx и сетевых
+    ошибках. Очередь у каждого процесса своя; после fork поток запускается заново.
+    """
+
+    def __init__(self, token, api_url=TELEGRAM_API_URL, chat_interval=1.0, global_rate=30, max_retries=4,
+                 backoff=0.5, max_backoff=30.0, timeout=(3, 10), max_queue=1000):
+        self.token = token
+        self.api_url = api_url.rstrip('/')
+        self.chat_interval = chat_interval
+        self.global_interval = 1.0 / global_rate if global_rate > 0 else 0.0
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.max_queue = max_queue
+        self._reset()
+        atexit.register(self.stop)
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        # Поток, очередь и соединения родителя в дочернем процессе непригодны
+        self._condition = threading.Condition()
+        self._heap = []
+        self._sequence = itertools.count()
+        self._chat_next_send = {}
+        self._global_next_send = 0.0
+        self._in_flight = 0
+        self._thread = None
+        self._stopping = False
+        self.session = self._make_session()
+
+    @staticmethod
+    def _make_session():
+        session = requests.Session()
+        # Повторы делает сам диспетчер (с учетом retry_after), адаптер их не повторяет
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2, max_retries=0)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    @property
+    def configured(self):
+        return bool(self.token)
+
+    def send_message(self, chat_id, text, parse_mode=None):
+        """Ставит сообщение в очередь; False - бот не настроен или очередь переполнена"""
+        if not self.configured:
+            return False
+
+        payload = {'chat_id': chat_id, 'text': text}
+        if parse_mode:
+            payload['parse_mode'] = parse_mode
+
+        with self._condition:
+            if len(self._heap) >= self.max_queue:
+                metrics.TELEGRAM_MESSAGES.inc(result='dropped')
+                logger.warning('Очередь Telegram переполнена, сообщение отброшено', extra={'chat_id': str(chat_id)})
+                return False
+            self._ensure_thread()
+            self._schedule(OutgoingMessage(chat_id, payload), time.monotonic())
+        return True
+
+    def pending(self):
+        """Сообщения в очереди и в процессе отправки"""
+        with self._condition:
+            return len(self._heap) + self._in_flight
+
+    def flush(self, timeout=10.0):
+        """Ждет, пока очередь опустеет; True - успели"""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while self._heap or self._in_flight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(min(remaining, 0.1))
+        return True
+
+    def stop(self, timeout=5.0):
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+            thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+        self.session.close()
+
+    # ---------- поток-отправитель ----------
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='telegram-dispatcher', daemon=True)
+            self._thread.start()
+
+    def _schedule(self, message, due):
+        heapq.heappush(self._heap, (due, next(self._sequence), message))
+        self._condition.notify()
+
+    def _next_message(self):
+        """Ждет сообщение, у которого подошло время и не нарушаются лимиты"""
+        with self._condition:
+            while not self._stopping:
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+
+                due, _, message = self._heap[0]
+                now = time.monotonic()
+                # Лимиты переносят отправку, не блокируя сообщения в другие чаты
+                allowed = max(due, self._chat_next_send.get(message.chat_id, 0.0))
+                if allowed > due:
+                    heapq.heapreplace(self._heap, (allowed, next(self._sequence), message))
+                    continue
+                if now < max(due, self._global_next_send):
+                    self._condition.wait(max(due, self._global_next_send) - now)
+                    continue
+
+                heapq.heappop(self._heap)
+                if len(self._chat_next_send) > 10000:
+                    self._chat_next_send = {chat: t for chat, t in self._chat_next_send.items() if t > now}
+                self._chat_next_send[message.chat_id] = now + self.chat_interval
+                self._global_next_send = now + self.global_interval
+                self._in_flight += 1
+                return message
+        return None
+
+    def _run(self):
+        while True:
+            message = self._next_message()
+            if message is None:
+                return
+            try:
+                self._deliver(message)
+            except Exception as e:
+                logger.exception('Ошибка в потоке отправки Telegram: %s', e)
+            finally:
+                with self._condition:
+                    self._in_flight -= 1
+                    self._condition.notify_all()
+
+    def _deliver(self, message):
+        message.attempt += 1
+        retry_after = None
+        try:
+            response = self.session.post(f'{self.api_url}/bot{self.token}/sendMessage', json=message.payload,
+                                         timeout=self.timeout)
+        except requests.RequestException as e:
+            error = str(e)
+        else:
+            if response.status_code == 200:
+                metrics.TELEGRAM_MESSAGES.inc(result='sent')
+                logger.info('Сообщение Telegram отправлено', extra={
+                    'chat_id': message.chat_id, 'attempt': message.attempt,
+                    'queued_ms': round((time.monotonic() - message.created) * 1000)})
+                return
+            error = f'HTTP {response.status_code}: {response.text[:200]}'
+            if response.status_code == 429:
+                try:
+                    retry_after = float(response.json().get('parameters', {}).get('retry_after'))
+                except (ValueError, TypeError, AttributeError):
+                    retry_after = None
+            elif response.status_code < 500:
+                # Неверный chat_id, бот заблокирован и т.п. - повтор не поможет
+                metrics.TELEGRAM_MESSAGES.inc(result='failed')
+                logger.error('Telegram отклонил сообщение: %s', error, extra={'chat_id': message.chat_id})
+                return
+
+        if message.attempt > self.max_retries:
+            metrics.TELEGRAM_MESSAGES.inc(result='failed')
+            logger.error('Не удалось отправить сообщение Telegram: %s', error,
+                         extra={'chat_id': message.chat_id, 'attempt': message.attempt})
+            return
+
+        delay = retry_after if retry_after is not None else min(
+            self.max_backoff, self.backoff * 2 ** (message.attempt - 1)) * random.uniform(0.8, 1.2)
+        metrics.TELEGRAM_MESSAGES.inc(result='retry')
+        logger.warning('Повтор отправки Telegram через %.1f с: %s', delay, error,
+                       extra={'chat_id': message.chat_id, 'attempt': message.attempt})
+        with self._condition:
+            self._schedule(message, time.monotonic() + delay)
+
+
+# ---------- локальная заглушка Bot API ----------
+
+class StubTelegramServer:
+    """Заглушка Bot API для проверок без сети
+
+    Принимает /bot<токен>/sendMessage и складывает запросы в messages.
+    fail(status, count) отвечает ошибкой на следующие count запросов
+    (для 429 - с retry_after), delay задерживает каждый ответ.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, delay=0.0):
+        from werkzeug.serving import make_server
+
+        self.delay = delay
+        self.messages = []
+        self._failures = []
+        self._lock = threading.Lock()
+        self._server = make_server(host, port, self._app, threaded=True)
+        self.url = f'http://{host}:{self._server.server_port}'
+        self._thread = None
+
+    def fail(self, status, count=1, retry_after=1):
+        with self._lock:
+            self._failures.extend([(status, retry_after)] * count)
+
+    def _app(self, environ, start_response):
+        from werkzeug.wrappers import Request, Response
+
+        request = Request(environ)
+        if self.delay:
+            time.sleep(self.delay)
+
+        if not request.path.endswith('/sendMessage'):
+            body, status = {'ok': False, 'error_code': 404, 'description': 'Not Found'}, 404
+        else:
+            with self._lock:
+                failure = self._failures.pop(0) if self._failures else None
+            if failure is not None:
+                status = failure[0]
+                body = {'ok': False, 'error_code': status, 'description': 'Stub failure'}
+                if status == 429:
+                    body['parameters'] = {'retry_after': failure[1]}
+            else:
+                payload = request.get_json(silent=True) or {}
+                with self._lock:
+                    self.messages.append({'time': time.monotonic(), **payload})
+                    message_id = len(self.messages)
+                body, status = {'ok': True, 'result': {'message_id': message_id}}, 200
+
+        response = Response(json.dumps(body, ensure_ascii=False), status=status, mimetype='application/json')
+        return response(environ, start_response)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='telegram-stub', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == '__main__':
+    # python telegram_dispatcher.py [порт] - заглушка для TELEGRAM_API_URL=http://127.0.0.1:<порт>
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8081
+    stub = StubTelegramServer(port=port)
+    print(f"🤖 Заглушка Telegram Bot API: {stub.url} (Ctrl+C - остановить)")
+    try:
+        stub._server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n📨 Принято сообщений: {len(stub.messages)}")
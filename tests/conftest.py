@@ -0,0 +1,13 @@
+# tests/conftest.py
+import os
+import sys
+import tempfile
+
+# Модули приложения лежат в корне репозитория; база - временный SQLite,
+# переменные окружения задаются до импорта app
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='cookly_tests_'), 'test.db')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+os.environ.pop('METRICS_MULTIPROC_DIR', None)
@@ -0,0 +1,138 @@
+# tests/test_import_images.py
+import io
+import json
+import threading
+import types
+
+import pytest
+from PIL import Image
+from werkzeug.serving import make_server
+from werkzeug.wrappers import Request, Response
+
+import migrate_auth
+from app import app
+from image_pipeline import RECIPE_IMAGES_URL
+from models import db, Recipe, RecipeImage
+
+
+def _jpeg_bytes():
+    buffer = io.BytesIO()
+    Image.effect_noise((320, 240), 64).convert('RGB').save(buffer, 'JPEG', quality=90)
+    return buffer.getvalue()
+
+
+class StubImageServer:
+    """Локальный сервер картинок: /ok/*.jpg - картинка, /flaky/*.jpg - 500 на первые
+    два запроса, /broken.jpg - всегда 500, /page.jpg - HTML вместо картинки"""
+
+    def __init__(self):
+        self.image = _jpeg_bytes()
+        self.hits = {}
+        self._lock = threading.Lock()
+        self._server = make_server('127.0.0.1', 0, self._app, threaded=True)
+        self.url = f'http://127.0.0.1:{self._server.server_port}'
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def _app(self, environ, start_response):
+        path = Request(environ).path
+        with self._lock:
+            self.hits[path] = hits = self.hits.get(path, 0) + 1
+
+        if path.startswith('/ok/') or (path.startswith('/flaky/') and hits > 2):
+            response = Response(self.image, mimetype='image/jpeg')
+        elif path == '/page.jpg':
+            response = Response('<html></html>', mimetype='text/html')
+        else:
+            response = Response('error', status=500)
+        return response(environ, start_response)
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@pytest.fixture
+def image_server():
+    server = StubImageServer()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def importer(tmp_path, monkeypatch):
+    """Импорт в tmp_path без реальных пауз между повторами; возвращает список пауз"""
+    sleeps = []
+    monkeypatch.setattr(migrate_auth, 'UPLOAD_FOLDER', str(tmp_path / 'uploads'))
+    monkeypatch.setattr(migrate_auth, 'time', types.SimpleNamespace(sleep=sleeps.append))
+    (tmp_path / 'uploads').mkdir()
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        for recipe_id in range(1, 5):
+            db.session.add(Recipe(id=recipe_id, title=f'Рецепт {recipe_id}', time='10 мин',
+                                  difficulty='Легко', calories='100 ккал', servings='1 порция'))
+        db.session.commit()
+    return sleeps
+
+
+def _write_catalog(tmp_path, server):
+    path = tmp_path / 'recipes.json'
+    path.write_text(json.dumps([
+        {'id': 1, 'image': f'{server.url}/ok/1.jpg'},
+        {'id': 2, 'image': f'{server.url}/flaky/2.jpg'},
+        {'id': 3, 'image': f'{server.url}/broken.jpg'},
+        {'id': 4, 'image': f'{server.url}/page.jpg'},
+    ]), encoding='utf-8')
+    return str(path)
+
+
+def _images():
+    with app.app_context():
+        return {image.recipe_id: image for image in RecipeImage.query.all()}
+
+
+def test_import_retries_with_backoff_and_saves_images(tmp_path, image_server, importer):
+    progress_file = str(tmp_path / 'progress.json')
+    migrate_auth.import_images_from_json(_write_catalog(tmp_path, image_server), max_workers=2,
+                                         batch_size=1, progress_file=progress_file)
+
+    # Нестабильный URL скачан с третьей попытки, сломанный - после трех попыток сдался
+    assert image_server.hits['/flaky/2.jpg'] == 3
+    assert image_server.hits['/broken.jpg'] == migrate_auth.MAX_RETRIES
+    # HTML вместо картинки не повторяется
+    assert image_server.hits['/page.jpg'] == 1
+    # Экспоненциальная задержка: 1 и 2 секунды для каждого из двух неудачных URL
+    assert sorted(importer) == [1.0, 1.0, 2.0, 2.0]
+
+    images = _images()
+    assert sorted(images) == [1, 2]
+    for recipe_id, image in images.items():
+        assert (tmp_path / 'uploads' / image.filename).exists()
+        assert set(image.get_variants()) == {'thumb', 'card', 'detail'}
+
+    with app.app_context():
+        assert db.session.get(Recipe, 1).image == RECIPE_IMAGES_URL + images[1].filename
+
+    with open(progress_file, encoding='utf-8') as f:
+        assert json.load(f) == {'done': [1, 2]}
+
+
+def test_import_resumes_from_progress_file(tmp_path, image_server, importer):
+    catalog = _write_catalog(tmp_path, image_server)
+    progress_file = str(tmp_path / 'progress.json')
+    migrate_auth.import_images_from_json(catalog, max_workers=2, progress_file=progress_file)
+
+    # Записи об изображениях удалены - пропустить готовые рецепты можно только по файлу прогресса
+    with app.app_context():
+        RecipeImage.query.delete()
+        db.session.commit()
+    hits_before = dict(image_server.hits)
+
+    migrate_auth.import_images_from_json(catalog, max_workers=2, progress_file=progress_file)
+
+    assert image_server.hits['/ok/1.jpg'] == hits_before['/ok/1.jpg']
+    assert image_server.hits['/flaky/2.jpg'] == hits_before['/flaky/2.jpg']
+    # Неудачные рецепты при повторном запуске пробуются снова
+    assert image_server.hits['/broken.jpg'] == hits_before['/broken.jpg'] + migrate_auth.MAX_RETRIES
+    assert _images() == {}
@@ -0,0 +1,106 @@
+# tests/test_telegram_dispatcher.py
+import time
+
+import pytest
+
+import metrics
+from telegram_dispatcher import StubTelegramServer, TelegramDispatcher
+
+
+@pytest.fixture
+def stub():
+    with StubTelegramServer() as server:
+        yield server
+
+
+@pytest.fixture
+def make_dispatcher(stub):
+    dispatchers = []
+
+    def make(**options):
+        options.setdefault('chat_interval', 0.0)
+        options.setdefault('backoff', 0.01)
+        dispatcher = TelegramDispatcher('TOKEN', api_url=stub.url, **options)
+        dispatchers.append(dispatcher)
+        return dispatcher
+
+    yield make
+    for dispatcher in dispatchers:
+        dispatcher.stop()
+
+
+def _texts(stub, chat_id=None):
+    return [m['text'] for m in stub.messages if chat_id is None or m['chat_id'] == chat_id]
+
+
+def test_not_configured_dispatcher_refuses_messages():
+    dispatcher = TelegramDispatcher(None)
+    assert dispatcher.send_message(1, 'код') is False
+    assert dispatcher.pending() == 0
+
+
+def test_retries_server_errors_until_delivered(stub, make_dispatcher):
+    dispatcher = make_dispatcher(max_retries=4)
+    retries_before = metrics.TELEGRAM_MESSAGES.value(result='retry')
+    stub.fail(500, count=2)
+
+    assert dispatcher.send_message(100, 'привет') is True
+    assert dispatcher.flush(5)
+
+    assert _texts(stub) == ['привет']
+    assert metrics.TELEGRAM_MESSAGES.value(result='retry') - retries_before == 2
+
+
+def test_gives_up_after_max_retries(stub, make_dispatcher):
+    dispatcher = make_dispatcher(max_retries=2)
+    failed_before = metrics.TELEGRAM_MESSAGES.value(result='failed')
+    stub.fail(503, count=5)
+
+    dispatcher.send_message(100, 'не дойдет')
+    assert dispatcher.flush(5)
+
+    assert stub.messages == []
+    # Первая попытка и два повтора, оставшиеся ошибки заглушки не израсходованы
+    assert len(stub._failures) == 2
+    assert metrics.TELEGRAM_MESSAGES.value(result='failed') - failed_before == 1
+
+
+def test_client_error_is_not_retried(stub, make_dispatcher):
+    dispatcher = make_dispatcher()
+    stub.fail(400, count=1)
+
+    dispatcher.send_message(100, 'неверный чат')
+    dispatcher.send_message(100, 'следующее')
+    assert dispatcher.flush(5)
+
+    assert _texts(stub) == ['следующее']
+
+
+def test_429_waits_for_retry_after(stub, make_dispatcher):
+    dispatcher = make_dispatcher(backoff=5.0)
+    stub.fail(429, count=1, retry_after=0.5)
+
+    started = time.monotonic()
+    dispatcher.send_message(100, 'после паузы')
+    assert dispatcher.flush(5)
+
+    assert _texts(stub) == ['после паузы']
+    # Пауза взята из retry_after, а не из backoff (иначе было бы ~5 с)
+    assert 0.45 <= stub.messages[0]['time'] - started < 3.0
+
+
+def test_per_chat_interval_does_not_block_other_chats(stub, make_dispatcher):
+    dispatcher = make_dispatcher(chat_interval=0.3)
+
+    for n in range(3):
+        dispatcher.send_message(1, f'первый {n}')
+    dispatcher.send_message(2, 'второй')
+    assert dispatcher.flush(5)
+
+    assert _texts(stub, 1) == ['первый 0', 'первый 1', 'первый 2']
+    first_chat = [m['time'] for m in stub.messages if m['chat_id'] == 1]
+    assert all(later - earlier >= 0.28 for earlier, later in zip(first_chat, first_chat[1:]))
+
+    # Сообщение в другой чат не ждет очереди первого
+    second_chat = next(m['time'] for m in stub.messages if m['chat_id'] == 2)
+    assert second_chat < first_chat[1]
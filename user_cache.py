@@ -0,0 +1,87 @@
+# user_cache.py
+import time
+import threading
+from flask_login import UserMixin
+
+from models import User
+import metrics
+
+SNAPSHOT_FIELDS = ('id', 'email', 'username', 'avatar', 'is_admin', 'created_at', 'last_login',
+                   'google_id', 'telegram_id')
+
+
+class UserSnapshot(UserMixin):
+    """Легкая копия полей пользователя для current_user
+
+    Не привязана к сессии SQLAlchemy, поэтому её можно держать в кеше и
+    отдавать разным потокам. Для изменения пользователя загружайте User из базы.
+    """
+
+    def __init__(self, user):
+        for field in SNAPSHOT_FIELDS:
+            setattr(self, field, getattr(user, field))
+        self._is_active = user.is_active is not False
+
+    @property
+    def is_active(self):
+        return self._is_active
+
+    # Тот же формат ответа, что и у модели
+    to_dict = User.to_dict
+
+    def __repr__(self):
+        return f'<UserSnapshot {self.id} {self.username}>'
+
+
+class UserCache:
+    """Кеш данных по id пользователя (снимки для current_user, статистика профиля) с коротким TTL
+
+    Каждый воркер держит свой кеш: явная инвалидация действует в текущем
+    процессе, остальные увидят изменения не позже чем через ttl секунд.
+    """
+
+    def __init__(self, ttl=30, max_size=10000, name='users'):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.name = name
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id, loader):
+        """Значение из кеша или loader(user_id); None не кешируется"""
+        if self.ttl <= 0:
+            return loader(user_id)
+
+        entry = self._entries.get(user_id)
+        if entry is not None and entry[0] > time.monotonic():
+            metrics.USER_CACHE.inc(cache=self.name, result='hit')
+            return entry[1]
+
+        metrics.USER_CACHE.inc(cache=self.name, result='miss')
+        snapshot = loader(user_id)
+        if snapshot is not None:
+            self._store(user_id, snapshot)
+        return snapshot
+
+    def _store(self, user_id, snapshot):
+        now = time.monotonic()
+        with self._lock:
+            if len(self._entries) >= self.max_size:
+                # Сначала выбрасываем просроченные, затем самые старые записи
+                for key in [key for key, (expires, _) in self._entries.items() if expires <= now]:
+                    del self._entries[key]
+                while len(self._entries) >= self.max_size:
+                    del self._entries[next(iter(self._entries))]
+            self._entries.pop(user_id, None)
+            self._entries[user_id] = (now + self.ttl, snapshot)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)